@@ -0,0 +1,287 @@
+"""
+ANN index (IVF trên NumPy) cho tìm món ăn có hình ảnh tương tự
+
+Embedding (lớp áp chót của classifier, chuẩn hoá L2) được chia vào các cluster
+k-means; khi tìm chỉ so khớp vector trong `nprobe` cluster gần query nhất.
+
+Lưu trên đĩa trong INDEX_DIR, các file vector / item là raw array chỉ append
+nên thêm ảnh mới không phải ghi lại cả index, và được load bằng np.memmap:
+    index.json     header (dim, count, model_version, ...) - ghi sau cùng, atomic
+    centroids.npy  (nlist, dim) float32
+    vectors.f32    (count, dim) float32
+    items.i32      (count, 2) int32: food_id, image_id (0 = ảnh chính Food.image_url)
+    lists.i32      (count,) int32: cluster của từng vector
+"""
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from config import settings
+
+
+HEADER_FILE = 'index.json'
+CENTROIDS_FILE = 'centroids.npy'
+VECTORS_FILE = 'vectors.f32'
+ITEMS_FILE = 'items.i32'
+LISTS_FILE = 'lists.i32'
+
+
+class IndexMismatchError(ValueError):
+    """Index được build bằng model khác (embedding không so sánh được)"""
+
+
+def kmeans(vectors: np.ndarray, k: int, iterations: int = 10, seed: int = 0) -> np.ndarray:
+    """Spherical k-means (vector đã chuẩn hoá, khoảng cách cosine), trả về centroids (k, dim)"""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), size=k, replace=False)].copy()
+    for _ in range(iterations):
+        assign = np.argmax(vectors @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, vectors)
+        counts = np.bincount(assign, minlength=k)
+        # Cluster rỗng giữ nguyên centroid cũ
+        sums[counts == 0] = centroids[counts == 0]
+        centroids = sums / np.maximum(np.linalg.norm(sums, axis=1, keepdims=True), 1e-12)
+    return centroids.astype(np.float32)
+
+
+def _append_rows(path: str, array: np.ndarray, offset_rows: int):
+    """Ghi array vào sau offset_rows dòng đầu (bỏ phần thừa của lần ghi bị gián đoạn)"""
+    row_bytes = array.itemsize * int(np.prod(array.shape[1:], dtype=np.int64))
+    with open(path, 'r+b' if os.path.exists(path) else 'wb') as f:
+        f.seek(offset_rows * row_bytes)
+        f.write(np.ascontiguousarray(array).tobytes())
+        f.truncate()
+
+
+def _memmap(path: str, dtype, shape: Tuple[int, ...]) -> np.ndarray:
+    if shape[0] == 0:
+        return np.zeros(shape, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r', shape=shape)
+
+
+class _Snapshot:
+    """Trạng thái đọc được của index; thay mới (không sửa tại chỗ) mỗi lần add"""
+
+    def __init__(self, vectors: np.ndarray, items: np.ndarray, lists: np.ndarray, nlist: int,
+                 keys: Optional[set] = None):
+        self.vectors = vectors
+        self.items = items
+        self.lists = lists
+        # Posting list của từng cluster: order[offsets[c]:offsets[c + 1]]
+        self.order = np.argsort(lists, kind='stable')
+        self.offsets = np.searchsorted(lists[self.order], np.arange(nlist + 1))
+        self.keys = keys if keys is not None else set(map(tuple, items.tolist()))
+
+
+class IVFIndex:
+    """
+    Index IVF: search() đọc snapshot hiện tại không cần lock, add() nối thêm
+    vector vào file rồi thay snapshot mới
+    """
+
+    def __init__(self, path: str, centroids: np.ndarray, model_version: str,
+                 trained_count: int, nprobe: int):
+        self.path = path
+        self.centroids = centroids
+        self.dim = centroids.shape[1]
+        self.model_version = model_version
+        self.trained_count = trained_count
+        self.nprobe = nprobe
+        self._lock = threading.Lock()
+        self._snapshot = _Snapshot(
+            np.zeros((0, self.dim), np.float32), np.zeros((0, 2), np.int32), np.zeros(0, np.int32), len(centroids)
+        )
+        self.searches = 0
+        self.search_time_ms = 0.0
+
+    @property
+    def count(self) -> int:
+        return len(self._snapshot.items)
+
+    @classmethod
+    def build(cls, path: str, vectors: np.ndarray, items: np.ndarray, model_version: str,
+              nlist: int = 0, nprobe: int = 8) -> "IVFIndex":
+        """
+        Build index mới từ toàn bộ embedding (ghi đè index cũ trong path)
+
+        nlist = 0: ~sqrt(số vector)
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        nlist = max(1, min(nlist or int(np.sqrt(len(vectors))), len(vectors)))
+        if len(vectors):
+            # Train centroids trên mẫu ~64 vector mỗi cluster là đủ
+            sample = np.random.default_rng(0).permutation(len(vectors))[:nlist * 64]
+            centroids = kmeans(vectors[sample], nlist)
+        else:
+            centroids = np.zeros((1, vectors.shape[1]), np.float32)
+
+        os.makedirs(path, exist_ok=True)
+        for name in (VECTORS_FILE, ITEMS_FILE, LISTS_FILE):
+            if os.path.exists(os.path.join(path, name)):
+                os.unlink(os.path.join(path, name))
+        np.save(os.path.join(path, CENTROIDS_FILE), centroids)
+        index = cls(path, centroids, model_version, trained_count=len(vectors), nprobe=nprobe)
+        index._write_header()
+        index.add(vectors, items, model_version)
+        return index
+
+    @classmethod
+    def create(cls, path: str, dim: int, model_version: str, nprobe: int = 8) -> "IVFIndex":
+        """Index rỗng một cluster (tìm tuyến tính) để add dần, build lại khi đủ lớn"""
+        return cls.build(path, np.zeros((0, dim), np.float32), np.zeros((0, 2), np.int32),
+                         model_version, nprobe=nprobe)
+
+    @classmethod
+    def load(cls, path: str, nprobe: int = 8) -> "IVFIndex":
+        """Load index, vector / item / cluster được memory-map (không đọc hết vào RAM)"""
+        with open(os.path.join(path, HEADER_FILE), 'r', encoding='utf-8') as f:
+            header = json.load(f)
+        centroids = np.load(os.path.join(path, CENTROIDS_FILE))
+        index = cls(path, centroids, header['model_version'], header['trained_count'], nprobe)
+        count = header['count']
+        index._snapshot = _Snapshot(
+            _memmap(os.path.join(path, VECTORS_FILE), np.float32, (count, index.dim)),
+            _memmap(os.path.join(path, ITEMS_FILE), np.int32, (count, 2)),
+            np.asarray(_memmap(os.path.join(path, LISTS_FILE), np.int32, (count,))),
+            len(centroids)
+        )
+        return index
+
+    def _check_version(self, model_version: str):
+        if model_version != self.model_version:
+            raise IndexMismatchError(
+                f"Index được build bằng model {self.model_version}, model hiện tại là "
+                f"{model_version}: cần build lại (tools/build_index.py)"
+            )
+
+    def _write_header(self, count: int = 0):
+        header = {
+            'dim': self.dim,
+            'count': count,
+            'nlist': len(self.centroids),
+            'trained_count': self.trained_count,
+            'model_version': self.model_version,
+            'updated_at': time.time()
+        }
+        tmp = os.path.join(self.path, HEADER_FILE + '.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(header, f)
+        os.replace(tmp, os.path.join(self.path, HEADER_FILE))
+
+    def add(self, vectors: np.ndarray, items: np.ndarray, model_version: str) -> int:
+        """
+        Thêm embedding (N, dim) với (food_id, image_id) tương ứng, ghi xuống đĩa ngay
+
+        Item đã có trong index được bỏ qua. Returns: số vector đã thêm
+        """
+        self._check_version(model_version)
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        items = np.asarray(items, dtype=np.int32).reshape(-1, 2)
+
+        with self._lock:
+            current = self._snapshot
+            keys = set(current.keys)
+            keep = []
+            for i, (food_id, image_id) in enumerate(items.tolist()):
+                if (food_id, image_id) not in keys:
+                    keys.add((food_id, image_id))
+                    keep.append(i)
+            vectors, items = vectors[keep], items[keep]
+            if not len(vectors):
+                return 0
+
+            lists = np.argmax(vectors @ self.centroids.T, axis=1).astype(np.int32)
+            count = len(current.items)
+            _append_rows(os.path.join(self.path, VECTORS_FILE), vectors, count)
+            _append_rows(os.path.join(self.path, ITEMS_FILE), items, count)
+            _append_rows(os.path.join(self.path, LISTS_FILE), lists, count)
+            count += len(vectors)
+            # Header ghi sau cùng: lần ghi bị gián đoạn không làm hỏng index
+            self._write_header(count)
+
+            self._snapshot = _Snapshot(
+                _memmap(os.path.join(self.path, VECTORS_FILE), np.float32, (count, self.dim)),
+                _memmap(os.path.join(self.path, ITEMS_FILE), np.int32, (count, 2)),
+                np.concatenate([current.lists, lists]), len(self.centroids), keys
+            )
+        return len(vectors)
+
+    def search(self, query: np.ndarray, k: int, model_version: str) -> List[Dict]:
+        """
+        k món ăn gần query nhất (mỗi món lấy ảnh giống nhất), score = cosine similarity
+        """
+        self._check_version(model_version)
+        started = time.perf_counter()
+        snapshot = self._snapshot
+        query = np.asarray(query, dtype=np.float32).reshape(self.dim)
+
+        nprobe = min(self.nprobe, len(self.centroids))
+        probe = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+        candidates = np.concatenate(
+            [snapshot.order[snapshot.offsets[c]:snapshot.offsets[c + 1]] for c in probe]
+        )
+        if not len(candidates):
+            return []
+        # Đọc vector theo thứ tự trên đĩa cho memmap
+        candidates.sort()
+        scores = snapshot.vectors[candidates] @ query
+
+        ranked = np.argsort(-scores, kind='stable')
+        foods = snapshot.items[candidates[ranked], 0]
+        _, first = np.unique(foods, return_index=True)
+        best = ranked[np.sort(first)][:k]
+
+        results = [
+            {
+                'food_id': int(snapshot.items[candidates[i], 0]),
+                'image_id': int(snapshot.items[candidates[i], 1]),
+                'score': round(float(scores[i]), 4)
+            }
+            for i in best
+        ]
+        self.searches += 1
+        self.search_time_ms += (time.perf_counter() - started) * 1000
+        return results
+
+    def stats(self) -> Dict:
+        snapshot = self._snapshot
+        sizes = np.diff(snapshot.offsets)
+        return {
+            'path': self.path,
+            'count': len(snapshot.items),
+            'dim': self.dim,
+            'nlist': len(self.centroids),
+            'nprobe': self.nprobe,
+            'trained_count': self.trained_count,
+            'max_list_size': int(sizes.max()) if len(sizes) else 0,
+            'model_version': self.model_version,
+            'searches': self.searches,
+            'avg_search_ms': round(self.search_time_ms / self.searches, 3) if self.searches else 0.0
+        }
+
+
+# Singleton instance
+_index: Optional[IVFIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_similar_index(create_dim: Optional[int] = None, model_version: Optional[str] = None) -> Optional[IVFIndex]:
+    """
+    Index trong INDEX_DIR (load lần đầu), None nếu chưa có
+
+    create_dim: tạo index rỗng nếu chưa có (thêm ảnh đầu tiên qua /index/items)
+    """
+    global _index
+    if _index is None and settings.INDEX_DIR:
+        with _index_lock:
+            if _index is None:
+                if os.path.exists(os.path.join(settings.INDEX_DIR, HEADER_FILE)):
+                    _index = IVFIndex.load(settings.INDEX_DIR, settings.INDEX_NPROBE)
+                elif create_dim is not None:
+                    _index = IVFIndex.create(settings.INDEX_DIR, create_dim, model_version, settings.INDEX_NPROBE)
+    return _index
@@ -0,0 +1,298 @@
+"""
+Dynamic micro-batching cho /predict
+Gom các request đến trong một cửa sổ ngắn thành một forward pass duy nhất
+
+Request được lấy vào batch theo priority lane (interactive trước), request quá
+deadline bị bỏ trước khi ghép batch. Decode của request interactive chạy trên
+thread pool dự phòng của executor (không chờ slot), nên request interactive chỉ
+chờ một slot: slot của batch.
+"""
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from config import settings
+from executor import QueueFullError, get_executor
+from metrics import LANE_QUEUE_TIME, Histogram
+from model import FoodClassifier, get_classifier, tta_margin
+from prediction_cache import get_prediction_cache
+from scheduling import DeadlineExceededError, RequestClass, current_request_class
+
+
+BATCH_SIZE_BUCKETS = [1, 2, 4, 8, 16, 32, 64]
+QUEUE_WAIT_MS_BUCKETS = [1, 2, 5, 10, 20, 50, 100, 250, 500, 1000]
+
+
+@dataclass
+class _PendingRequest:
+    """Một request đang chờ được gom vào batch"""
+    tensor: np.ndarray
+    future: asyncio.Future
+    # Classifier đã tiền xử lý tensor (khác classifier hiện tại nếu vừa hot reload)
+    classifier: Optional[FoodClassifier] = None
+    # Ngưỡng margin TTA của request (xem model.tta_margin)
+    tta_margin: float = -1.0
+    # Lane + deadline của request (scheduling.py)
+    request_class: RequestClass = field(default_factory=current_request_class)
+    enqueued_at: float = field(default_factory=time.perf_counter)
+
+
+class MicroBatcher:
+    """
+    Scheduler gom batch trước FoodClassifier
+
+    - Giữ request tối đa `max_wait_ms` hoặc đến khi đủ `max_batch_size`
+    - Stack các tensor (1, ...) thành (N, ...) và chạy một forward pass
+    - Tối đa `max_in_flight` batch chạy cùng lúc (= INFERENCE_CONCURRENCY): khi
+      mọi slot bận, request tiếp tục dồn vào hàng đợi và được gom thành batch lớn hơn
+    - Trả kết quả về đúng caller đang chờ
+    """
+
+    def __init__(self, max_batch_size: int, max_wait_ms: float, max_in_flight: int = 1):
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_in_flight = max(1, max_in_flight)
+
+        self._pending: List[_PendingRequest] = []
+        self._has_pending: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._batch_slots: Optional[asyncio.Semaphore] = None
+        # Batch đang chạy: giữ reference đến task (event loop chỉ giữ weak reference)
+        self._in_flight: Dict[asyncio.Task, List[_PendingRequest]] = {}
+
+        self.batch_size_hist = Histogram(
+            BATCH_SIZE_BUCKETS, name='ai_batch_size', help='Số ảnh trong mỗi forward pass của micro-batcher'
+        )
+        self.queue_wait_hist = Histogram(
+            QUEUE_WAIT_MS_BUCKETS, name='ai_batch_queue_wait_milliseconds',
+            help='Thời gian request chờ trong hàng đợi micro-batch (ms)'
+        )
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self):
+        """Khởi động vòng lặp gom batch"""
+        if self.running:
+            return
+        self._has_pending = asyncio.Event()
+        self._batch_slots = asyncio.Semaphore(self.max_in_flight)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Dừng vòng lặp, báo lỗi cho các request còn chờ"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        tasks = list(self._in_flight)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        for req in self._pending + [req for batch in self._in_flight.values() for req in batch]:
+            if not req.future.done():
+                req.future.set_exception(RuntimeError("Batcher stopped"))
+        self._pending.clear()
+        self._in_flight.clear()
+
+    async def predict(self, image_bytes: bytes, tta: Optional[str] = None,
+                      classifier: Optional[FoodClassifier] = None) -> Dict:
+        """
+        Decode + tiền xử lý ảnh rồi đưa vào hàng đợi batch (request interactive:
+        decode trên thread pool dự phòng, không chờ slot inference)
+
+        Args:
+            tta: Chế độ TTA của request (off / auto / always), None = TTA_MODE
+            classifier: Model trong registry, mặc định classifier hiện tại
+
+        Returns:
+            Dict kết quả giống FoodClassifier.predict
+        """
+        classifier = classifier or get_classifier()
+        cache = get_prediction_cache()
+        margin = tta_margin(tta)
+        executor = get_executor()
+        run = executor.run_reserved if current_request_class().lane == 'interactive' else executor.run
+        try:
+            image_hash, cached, tensor = await run(cache.prepare, classifier, image_bytes, margin)
+        except (QueueFullError, DeadlineExceededError):
+            raise
+        except Exception as e:
+            print(f"Prediction error: {e}")
+            return {'success': False, 'error': str(e), 'predictions': []}
+
+        # Frame gần giống frame đã nhận diện -> bỏ qua forward pass
+        if cached is not None:
+            return cached
+
+        result = await self.submit(tensor, classifier, tta)
+        if image_hash is not None:
+            cache.put(image_hash, classifier.version, result, margin)
+        return result
+
+    async def submit(self, tensor: np.ndarray, classifier: Optional[FoodClassifier] = None,
+                     tta: Optional[str] = None) -> Dict:
+        """
+        Đưa tensor đã tiền xử lý (1, ...) vào hàng đợi và chờ kết quả
+
+        Args:
+            classifier: Classifier đã tiền xử lý tensor, forward pass chạy trên
+                        chính classifier đó (mặc định: classifier hiện tại)
+        """
+        if not self.running:
+            raise RuntimeError("Batcher chưa được khởi động")
+
+        executor = get_executor()
+        if len(self._pending) >= executor.max_queue:
+            executor.rejected += 1
+            raise QueueFullError(executor.retry_after)
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append(_PendingRequest(
+            tensor=tensor, future=future, classifier=classifier or get_classifier(),
+            tta_margin=tta_margin(tta)
+        ))
+        self._has_pending.set()
+        return await future
+
+    async def _run(self):
+        """Vòng lặp chính: chờ request đầu tiên và một slot trống, gom thêm trong cửa sổ rồi chạy batch"""
+        while True:
+            await self._has_pending.wait()
+            await self._batch_slots.acquire()
+
+            # Request đầu tiên đã đến, chờ thêm tối đa max_wait để gom batch
+            deadline = self._pending[0].enqueued_at + self.max_wait
+            while len(self._pending) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._has_pending.clear()
+                try:
+                    await asyncio.wait_for(self._has_pending.wait(), timeout=remaining)
+                except asyncio.TimeoutError:
+                    break
+
+            # Interactive trước, trong cùng lane theo thứ tự đến (sort ổn định)
+            self._pending.sort(key=lambda req: req.request_class.priority)
+            batch = self._pending[:self.max_batch_size]
+            del self._pending[:self.max_batch_size]
+            if self._pending:
+                self._has_pending.set()
+            else:
+                self._has_pending.clear()
+
+            # Không chờ batch chạy xong: batch sau được gom và chạy song song
+            task = asyncio.create_task(self._run_batch(batch))
+            self._in_flight[task] = batch
+            task.add_done_callback(self._batch_done)
+            # Không giữ reference đến classifier cũ (sau hot reload) khi chờ batch sau
+            del batch
+
+    def _batch_done(self, task: asyncio.Task):
+        batch = self._in_flight.pop(task, [])
+        self._batch_slots.release()
+        if not task.cancelled() and task.exception() is not None:
+            print(f"⚠️ Batch failed: {task.exception()}")
+            for req in batch:
+                if not req.future.done():
+                    req.future.set_exception(task.exception())
+
+    async def _run_batch(self, batch: List[_PendingRequest]):
+        """Stack tensor, chạy forward pass trong thread và trả kết quả"""
+        # Bỏ qua các request mà caller đã huỷ (client disconnect) hoặc đã quá deadline
+        live = []
+        for req in batch:
+            if req.future.done():
+                continue
+            try:
+                req.request_class.check()
+            except DeadlineExceededError as e:
+                req.future.set_exception(e)
+                continue
+            live.append(req)
+        batch = live
+        if not batch:
+            return
+
+        started = time.perf_counter()
+        for req in batch:
+            self.queue_wait_hist.observe((started - req.enqueued_at) * 1000)
+        self.batch_size_hist.observe(len(batch))
+
+        # Ngay sau hot reload, batch có thể lẫn request của model cũ và mới
+        groups: Dict[int, List[_PendingRequest]] = {}
+        for req in batch:
+            groups.setdefault(id(req.classifier), []).append(req)
+
+        for group in groups.values():
+            classifier = group[0].classifier
+            # Ghép vào batch buffer dùng lại thay vì cấp phát mảng mới mỗi batch
+            stacked = classifier.batch_buffers.acquire(len(group))
+            np.concatenate([req.tensor for req in group], axis=0, out=stacked)
+            margins = np.array([req.tta_margin for req in group])
+            # Forward pass chạy ở lane ưu tiên nhất trong nhóm, không bị bỏ theo deadline
+            # (các request đã được kiểm tra ở trên)
+            lane = min((req.request_class for req in group), key=lambda rc: rc.priority).lane
+            try:
+                # Batch đã được nhận nên không bị load shedding
+                results = await get_executor().run(
+                    classifier.predict_tensors, stacked, margins, shed=False,
+                    request_class=RequestClass(lane), on_start=lambda group=group: self._observe_wait(group)
+                )
+            except Exception as e:
+                for req in group:
+                    if not req.future.done():
+                        req.future.set_exception(e)
+                continue
+            finally:
+                classifier.batch_buffers.release(stacked)
+
+            for req, result in zip(group, results):
+                if not req.future.done():
+                    req.future.set_result(result)
+
+    @staticmethod
+    def _observe_wait(group: List[_PendingRequest]):
+        """Thời gian từ lúc vào hàng đợi batch đến lúc forward pass được cấp slot, theo lane"""
+        now = time.perf_counter()
+        for req in group:
+            LANE_QUEUE_TIME.labels(req.request_class.lane).observe(now - req.enqueued_at)
+
+    def stats(self) -> Dict:
+        """Histogram batch size và thời gian chờ trong hàng đợi (ms)"""
+        return {
+            'enabled': self.running,
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait * 1000,
+            'max_in_flight': self.max_in_flight,
+            'in_flight': len(self._in_flight),
+            'queue_depth': len(self._pending),
+            'batch_size': self.batch_size_hist.snapshot(),
+            'queue_wait_ms': self.queue_wait_hist.snapshot()
+        }
+
+
+# Singleton instance
+_batcher: Optional[MicroBatcher] = None
+
+
+def get_batcher() -> MicroBatcher:
+    """Get or create batcher instance"""
+    global _batcher
+    if _batcher is None:
+        _batcher = MicroBatcher(
+            max_batch_size=settings.BATCH_MAX_SIZE,
+            max_wait_ms=settings.BATCH_MAX_WAIT_MS,
+            max_in_flight=settings.INFERENCE_CONCURRENCY
+        )
+    return _batcher
@@ -0,0 +1,88 @@
+"""
+Benchmark forward pass eager vs compiled (COMPILE_MODE) ở batch size 1 / 8 / 32
+
+Eager là đường _forward khi COMPILE_MODE=off: model.predict (TensorFlow), model
+gọi trực tiếp dưới no_grad (PyTorch). Các mode compiled lấy từ compiled.py; lần
+chạy đầu ghi artifact vào --cache-dir, chạy lại benchmark sẽ load từ cache
+(so sánh dòng "compile" giữa hai lần chạy).
+
+Chạy từ thư mục ai_server (cần torch hoặc tensorflow):
+    python benchmarks/bench_compile.py                        # demo model theo MODEL_TYPE
+    python benchmarks/bench_compile.py --model models/food_classifier.pth
+    python benchmarks/bench_compile.py --modes torchscript torch_compile --batch-sizes 1 8 32
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Classifier chạy eager, các mode compiled được tạo riêng bên dưới
+os.environ['COMPILE_MODE'] = 'off'
+os.environ['CASCADE_ENABLED'] = 'False'
+
+from compiled import FRAMEWORK_MODES, compile_model  # noqa: E402
+from model import FoodClassifier  # noqa: E402
+
+
+def time_forward(forward, batch: np.ndarray, repeat: int) -> dict:
+    forward(batch)  # warm-up
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        forward(batch)
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return {
+        'median_ms': statistics.median(timings),
+        'p95_ms': timings[max(0, int(len(timings) * 0.95) - 1)],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model', default=None, help='File model (.pth / .h5 / .keras), mặc định MODEL_PATH')
+    parser.add_argument('--modes', nargs='*', default=None, help='Mặc định: mọi mode của framework')
+    parser.add_argument('--batch-sizes', nargs='*', type=int, default=[1, 8, 32])
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--cache-dir', default=os.path.join(tempfile.gettempdir(), 'food_ai_compiled'))
+    args = parser.parse_args()
+
+    classifier = FoodClassifier(model_path=args.model)
+    modes = args.modes or list(FRAMEWORK_MODES.get(classifier.framework, ()))
+    if not modes:
+        sys.exit(f"Framework {classifier.framework} không có mode compile (chỉ PyTorch / TensorFlow)")
+    shape = classifier.preprocessor.shape
+    source = classifier.model_path if os.path.exists(classifier.model_path) \
+        else f"demo:{classifier.framework}:{classifier.arch}"
+    print(f"{classifier.framework} model {source}, input {shape}, cache {args.cache_dir}")
+
+    forwards = {'eager': classifier._forward}
+    for mode in modes:
+        compiled = compile_model(classifier.model, classifier.framework, mode, shape, source, args.cache_dir)
+        print(f"  compile {mode:<14} {compiled.compile_ms:9.1f} ms "
+              f"({'cached artifact' if compiled.cache_hit else 'new'})")
+        forwards[mode] = compiled
+
+    rng = np.random.default_rng(0)
+    for batch_size in args.batch_sizes:
+        batch = rng.standard_normal((batch_size,) + tuple(shape)).astype(np.float32)
+        reference = classifier._forward(batch)
+        print(f"\nbatch {batch_size}")
+        eager_ms = None
+        for name, forward in forwards.items():
+            r = time_forward(forward, batch, args.repeat)
+            eager_ms = eager_ms or r['median_ms']
+            diff = float(np.abs(forward(batch) - reference).max())
+            print(
+                f"  {name:<14} median {r['median_ms']:8.2f} ms  p95 {r['p95_ms']:8.2f} ms  "
+                f"{r['median_ms'] / batch_size:7.2f} ms/ảnh  x{eager_ms / r['median_ms']:.2f}  max |diff| {diff:.1e}"
+            )
+
+
+if __name__ == '__main__':
+    main()
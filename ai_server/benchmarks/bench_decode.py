@@ -0,0 +1,107 @@
+"""
+Benchmark decode + resize ảnh: đường full-resolution cũ vs JPEG draft (DCT scaling)
+
+Chạy từ thư mục ai_server:
+    python benchmarks/bench_decode.py                  # ảnh JPEG 12MP tổng hợp
+    python benchmarks/bench_decode.py img1.jpg img2.jpg
+"""
+import argparse
+import io
+import multiprocessing as mp
+import os
+import statistics
+import sys
+import time
+from typing import Tuple
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from model import decode_image  # noqa: E402
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def synthetic_jpeg(width: int = 4032, height: int = 3024, quality: int = 90) -> bytes:
+    """Tạo ảnh JPEG giống ảnh chụp điện thoại 12MP"""
+    rng = np.random.default_rng(0)
+    base = rng.integers(0, 255, size=(height // 16, width // 16, 3), dtype=np.uint8)
+    image = Image.fromarray(base).resize((width, height), Image.BILINEAR)
+    buf = io.BytesIO()
+    image.save(buf, format='JPEG', quality=quality)
+    return buf.getvalue()
+
+
+def decode_and_resize(image_bytes: bytes, size: int, fast: bool) -> Tuple[np.ndarray, Tuple[int, int]]:
+    """Đúng các bước decode/convert/resize của FoodClassifier.preprocess_image"""
+    image = decode_image(image_bytes, size, fast=fast)
+    image = image.convert('RGB')
+    decoded_size = image.size
+    image = image.resize((size, size))
+    return np.array(image, dtype=np.float32), decoded_size
+
+
+def _peak_rss_kb() -> int:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss if resource else 0
+
+
+def _run_mode(image_bytes: bytes, size: int, fast: bool, repeat: int, queue):
+    """Chạy trong process riêng để đo peak RSS của riêng mode này"""
+    baseline = _peak_rss_kb()
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        _, decoded_size = decode_and_resize(image_bytes, size, fast)
+        timings.append((time.perf_counter() - started) * 1000)
+    queue.put({
+        'timings': timings,
+        'decoded_size': decoded_size,
+        'peak_rss_delta_mb': (_peak_rss_kb() - baseline) / 1024 if resource else None
+    })
+
+
+def bench(image_bytes: bytes, size: int, fast: bool, repeat: int) -> dict:
+    queue = mp.Queue()
+    proc = mp.Process(target=_run_mode, args=(image_bytes, size, fast, repeat, queue))
+    proc.start()
+    result = queue.get()
+    proc.join()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('images', nargs='*', help='Các file JPEG để benchmark')
+    parser.add_argument('--size', type=int, default=224)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    if args.images:
+        samples = [(path, open(path, 'rb').read()) for path in args.images]
+    else:
+        samples = [('synthetic 4032x3024', synthetic_jpeg())]
+
+    for name, image_bytes in samples:
+        print(f"\n{name} ({len(image_bytes) / 1024 / 1024:.1f} MB)")
+        results = {}
+        for label, fast in (('full decode', False), ('draft decode', True)):
+            r = bench(image_bytes, args.size, fast, args.repeat)
+            results[label] = r
+            t = r['timings']
+            rss = f"{r['peak_rss_delta_mb']:.1f} MB" if r['peak_rss_delta_mb'] is not None else 'n/a'
+            print(
+                f"  {label:<13} decoded {r['decoded_size'][0]}x{r['decoded_size'][1]:<5} "
+                f"median {statistics.median(t):7.2f} ms  p95 {sorted(t)[int(len(t) * 0.95) - 1]:7.2f} ms  "
+                f"peak RSS +{rss}"
+            )
+        speedup = statistics.median(results['full decode']['timings']) / statistics.median(results['draft decode']['timings'])
+        print(f"  speedup: {speedup:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+"""
+Benchmark tiền xử lý ảnh đã decode: đường cũ (float64, transpose, expand_dims,
+np.concatenate) vs Preprocessor (uint8 -> nhân-cộng float32 ghi thẳng vào batch buffer)
+
+Đo thời gian và số lần cấp phát / bytes cấp phát (tracemalloc) cho mỗi ảnh.
+
+Chạy từ thư mục ai_server:
+    python benchmarks/bench_preprocess.py
+    python benchmarks/bench_preprocess.py --size 224 --batch 16 --layout NHWC
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from preprocessing import BufferPool, Preprocessor  # noqa: E402
+
+
+def legacy_preprocess(image: Image.Image, size: int, layout: str) -> np.ndarray:
+    """Đúng các bước của FoodClassifier.preprocess_image trước khi có Preprocessor"""
+    image = image.convert('RGB')
+    image = image.resize((size, size))
+    img_array = np.array(image, dtype=np.float32)
+    if layout == 'NCHW':
+        img_array = img_array / 255.0
+        mean = np.array([0.485, 0.456, 0.406])
+        std = np.array([0.229, 0.224, 0.225])
+        img_array = (img_array - mean) / std
+        img_array = np.transpose(img_array, (2, 0, 1))
+    return np.expand_dims(img_array, axis=0)
+
+
+def run_legacy(images, size: int, layout: str) -> np.ndarray:
+    # Tensor từng ảnh rồi np.concatenate thành batch (như micro-batcher)
+    batch = np.concatenate([legacy_preprocess(image, size, layout) for image in images], axis=0)
+    return batch.astype(np.float32, copy=False)
+
+
+def run_fused(images, preprocessor: Preprocessor, pool: BufferPool) -> np.ndarray:
+    batch = pool.acquire(len(images))
+    for row, image in zip(batch, images):
+        preprocessor.into(image, row)
+    pool.release(batch)
+    return batch
+
+
+def measure(fn, images, repeat: int) -> dict:
+    fn()  # warm-up (buffer pool, cache của PIL)
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - started) * 1000 / len(images))
+
+    # Bộ nhớ cấp phát tạm (peak) và số block cấp phát lớn (>= 4KB, tức mảng NumPy /
+    # buffer ảnh) được tạo trong một lần chạy, tính trên mỗi ảnh
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    tracemalloc.start(1)
+    allocations = _count_large_allocations(fn)
+    tracemalloc.stop()
+    return {
+        'median_ms': statistics.median(timings),
+        'peak_kb_per_image': peak / 1024 / len(images),
+        'allocs_per_image': allocations / len(images),
+    }
+
+
+def _count_large_allocations(fn, threshold: int = 4096) -> int:
+    """
+    Đếm block lớn được cấp phát (kể cả đã giải phóng ngay sau đó): tracemalloc
+    không giữ block đã free nên đọc peak rồi reset ở mỗi lần gọi hàm (profile hook)
+    """
+    count = 0
+    tracemalloc.reset_peak()
+    last_current, _ = tracemalloc.get_traced_memory()
+
+    def tracer(frame, event, arg):
+        nonlocal count, last_current
+        current, peak = tracemalloc.get_traced_memory()
+        if peak - last_current >= threshold:
+            count += 1
+        tracemalloc.reset_peak()
+        last_current, _ = tracemalloc.get_traced_memory()
+        return tracer
+
+    sys.setprofile(tracer)
+    try:
+        fn()
+    finally:
+        sys.setprofile(None)
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size', type=int, default=224)
+    parser.add_argument('--source', type=int, default=512,
+                        help='Cạnh ảnh đã decode (= size: ảnh đã resize sẵn, chỉ đo phần chuyển tensor)')
+    parser.add_argument('--batch', type=int, default=16)
+    parser.add_argument('--layout', choices=['NCHW', 'NHWC'], default='NCHW')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    images = [
+        Image.fromarray(rng.integers(0, 255, size=(args.source, args.source, 3), dtype=np.uint8))
+        for _ in range(args.batch)
+    ]
+    normalize = args.layout == 'NCHW'
+    preprocessor = Preprocessor(args.size, args.layout, normalize=normalize)
+    pool = BufferPool(preprocessor.shape, args.batch)
+
+    legacy = lambda: run_legacy(images, args.size, args.layout)  # noqa: E731
+    fused = lambda: run_fused(images, preprocessor, pool)  # noqa: E731
+
+    error = float(np.abs(legacy() - fused()).max())
+    print(f"{args.batch} ảnh {args.source}x{args.source} -> {args.layout} {args.size}, max |diff| = {error:.2e}")
+
+    results = {}
+    for label, fn in (('legacy', legacy), ('fused', fused)):
+        r = measure(fn, images, args.repeat)
+        results[label] = r
+        print(
+            f"  {label:<7} {r['median_ms']:6.3f} ms/ảnh  peak {r['peak_kb_per_image']:8.1f} KB/ảnh  "
+            f"{r['allocs_per_image']:5.1f} cấp phát mảng/ảnh"
+        )
+    print(f"  speedup: {results['legacy']['median_ms'] / results['fused']['median_ms']:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
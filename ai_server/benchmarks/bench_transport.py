@@ -0,0 +1,148 @@
+"""
+Benchmark overhead mỗi request giữa backend và AI server chạy cùng host
+
+So sánh:
+  - current:        ghi file, đọc lại, mở AsyncClient mới, multipart qua TCP (call_ai_server cũ)
+  - tcp keep-alive: AIClient transport=http (client dùng chung)
+  - uds:            AIClient transport=uds (multipart qua Unix socket)
+  - shm:            AIClient transport=shm (shared memory + Unix socket)
+  - uds binary:     AIClient transport=uds, wire=binary (frame nhị phân thay multipart / JSON)
+  - uds tensor:     như uds binary nhưng backend resize và gửi tensor uint8 224x224
+
+AI server được khởi động trong subprocess với mock model latency 0, tắt
+micro-batching và cache, nên thời gian đo được gần như chỉ là transport + decode.
+
+Chạy từ thư mục ai_server (Linux / macOS):
+    python benchmarks/bench_transport.py
+    python benchmarks/bench_transport.py photo.jpg --requests 500
+"""
+import argparse
+import asyncio
+import io
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+import httpx
+import numpy as np
+from PIL import Image
+
+AI_SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(AI_SERVER_DIR), 'backend'))
+
+from app.core.ai_client import AIClient  # noqa: E402
+
+
+def synthetic_jpeg(width: int = 1280, height: int = 960) -> bytes:
+    """Ảnh JPEG cỡ frame camera"""
+    rng = np.random.default_rng(0)
+    base = rng.integers(0, 255, size=(height // 16, width // 16, 3), dtype=np.uint8)
+    buf = io.BytesIO()
+    Image.fromarray(base).resize((width, height), Image.BILINEAR).save(buf, format='JPEG', quality=90)
+    return buf.getvalue()
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(port: int, uds_path: str) -> subprocess.Popen:
+    env = dict(
+        os.environ,
+        HOST='127.0.0.1', PORT=str(port), DEBUG='False', UDS_PATH=uds_path, SHM_ENABLED='True',
+        MOCK_MODE='True', MOCK_LATENCY_MS='0', BATCH_ENABLED='False', CACHE_ENABLED='False',
+        WARMUP_ENABLED='False', WORKER_PROCESSES='0'
+    )
+    proc = subprocess.Popen(
+        [sys.executable, 'main.py'], cwd=AI_SERVER_DIR, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            if httpx.get(f'http://127.0.0.1:{port}/health').status_code == 200 and os.path.exists(uds_path):
+                return proc
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError('AI server không khởi động được')
+
+
+async def current_path(base_url: str, image_bytes: bytes, upload_dir: str) -> dict:
+    """Đường cũ: lưu file, đọc lại, client mới mỗi request"""
+    path = os.path.join(upload_dir, f'{uuid.uuid4()}.jpg')
+    with open(path, 'wb') as f:
+        f.write(image_bytes)
+    async with httpx.AsyncClient(timeout=30.0) as client:
+        with open(path, 'rb') as f:
+            response = await client.post(f'{base_url}/predict', files={'file': ('image.jpg', f, 'image/jpeg')})
+    return response.json()
+
+
+async def bench(name: str, call, requests: int) -> list:
+    for _ in range(5):  # warmup kết nối
+        await call()
+    timings = []
+    for _ in range(requests):
+        started = time.perf_counter()
+        result = await call()
+        timings.append((time.perf_counter() - started) * 1000)
+        if not result or not result.get('success'):
+            raise RuntimeError(f'{name}: request thất bại: {result}')
+    return timings
+
+
+async def run(image_bytes: bytes, requests: int):
+    port = _free_port()
+    workdir = tempfile.mkdtemp(prefix='bench_transport_')
+    uds_path = os.path.join(workdir, 'ai.sock')
+    base_url = f'http://127.0.0.1:{port}'
+    proc = start_server(port, uds_path)
+    try:
+        clients = {
+            'tcp keep-alive': AIClient(base_url, 'http'),
+            'uds': AIClient(base_url, 'uds', uds_path),
+            'shm': AIClient(base_url, 'shm', uds_path),
+            'uds binary': AIClient(base_url, 'uds', uds_path, wire='binary'),
+            'uds tensor': AIClient(base_url, 'uds', uds_path, wire='binary', tensor_size=224),
+        }
+        modes = [('current', lambda: current_path(base_url, image_bytes, workdir))]
+        modes += [(name, lambda c=client: c.predict(image_bytes)) for name, client in clients.items()]
+
+        baseline = None
+        for name, call in modes:
+            t = await bench(name, call, requests)
+            median = statistics.median(t)
+            baseline = baseline or median
+            print(
+                f"  {name:<15} median {median:7.2f} ms  p95 {sorted(t)[int(len(t) * 0.95) - 1]:7.2f} ms  "
+                f"-{baseline - median:6.2f} ms vs current"
+            )
+        for client in clients.values():
+            await client.close()
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('image', nargs='?', help='File ảnh gửi đi (mặc định: JPEG 1280x960 tổng hợp)')
+    parser.add_argument('--requests', type=int, default=200)
+    args = parser.parse_args()
+
+    image_bytes = open(args.image, 'rb').read() if args.image else synthetic_jpeg()
+    print(f"Image {len(image_bytes) / 1024:.0f} KB, {args.requests} request tuần tự mỗi transport")
+    asyncio.run(run(image_bytes, args.requests))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+"""
+Live camera recognition qua WebSocket
+Client gửi liên tục các frame JPEG (binary message), server chỉ xử lý frame mới
+nhất: frame đến trong lúc đang predict bị bỏ, frame gần như không đổi so với
+frame đã nhận diện gần nhất (dHash) thì bỏ qua forward pass.
+
+Frame chạy ở lane interactive: decode trên thread pool dự phòng của executor,
+forward pass gom batch cùng request khác qua micro-batcher; frame chờ quá
+STREAM_FRAME_DEADLINE_MS bị bỏ (client đã gửi frame mới hơn).
+"""
+import asyncio
+import time
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+from fastapi import WebSocket, WebSocketDisconnect
+
+from config import settings
+from batching import get_batcher
+from executor import QueueFullError, get_executor
+from model import FoodClassifier, get_classifier
+from prediction_cache import dhash, hamming
+from scheduling import DeadlineExceededError, RequestClass, set_request_class
+
+
+class CameraSession:
+    """
+    Một kết nối camera
+
+    - Receiver: đọc frame từ socket, chỉ giữ frame mới nhất (frame cũ chưa xử lý bị drop)
+    - Processor: lấy frame mới nhất, decode + hash, skip nếu gần giống frame trước,
+      predict rồi đẩy top-k về client
+    """
+
+    def __init__(self, websocket: WebSocket, skip_distance: int, max_frame_bytes: int):
+        self.websocket = websocket
+        self.skip_distance = skip_distance
+        self.max_frame_bytes = max_frame_bytes
+
+        self._latest: Optional[Tuple[int, bytes, float]] = None  # (seq, bytes, received_at)
+        self._has_frame = asyncio.Event()
+        # (hash, version) của frame đã nhận diện gần nhất
+        self._last: Optional[Tuple[int, str]] = None
+
+        self.received = 0
+        self.dropped = 0
+        self.skipped = 0
+        self.processed = 0
+
+    async def run(self):
+        """Chạy đến khi client ngắt kết nối"""
+        processor = asyncio.create_task(self._process())
+        try:
+            await self._receive()
+        finally:
+            processor.cancel()
+            try:
+                await processor
+            except (asyncio.CancelledError, WebSocketDisconnect):
+                pass
+
+    async def _receive(self):
+        while True:
+            message = await self.websocket.receive()
+            if message['type'] == 'websocket.disconnect':
+                return
+
+            frame = message.get('bytes')
+            if frame is None:
+                await self._send({'type': 'error', 'error': 'Frame phải là binary message (JPEG/PNG/WEBP)'})
+                continue
+            if len(frame) > self.max_frame_bytes:
+                await self._send({'type': 'error', 'error': 'Frame quá lớn'})
+                continue
+
+            self.received += 1
+            if self._latest is not None:
+                # Frame trước chưa kịp xử lý -> bỏ, chỉ giữ frame mới nhất
+                self.dropped += 1
+            self._latest = (self.received, frame, time.perf_counter())
+            self._has_frame.set()
+
+    async def _process(self):
+        while True:
+            await self._has_frame.wait()
+            self._has_frame.clear()
+            seq, frame, received_at = self._latest
+            self._latest = None
+
+            # Processor chạy trong task riêng nên contextvar chỉ áp dụng cho session này
+            deadline = received_at + settings.STREAM_FRAME_DEADLINE_MS / 1000 \
+                if settings.STREAM_FRAME_DEADLINE_MS > 0 else None
+            set_request_class(RequestClass('interactive', deadline))
+
+            classifier = get_classifier()
+            executor = get_executor()
+            try:
+                if settings.BATCH_ENABLED:
+                    # Decode không chờ slot inference, chỉ forward pass (trong batch) chờ slot
+                    image_hash, tensor = await executor.run_reserved(self._prepare, classifier, frame)
+                    result = None if tensor is None else await get_batcher().submit(tensor, classifier)
+                else:
+                    image_hash, result = await executor.run(self._infer, classifier, frame)
+            except (QueueFullError, DeadlineExceededError):
+                self.dropped += 1
+                continue
+            except Exception as e:
+                # Lỗi không được làm dừng processor (socket vẫn mở, client chờ mãi)
+                await self._send({'type': 'error', 'frame': seq, 'error': str(e)})
+                continue
+
+            if result is None:
+                self.skipped += 1
+                continue
+
+            self.processed += 1
+            if result['success']:
+                self._last = (image_hash, classifier.version)
+            await self._send({
+                'type': 'prediction',
+                'frame': seq,
+                'success': result['success'],
+                'predictions': result['predictions'],
+                'error': result.get('error'),
+                'model_version': result.get('model_version'),
+                'stage': result.get('stage'),
+                'latency_ms': round((time.perf_counter() - received_at) * 1000, 1),
+                'stats': self.stats()
+            })
+
+    def _infer(self, classifier: FoodClassifier, frame: bytes) -> Tuple[int, Optional[Dict]]:
+        """Kết quả nhận diện của frame, None nếu frame được bỏ qua"""
+        image_hash, tensor = self._prepare(classifier, frame)
+        if tensor is None:
+            return image_hash, None
+        return image_hash, classifier.predict_tensors(tensor)[0]
+
+    def _prepare(self, classifier: FoodClassifier, frame: bytes) -> Tuple[int, Optional[np.ndarray]]:
+        """Decode + hash frame; tensor None nếu frame gần giống frame đã nhận diện"""
+        image = classifier.decode(frame)
+        image_hash = dhash(image)
+        if self._last is not None and self._last[1] == classifier.version \
+                and hamming(self._last[0], image_hash) <= self.skip_distance:
+            return image_hash, None
+        return image_hash, classifier.preprocess_image(image)
+
+    async def _send(self, payload: Dict):
+        await self.websocket.send_json(payload)
+
+    def stats(self) -> Dict:
+        return {
+            'received': self.received,
+            'dropped': self.dropped,
+            'skipped': self.skipped,
+            'processed': self.processed
+        }
@@ -0,0 +1,188 @@
+"""
+Chế độ chạy model đã compile thành graph (COMPILE_MODE)
+
+- torchscript:   torch.jit.trace + freeze, lưu file .pt trong COMPILE_CACHE_DIR
+- torch_compile: torch.compile (Inductor), kernel được cache trong
+                 COMPILE_CACHE_DIR/inductor (FX graph cache) nên restart không compile lại
+- tf_function:   tf.function với input signature cố định, gọi trực tiếp (không qua
+                 model.predict tạo tf.data pipeline mỗi lần); lưu thành SavedModel
+- auto:          torchscript (PyTorch) / tf_function (TensorFlow)
+
+Artifact được đặt tên theo fingerprint của model + shape input + version framework,
+model đổi thì compile lại. Input khác shape đã compile (vd stage nhanh của cascade
+chạy chính model ở độ phân giải thấp) chạy eager.
+"""
+import hashlib
+import os
+import shutil
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+import numpy as np
+
+COMPILE_MODES = ('off', 'auto', 'torchscript', 'torch_compile', 'tf_function')
+FRAMEWORK_MODES = {
+    'pytorch': ('torchscript', 'torch_compile'),
+    'tensorflow': ('tf_function',),
+}
+
+
+def resolve_mode(mode: str, framework: str) -> Optional[str]:
+    """Mode thực tế cho framework, None = chạy eager"""
+    mode = mode.lower()
+    if mode not in COMPILE_MODES:
+        raise ValueError(f"COMPILE_MODE không hợp lệ: {mode} (chọn một trong {', '.join(COMPILE_MODES)})")
+    supported = FRAMEWORK_MODES.get(framework, ())
+    if mode == 'off' or not supported:
+        return None
+    if mode == 'auto':
+        return supported[0]
+    if mode not in supported:
+        raise ValueError(f"COMPILE_MODE={mode} không dùng được với framework {framework}")
+    return mode
+
+
+def artifact_key(source: str, mode: str, sample_shape: Tuple[int, ...], framework_version: str) -> str:
+    """Tên artifact: model file (path + size + mtime) hoặc tên model demo, mode, shape, version"""
+    digest = hashlib.sha1(f"{mode}:{sample_shape}:{framework_version}".encode())
+    if os.path.exists(source):
+        stat = os.stat(source)
+        digest.update(f"{os.path.abspath(source)}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+    else:
+        digest.update(source.encode())
+    return f"{mode}-{digest.hexdigest()[:16]}"
+
+
+class CompiledModel:
+    """
+    Forward pass đã compile: batch numpy float32 -> output numpy
+
+    Gọi với batch khác sample_shape trả về None để caller chạy eager.
+    """
+
+    def __init__(self, mode: str, sample_shape: Tuple[int, ...], run: Callable[[np.ndarray], np.ndarray],
+                 path: Optional[str], cache_hit: bool, compile_ms: float):
+        self.mode = mode
+        self.sample_shape = tuple(sample_shape)
+        self.path = path
+        self.cache_hit = cache_hit
+        self.compile_ms = compile_ms
+        self._run = run
+
+    def __call__(self, batch: np.ndarray) -> Optional[np.ndarray]:
+        if batch.shape[1:] != self.sample_shape:
+            return None
+        return self._run(batch)
+
+    def stats(self) -> Dict:
+        return {
+            'mode': self.mode,
+            'sample_shape': list(self.sample_shape),
+            'path': self.path,
+            'cache_hit': self.cache_hit,
+            'compile_ms': self.compile_ms
+        }
+
+
+def compile_model(model, framework: str, mode: str, sample_shape: Tuple[int, ...],
+                  source: str, cache_dir: str) -> CompiledModel:
+    """
+    Compile (hoặc load artifact đã cache) model đã load
+
+    Args:
+        source: MODEL_PATH hoặc tên model demo, dùng cho tên artifact
+        cache_dir: Thư mục artifact, rỗng = không cache trên đĩa
+    """
+    started = time.perf_counter()
+    if mode == 'torchscript':
+        run, path, hit = _torchscript(model, sample_shape, source, cache_dir)
+    elif mode == 'torch_compile':
+        run, path, hit = _torch_compile(model, sample_shape, cache_dir)
+    elif mode == 'tf_function':
+        run, path, hit = _tf_function(model, sample_shape, source, cache_dir)
+    else:
+        raise ValueError(f"Mode compile không hỗ trợ: {mode}")
+
+    # Lần gọi đầu mới thực sự trace / compile (torch.compile, tf.function chưa có cache)
+    run(np.zeros((1,) + tuple(sample_shape), dtype=np.float32))
+    compile_ms = round((time.perf_counter() - started) * 1000, 1)
+    return CompiledModel(mode, sample_shape, run, path, hit, compile_ms)
+
+
+def _artifact_path(cache_dir: str, key: str, suffix: str = '') -> Optional[str]:
+    if not cache_dir:
+        return None
+    os.makedirs(cache_dir, exist_ok=True)
+    return os.path.join(cache_dir, key + suffix)
+
+
+def _torchscript(model, sample_shape, source: str, cache_dir: str):
+    import torch
+
+    path = _artifact_path(cache_dir, artifact_key(source, 'torchscript', sample_shape, torch.__version__), '.pt')
+    hit = path is not None and os.path.exists(path)
+    if hit:
+        module = torch.jit.load(path, map_location='cpu')
+    else:
+        example = torch.zeros((1,) + tuple(sample_shape), dtype=torch.float32)
+        with torch.no_grad():
+            # Trace theo batch 1, graph CNN không phụ thuộc batch size
+            module = torch.jit.freeze(torch.jit.trace(model.eval(), example))
+        if path is not None:
+            # Ghi file tạm rồi rename: nhiều worker process có thể compile cùng lúc
+            tmp = f"{path}.{os.getpid()}.tmp"
+            torch.jit.save(module, tmp)
+            os.replace(tmp, path)
+    module.eval()
+
+    def run(batch: np.ndarray) -> np.ndarray:
+        with torch.inference_mode():
+            return module(torch.from_numpy(batch)).numpy()
+    return run, path, hit
+
+
+def _torch_compile(model, sample_shape, cache_dir: str):
+    import torch
+
+    path = None
+    hit = False
+    if cache_dir:
+        # Inductor đọc biến môi trường khi compile lần đầu
+        path = os.path.join(cache_dir, 'inductor')
+        hit = os.path.isdir(path) and bool(os.listdir(path))
+        os.environ.setdefault('TORCHINDUCTOR_CACHE_DIR', path)
+        os.environ.setdefault('TORCHINDUCTOR_FX_GRAPH_CACHE', '1')
+    # dynamic: batch size thay đổi (micro-batch) không compile lại
+    module = torch.compile(model.eval(), dynamic=True)
+
+    def run(batch: np.ndarray) -> np.ndarray:
+        with torch.inference_mode():
+            return module(torch.from_numpy(batch)).numpy()
+    return run, path, hit
+
+
+def _tf_function(model, sample_shape, source: str, cache_dir: str):
+    import tensorflow as tf
+
+    path = _artifact_path(cache_dir, artifact_key(source, 'tf_function', sample_shape, tf.__version__))
+    hit = path is not None and os.path.exists(os.path.join(path, 'saved_model.pb'))
+    signature = [tf.TensorSpec((None,) + tuple(sample_shape), tf.float32, name='images')]
+    if hit:
+        # Graph đã trace được load lại, không trace model Keras lần nữa
+        forward = tf.saved_model.load(path).forward
+    else:
+        module = tf.Module()
+        module.model = model
+        # Signature cố định: batch size thay đổi không trace lại
+        module.forward = tf.function(lambda images: model(images, training=False), input_signature=signature)
+        forward = module.forward
+        if path is not None:
+            tmp = f"{path}.{os.getpid()}.tmp"
+            tf.saved_model.save(module, tmp)
+            if os.path.exists(path):
+                shutil.rmtree(path, ignore_errors=True)
+            os.replace(tmp, path)
+
+    def run(batch: np.ndarray) -> np.ndarray:
+        return forward(tf.convert_to_tensor(batch)).numpy()
+    return run, path, hit
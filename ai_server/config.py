@@ -2,6 +2,7 @@
 AI Server Configuration
 """
 import os
+from typing import Dict, List
 from pydantic_settings import BaseSettings
 
 
@@ -11,14 +12,117 @@ class Settings(BaseSettings):
     PORT: int = 8001
     DEBUG: bool = True
     
+    # Backend cùng host: Unix socket (chạy bằng `python main.py`) + shared memory handoff
+    UDS_PATH: str = ""  # vd /tmp/food_ai.sock, rỗng = chỉ nghe TCP
+    SHM_ENABLED: bool = False  # Bật POST /predict/shm
+    SHM_PREFIX: str = "food_ai_"  # Chỉ đọc segment có tên bắt đầu bằng prefix này
+    
     # Model
-    MODEL_TYPE: str = "efficientnet"  # efficientnet, mobilenet, resnet
+    # efficientnet, mobilenet, resnet; hoặc tensorflow/pytorch để chọn framework
+    # cho demo model khi không có MODEL_PATH (framework thật chọn theo đuôi file)
+    MODEL_TYPE: str = "efficientnet"
     MODEL_PATH: str = "models/food_classifier.h5"
     LABELS_PATH: str = "models/labels.json"
     
+    # Model phụ chọn bằng /predict?model=<tên>, load khi dùng lần đầu:
+    # {"vegetarian": {"model_path": "models/chay.onnx", "labels_path": "models/chay_labels.json"}}
+    # model_path có thể là tên kiến trúc demo (mobilenet), labels_path mặc định LABELS_PATH
+    MODELS: Dict[str, Dict[str, str]] = {}
+    MODEL_MEMORY_BUDGET_MB: float = 0  # Tổng RAM ước lượng của các model đã load, vượt thì evict LRU; 0 = không giới hạn
+    
+    # Cascade 2 stage: stage nhanh cho mọi ảnh, model chính chỉ chạy khi stage nhanh chưa chắc chắn
+    CASCADE_ENABLED: bool = False
+    # File model nhanh, tên kiến trúc demo (mobilenet) hoặc rỗng = model chính ở CASCADE_IMAGE_SIZE
+    # (model nhanh phải cùng layout / chuẩn hoá input với model chính)
+    CASCADE_MODEL: str = ""
+    CASCADE_IMAGE_SIZE: int = 160  # Input của stage nhanh, 0 = IMAGE_SIZE
+    CASCADE_CONFIDENCE: float = 0.6  # top-1 của stage nhanh < ngưỡng -> chạy model chính
+    CASCADE_MARGIN: float = 0.2  # top-1 - top-2 < ngưỡng -> chạy model chính
+    
+    # Mock model cho load test (tự bật khi không cài ML framework nào)
+    MOCK_MODE: bool = False  # True = luôn dùng mock kể cả khi có framework / model file
+    MOCK_LATENCY: str = "fixed"  # fixed, lognormal, replay
+    MOCK_LATENCY_MS: float = 30.0  # fixed: latency mỗi forward; lognormal: median
+    MOCK_LATENCY_PER_IMAGE_MS: float = 0.0  # Cộng thêm cho mỗi ảnh sau ảnh đầu trong batch
+    MOCK_LATENCY_SIGMA: float = 0.5  # lognormal: độ lệch chuẩn của log(latency)
+    MOCK_LATENCY_HISTOGRAM: str = ""  # replay: file .json ({"unit", "buckets"}) hoặc text GET /metrics
+    MOCK_ERROR_RATE: float = 0.0  # Tỉ lệ forward pass bị lỗi (0..1)
+    MOCK_CONCURRENCY: int = 0  # Số forward pass chạy cùng lúc tối đa, 0 = không giới hạn
+    MOCK_SEED: int = 0
+    
+    # Hot reload model (POST /model/reload hoặc tự reload khi file model / labels đổi)
+    MODEL_WATCH_INTERVAL: float = 0.0  # giây, 0 = tắt file watcher
+    ADMIN_TOKEN: str = ""  # Header X-Admin-Token cho admin endpoint, rỗng = không kiểm tra
+    
+    # ONNX Runtime (khi MODEL_PATH là file .onnx)
+    ONNX_INTRA_OP_THREADS: int = 0  # 0 = tự động theo số core
+    ONNX_INTER_OP_THREADS: int = 0
+    ONNX_GRAPH_OPTIMIZATION: str = "all"  # disable, basic, extended, all
+    ONNX_IO_BINDING: bool = True
+    
+    # Graph compile cho PyTorch / TensorFlow: off, auto, torchscript, torch_compile, tf_function
+    COMPILE_MODE: str = "off"
+    COMPILE_CACHE_DIR: str = "models/compiled"  # Artifact đã compile, rỗng = không cache trên đĩa
+    
     # Image
     IMAGE_SIZE: int = 224
     CONFIDENCE_THRESHOLD: float = 0.5
+    TOP_K: int = 5  # Số label tối đa trả về mỗi ảnh
+    
+    # Test-time augmentation (batched, chỉ chạy khi model chưa chắc chắn)
+    TTA_MODE: str = "off"  # off, auto (khi margin top-1 - top-2 < TTA_MARGIN), always; ghi đè bằng ?tta=
+    TTA_MARGIN: float = 0.15
+    TTA_VIEWS: List[str] = ["hflip", "crops"]  # hflip, vflip, crops (giữa + 4 góc)
+    FAST_DECODE: bool = True  # Decode JPEG ở kích thước giảm (DCT scaling)
+    
+    # Warmup trước khi /ready trả về 200
+    WARMUP_ENABLED: bool = True
+    WARMUP_ITERATIONS: int = 2
+    WARMUP_BATCH_SIZES: List[int] = []  # rỗng = 1, 2, 4, ... BATCH_MAX_SIZE và BATCH_PREDICT_SIZE
+    
+    # Process pool (0 = chạy inference trong process FastAPI)
+    # Nên đặt INFERENCE_CONCURRENCY >= WORKER_PROCESSES để dùng hết các worker
+    WORKER_PROCESSES: int = 0
+    WORKER_THREADS: int = 1  # Số thread ML framework mỗi worker
+    WORKER_PIN_CPUS: bool = True  # Pin mỗi worker vào một nhóm CPU riêng
+    
+    # Inference executor (giới hạn concurrency + load shedding)
+    INFERENCE_CONCURRENCY: int = 2
+    INFERENCE_MAX_QUEUE: int = 64
+    INFERENCE_RETRY_AFTER: int = 1  # giây, trả về trong header Retry-After khi 503
+    # Deadline (ms) khi request không gửi X-Deadline-Ms, 0 = không giới hạn
+    DEFAULT_DEADLINE_MS: float = 0
+    
+    # Micro-batching
+    BATCH_ENABLED: bool = True
+    BATCH_MAX_SIZE: int = 8
+    BATCH_MAX_WAIT_MS: float = 10.0
+    
+    # Near-duplicate cache (perceptual hash)
+    CACHE_ENABLED: bool = True
+    CACHE_MAX_SIZE: int = 1024
+    CACHE_TTL_SECONDS: float = 60.0
+    CACHE_MAX_DISTANCE: int = 4  # Hamming distance tối đa giữa 2 dHash 64-bit
+    
+    # Live camera (WebSocket /ws/camera)
+    STREAM_SKIP_DISTANCE: int = 4  # Bỏ qua frame có dHash lệch <= N bit so với frame đã nhận diện, -1 = tắt
+    STREAM_FRAME_DEADLINE_MS: float = 1000  # Frame chờ lâu hơn (tính từ lúc nhận) bị bỏ, 0 = không giới hạn
+    
+    # Tìm món ăn tương tự (/embed, /similar): ANN index IVF trên embedding
+    INDEX_DIR: str = "models/similar_index"  # Build bằng tools/build_index.py, rỗng = tắt
+    INDEX_NPROBE: int = 8  # Số cluster được quét mỗi lần tìm
+    SIMILAR_TOP_K: int = 5
+    
+    # /predict/video: clip ngắn quay lướt qua bàn ăn (cần opencv-python)
+    VIDEO_MAX_BYTES: int = 50 * 1024 * 1024
+    VIDEO_MAX_DURATION_S: float = 30.0  # Phần sau bị bỏ qua
+    VIDEO_SAMPLE_FPS: float = 2.0  # Số frame lấy mẫu mỗi giây
+    VIDEO_MAX_FRAMES: int = 32  # Số frame tối đa trong forward pass (clip dài thì giãn bước lấy mẫu)
+    VIDEO_DIFF_THRESHOLD: float = 6.0  # Chênh lệch trung bình (0-255) trên thumbnail xám, nhỏ hơn = frame trùng
+    
+    # /predict/batch (offline jobs)
+    BATCH_PREDICT_SIZE: int = 32
+    BATCH_PREDICT_MAX_IMAGES: int = 1000
     
     class Config:
         env_file = ".env"
@@ -0,0 +1,186 @@
+"""
+Bounded executor cho inference
+Chạy decode / forward pass ngoài event loop với giới hạn concurrency và độ sâu hàng đợi
+
+Slot được cấp theo priority lane của request (scheduling.py): job interactive
+chờ được cấp slot trống tiếp theo, trước mọi job standard / batch đang chờ, nên
+chỉ phải chờ tối đa một job đang chạy. Job quá deadline bị bỏ trước khi chạy.
+
+Decode của request interactive chạy trên thread pool dự phòng riêng (run_reserved)
+nên request interactive chỉ chờ một slot: slot của forward pass.
+"""
+import asyncio
+import heapq
+import itertools
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from config import settings
+from metrics import LANE_QUEUE_TIME
+from scheduling import LANES, RequestClass, current_request_class
+
+
+class QueueFullError(Exception):
+    """Hàng đợi inference đã đầy, server nên trả 503 + Retry-After"""
+
+    def __init__(self, retry_after: int):
+        super().__init__("Inference queue is full")
+        self.retry_after = retry_after
+
+
+class InferenceExecutor:
+    """
+    Thread pool riêng cho inference
+
+    - Tối đa `max_concurrency` job chạy cùng lúc
+    - Tối đa `max_queue` job chờ; vượt quá thì raise QueueFullError (load shedding)
+    - Job chờ được cấp slot theo (lane, deadline, thứ tự đến)
+    """
+
+    def __init__(self, max_concurrency: int, max_queue: int, retry_after: int):
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max(0, max_queue)
+        self.retry_after = retry_after
+
+        self._pool = ThreadPoolExecutor(
+            max_workers=self.max_concurrency,
+            thread_name_prefix="inference"
+        )
+        # Decode / tiền xử lý của request interactive, không chiếm slot inference
+        self._reserved_pool = ThreadPoolExecutor(
+            max_workers=self.max_concurrency,
+            thread_name_prefix="interactive-decode"
+        )
+        # Heap các job đang chờ slot: (priority lane, deadline, seq, future)
+        self._waiters: List[Tuple[int, float, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._free = self.max_concurrency
+        # Chỉ được cập nhật trên event loop nên không cần lock
+        self.waiting = 0
+        self.lane_waiting = dict.fromkeys(LANES, 0)
+        self.in_flight = 0
+        self.rejected = 0
+
+    def check_capacity(self):
+        """Raise QueueFullError nếu không nhận thêm job được"""
+        if self.waiting >= self.max_queue and self.in_flight >= self.max_concurrency:
+            self.rejected += 1
+            raise QueueFullError(self.retry_after)
+
+    async def run(self, fn: Callable, *args, shed: bool = True,
+                  request_class: Optional[RequestClass] = None,
+                  on_start: Optional[Callable[[], None]] = None) -> Any:
+        """
+        Chạy fn(*args) trên thread pool
+
+        Args:
+            shed: False cho job đã được nhận từ trước (vd forward pass của batch),
+                  khi đó không bị từ chối dù hàng đợi đầy
+            request_class: Lane + deadline của job, mặc định lấy của request hiện tại
+            on_start: Gọi khi job được cấp slot thay cho việc ghi LANE_QUEUE_TIME
+                      (micro-batcher tự ghi thời gian chờ của từng request)
+
+        Raises:
+            QueueFullError: hàng đợi đầy
+            DeadlineExceededError: quá deadline trước khi được cấp slot
+        """
+        request_class = request_class or current_request_class()
+        if shed:
+            self.check_capacity()
+        request_class.check()
+
+        queued_at = time.perf_counter()
+        self.waiting += 1
+        self.lane_waiting[request_class.lane] += 1
+        try:
+            await self._acquire(request_class)
+        finally:
+            self.waiting -= 1
+            self.lane_waiting[request_class.lane] -= 1
+
+        try:
+            # Hết hạn trong lúc chờ: trả slot cho job sau, không chạy model
+            request_class.check()
+            if on_start is not None:
+                on_start()
+            else:
+                LANE_QUEUE_TIME.labels(request_class.lane).observe(time.perf_counter() - queued_at)
+
+            self.in_flight += 1
+            try:
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(self._pool, fn, *args)
+            finally:
+                self.in_flight -= 1
+        finally:
+            self._release()
+
+    async def run_reserved(self, fn: Callable, *args,
+                           request_class: Optional[RequestClass] = None) -> Any:
+        """
+        Chạy fn(*args) trên thread pool dự phòng, không chờ slot inference
+        (decode của request interactive trước khi vào micro-batcher)
+
+        Raises:
+            DeadlineExceededError: đã quá deadline
+        """
+        (request_class or current_request_class()).check()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._reserved_pool, fn, *args)
+
+    async def _acquire(self, request_class: RequestClass):
+        if self._free > 0 and not self._waiters:
+            self._free -= 1
+            return
+
+        waiter = asyncio.get_running_loop().create_future()
+        deadline = request_class.deadline if request_class.deadline is not None else math.inf
+        heapq.heappush(self._waiters, (request_class.priority, deadline, next(self._seq), waiter))
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            # Caller bị huỷ ngay sau khi được cấp slot -> chuyển slot cho job sau
+            if waiter.done() and not waiter.cancelled():
+                self._release()
+            raise
+
+    def _release(self):
+        """Trả slot: cấp cho job ưu tiên nhất đang chờ (bỏ qua job đã bị huỷ)"""
+        while self._waiters:
+            waiter = heapq.heappop(self._waiters)[-1]
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self._free += 1
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+        self._reserved_pool.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> Dict:
+        return {
+            'max_concurrency': self.max_concurrency,
+            'max_queue': self.max_queue,
+            'queue_depth': self.waiting,
+            'queue_depth_by_lane': dict(self.lane_waiting),
+            'in_flight': self.in_flight,
+            'rejected': self.rejected
+        }
+
+
+# Singleton instance
+_executor: Optional[InferenceExecutor] = None
+
+
+def get_executor() -> InferenceExecutor:
+    """Get or create executor instance"""
+    global _executor
+    if _executor is None:
+        _executor = InferenceExecutor(
+            max_concurrency=settings.INFERENCE_CONCURRENCY,
+            max_queue=settings.INFERENCE_MAX_QUEUE,
+            retry_after=settings.INFERENCE_RETRY_AFTER
+        )
+    return _executor
@@ -2,14 +2,38 @@
 AI Server - Vietnamese Food Recognition
 FastAPI server để serve AI model nhận diện món ăn
 """
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi import FastAPI, Form, Header, Query, Request, UploadFile, File, HTTPException, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, Response
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Dict, List, Optional, Tuple, Union
+import asyncio
+import os
+import time
+import numpy as np
+from PIL import Image
+import tarfile
+import zipfile
 import uvicorn
 
 from config import settings
-from model import get_classifier
+from model import TTA_MODES, FoodClassifier, get_classifier, tta_margin, warmup_batch_sizes
+from batching import get_batcher
+from executor import QueueFullError, get_executor
+from worker_pool import get_worker_pool
+from prediction_cache import get_prediction_cache
+from metrics import CASCADE_DECISIONS, DEADLINE_DROPS, Gauge, LANE_QUEUE_TIME, STAGE_LATENCY, TTA_DECISIONS, render_prometheus
+from model_reload import ReloadInProgressError, get_model_reloader
+from model_registry import UnknownModelError, get_model_registry
+from scheduling import (
+    DEADLINE_HEADER, LANES, PRIORITY_HEADER, DeadlineExceededError, parse_request_class,
+    reset_request_class, set_request_class
+)
+from camera_stream import CameraSession
+from transport import read_shared_image, serve
+from ann_index import IndexMismatchError, get_similar_index
+from video import CHUNK_SIZE, VideoDecoderMissingError, VideoError, recognize_clip, spool_upload
+from wire import FRAME_CONTENT_TYPE, FrameError, accepts_frame, decode_request, encode_response, is_frame
 
 
 # Pydantic models for response
@@ -24,13 +48,112 @@ class PredictionResponse(BaseModel):
     predictions: List[PredictionItem]
     message: Optional[str] = None
     note: Optional[str] = None
+    model_version: Optional[str] = None
+    tta: Optional[bool] = None  # True nếu đã chạy test-time augmentation
+    stage: Optional[str] = None  # Cascade: fast (model nhanh) / full (model chính)
+
+
+class BatchPredictionResult(BaseModel):
+    index: int
+    filename: Optional[str] = None
+    success: bool
+    predictions: List[PredictionItem]
+    error: Optional[str] = None
+    tta: Optional[bool] = None
+    stage: Optional[str] = None
+
+
+class BatchPredictionResponse(BaseModel):
+    success: bool
+    total: int
+    failed: int
+    results: List[BatchPredictionResult]
+    model_version: Optional[str] = None
+
+
+class VideoPredictionItem(BaseModel):
+    label: str
+    confidence: float  # Cao nhất qua các frame
+    mean_confidence: float
+    frames: int  # Số frame có label là top-1
+    peak_ms: int  # Thời điểm frame có confidence cao nhất
+    rank: int
+
+
+class VideoFrameResult(BaseModel):
+    timestamp_ms: int
+    label: str
+    confidence: float
+
+
+class VideoPredictionResponse(BaseModel):
+    success: bool
+    predictions: List[VideoPredictionItem]
+    frames: List[VideoFrameResult]
+    stats: Dict
+    message: str
+    model_version: Optional[str] = None
+
+
+class SharedMemoryPredictRequest(BaseModel):
+    name: str  # Tên shared memory segment do backend tạo
+    size: int  # Số bytes ảnh trong segment
+    tta: Optional[str] = None
+    model: Optional[str] = None  # Như ?model= của /predict
+
+
+class EmbeddingResponse(BaseModel):
+    dimension: int
+    embedding: List[float]
+    model_version: str
+
+
+class SimilarItem(BaseModel):
+    food_id: int
+    image_id: int  # 0 = ảnh chính của món (Food.image_url)
+    score: float  # cosine similarity
+
+
+class SimilarResponse(BaseModel):
+    results: List[SimilarItem]
+    index_size: int
+    search_ms: float
+    model_version: str
+
+
+class ModelReloadRequest(BaseModel):
+    model_path: Optional[str] = None
+    labels_path: Optional[str] = None
 
 
 class HealthResponse(BaseModel):
     status: str
     model_loaded: bool
     framework: str
+    model_version: str
     labels_count: int
+    queue_depth: int
+    in_flight: int
+
+
+# Trạng thái readiness: chỉ True sau khi warmup xong
+_readiness = {
+    "ready": False,
+    "warmup": None,
+    "error": None
+}
+
+
+# Gauge đọc trạng thái lúc scrape /metrics
+Gauge('ai_inference_in_flight', 'Số job inference đang chạy', lambda: get_executor().in_flight)
+Gauge('ai_inference_queue_depth', 'Số job inference đang chờ',
+      lambda: get_executor().waiting + get_batcher().stats()['queue_depth'])
+Gauge('ai_inference_rejected_total', 'Số request bị từ chối (503) do hàng đợi đầy',
+      lambda: get_executor().rejected, type='counter')
+Gauge('ai_cache_hits_total', 'Số lần cache hit (kể cả near-duplicate)',
+      lambda: get_prediction_cache().hits + get_prediction_cache().near_hits, type='counter')
+Gauge('ai_cache_misses_total', 'Số lần cache miss', lambda: get_prediction_cache().misses, type='counter')
+Gauge('ai_ready', '1 nếu server đã warmup xong', lambda: int(_readiness["ready"]))
 
 
 # Create FastAPI app
@@ -52,13 +175,109 @@ app.add_middleware(
 )
 
 
+@app.exception_handler(QueueFullError)
+async def queue_full_handler(request: Request, exc: QueueFullError):
+    """Hàng đợi inference đầy -> 503 để client retry sau"""
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Server đang quá tải, vui lòng thử lại sau"},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
+
+@app.exception_handler(DeadlineExceededError)
+async def deadline_exceeded_handler(request: Request, exc: DeadlineExceededError):
+    """Request quá deadline trước khi tới model -> 504, kết quả không còn dùng được"""
+    return JSONResponse(status_code=504, content={"detail": str(exc)})
+
+
+# Lane mặc định khi backend không gửi X-Priority
+DEFAULT_LANES = {"/predict/batch": "batch"}
+
+
+@app.middleware("http")
+async def request_class_middleware(request: Request, call_next):
+    """Đọc X-Priority / X-Deadline-Ms, executor và micro-batcher xếp hàng theo lane + deadline"""
+    try:
+        request_class = parse_request_class(
+            request.headers.get(PRIORITY_HEADER),
+            request.headers.get(DEADLINE_HEADER),
+            DEFAULT_LANES.get(request.url.path, "standard"),
+            settings.DEFAULT_DEADLINE_MS
+        )
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"detail": str(e)})
+    token = set_request_class(request_class)
+    try:
+        return await call_next(request)
+    finally:
+        reset_request_class(token)
+
+
 @app.on_event("startup")
 async def startup_event():
     """Load model khi server start"""
     print("🚀 Starting AI Server...")
     classifier = get_classifier()
-    print(f"✓ Model loaded: {classifier.framework}")
+    timings = classifier.startup_timings
+    if classifier.weights_loaded:
+        print(f"✓ Model loaded: {classifier.framework} "
+              f"(import {timings['import_ms']:.0f}ms, load {timings['load_ms']:.0f}ms)")
+    else:
+        print(f"✓ Model {classifier.framework}: weights được load trong worker pool")
     print(f"✓ Labels: {len(classifier.labels)}")
+    
+    if settings.BATCH_ENABLED:
+        batcher = get_batcher()
+        await batcher.start()
+        print(f"✓ Micro-batching: max {batcher.max_batch_size} / {settings.BATCH_MAX_WAIT_MS}ms")
+    
+    reloader = get_model_reloader()
+    await reloader.start()
+    if reloader.watching:
+        print(f"✓ Watching model files every {settings.MODEL_WATCH_INTERVAL}s")
+    
+    # Warmup chạy nền: /health (liveness) trả lời ngay, /ready chờ warmup xong
+    app.state.ready_task = asyncio.create_task(prepare_ready(classifier))
+
+
+async def prepare_ready(classifier):
+    """Khởi động worker pool / warmup model rồi đánh dấu server ready"""
+    try:
+        if settings.WORKER_PROCESSES > 0:
+            # Shape một ảnh sau tiền xử lý để cấp phát shared memory cho worker
+            pool = get_worker_pool(sample_shape=classifier.preprocessor.shape)
+            # Mỗi worker tự warmup trước khi báo ready
+            await asyncio.to_thread(pool.start)
+            classifier.attach_pool(pool)
+            _readiness["warmup"] = {w["id"]: w["warmup_ms"] for w in pool.stats()["processes"]}
+            print(f"✓ Worker pool: {pool.num_workers} x {pool.threads_per_worker} threads")
+        elif settings.WARMUP_ENABLED:
+            timings = await asyncio.to_thread(
+                classifier.warmup, warmup_batch_sizes(), settings.WARMUP_ITERATIONS
+            )
+            _readiness["warmup"] = timings
+            print(f"✓ Warmup: {timings['total_ms']:.0f}ms (batch sizes {list(timings['batches'])})")
+    except Exception as e:
+        _readiness["error"] = str(e)
+        print(f"⚠️ Warmup failed: {e}")
+        return
+    
+    _readiness["ready"] = True
+    print("✓ Ready")
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Dừng các background task khi server tắt"""
+    await get_model_reloader().stop()
+    await get_batcher().stop()
+    get_executor().shutdown()
+    
+    pool = get_worker_pool()
+    if pool is not None:
+        get_classifier().pool = None
+        pool.close()
 
 
 @app.get("/", response_model=dict)
@@ -75,33 +294,105 @@ async def root():
 async def health_check():
     """Health check endpoint"""
     classifier = get_classifier()
+    executor = get_executor()
     return HealthResponse(
         status="healthy",
-        model_loaded=classifier.model is not None or classifier.framework == 'mock',
+        model_loaded=classifier.model is not None or classifier.pool is not None or classifier.framework == 'mock',
         framework=classifier.framework,
-        labels_count=len(classifier.labels)
+        model_version=classifier.version,
+        labels_count=len(classifier.labels),
+        queue_depth=executor.waiting + get_batcher().stats()['queue_depth'],
+        in_flight=executor.in_flight
     )
 
 
+@app.get("/ready")
+async def readiness_check():
+    """
+    Readiness: chỉ trả về 200 khi model đã warmup xong
+    (/health là liveness, luôn trả về 200 khi process còn sống)
+    """
+    if not _readiness["ready"]:
+        return JSONResponse(
+            status_code=503,
+            content={"ready": False, "error": _readiness["error"]}
+        )
+    return {"ready": True, "warmup": _readiness["warmup"]}
+
+
+def _check_tta(tta: Optional[str]):
+    """Validate query param tta"""
+    try:
+        tta_margin(tta)
+    except ValueError:
+        raise HTTPException(
+            status_code=400,
+            detail=f"tta phải là một trong {', '.join(TTA_MODES)}"
+        )
+
+
+def _read_frame(body: bytes, max_items: int) -> List[Union[bytes, Image.Image]]:
+    """Đọc body dạng frame (wire.py), frame lỗi -> 400"""
+    try:
+        return decode_request(body, max_items, MAX_IMAGE_SIZE)
+    except FrameError as e:
+        raise HTTPException(status_code=400, detail=f"Frame không hợp lệ: {e}")
+
+
 @app.post("/predict", response_model=PredictionResponse)
-async def predict(file: UploadFile = File(...)):
+async def predict(
+    request: Request,
+    file: Optional[UploadFile] = File(None),
+    tta: Optional[str] = None,
+    model: Optional[str] = None
+):
     """
     Nhận diện món ăn từ hình ảnh
     
     - **file**: File hình ảnh (JPG, PNG, WEBP)
+    - **tta**: off / auto (chỉ khi model chưa chắc chắn) / always, mặc định TTA_MODE
+    - **model**: Tên (MODELS) hoặc version model, mặc định model chính
+    
+    Thay cho multipart có thể gửi body `application/x-food-frame` (xem wire.py)
+    chứa một ảnh encode hoặc tensor uint8 đã resize; header
+    `Accept: application/x-food-frame` để nhận response dạng frame thay cho JSON.
     
     Returns:
         Danh sách predictions với label và confidence
     """
+    _check_tta(tta)
+    classifier = await _resolve_model(model)
+    contents = await _read_image(request, file)
+    return _prediction_response(request, await _predict_image(contents, tta, classifier))
+
+
+async def _resolve_model(model: Optional[str]) -> FoodClassifier:
+    """Classifier cho ?model=, load lần đầu nếu cần; không có -> 404, load lỗi -> 503"""
+    try:
+        return await get_model_registry().get(model)
+    except UnknownModelError:
+        raise HTTPException(status_code=404, detail=f"Không có model '{model}'")
+    except Exception as e:
+        print(f"⚠️ Load model '{model}' failed: {e}")
+        raise HTTPException(status_code=503, detail=f"Không load được model '{model}': {e}")
+
+
+async def _read_image(request: Request, file: Optional[UploadFile]) -> Union[bytes, Image.Image]:
+    """Đọc một ảnh từ multipart hoặc body dạng frame, ảnh không hợp lệ -> 400"""
+    if is_frame(request.headers.get("content-type")):
+        with STAGE_LATENCY.time('upload_read'):
+            return _read_frame(await request.body(), max_items=1)[0]
+    
     # Validate file type
-    if not file.content_type or not file.content_type.startswith("image/"):
+    if file is None or not file.content_type or not file.content_type.startswith("image/"):
         raise HTTPException(
             status_code=400,
             detail="File phải là hình ảnh (JPG, PNG, WEBP)"
         )
     
     # Read file
-    contents = await file.read()
+    with STAGE_LATENCY.time('upload_read'):
+        contents = await file.read()
     
     # Check file size (max 10MB)
     if len(contents) > 10 * 1024 * 1024:
@@ -109,16 +400,60 @@ async def predict(file: UploadFile = File(...)):
             status_code=400,
             detail="File quá lớn. Tối đa 10MB"
         )
+    return contents
+
+
+@app.post("/predict/shm", response_model=PredictionResponse)
+async def predict_shared_memory(request: Request, body: SharedMemoryPredictRequest):
+    """
+    Nhận diện ảnh backend đã ghi sẵn vào shared memory (backend cùng host)
     
-    # Get prediction
-    classifier = get_classifier()
-    result = classifier.predict(contents)
+    Chỉ gửi tên segment thay vì upload multipart; backend tạo và unlink segment,
+    AI server chỉ đọc. Cần bật SHM_ENABLED.
+    """
+    if not settings.SHM_ENABLED:
+        raise HTTPException(status_code=404, detail="Shared memory handoff chưa được bật")
+    _check_tta(body.tta)
+    classifier = await _resolve_model(body.model)
+    
+    if not body.name.startswith(settings.SHM_PREFIX) or '/' in body.name:
+        raise HTTPException(status_code=400, detail=f"Tên segment phải bắt đầu bằng {settings.SHM_PREFIX}")
+    if not 0 < body.size <= MAX_IMAGE_SIZE:
+        raise HTTPException(status_code=400, detail="File quá lớn. Tối đa 10MB")
+    
+    try:
+        with STAGE_LATENCY.time('upload_read'):
+            contents = read_shared_image(body.name, body.size)
+    except (FileNotFoundError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Không đọc được shared memory: {e}")
+    
+    return _prediction_response(request, await _predict_image(contents, body.tta, classifier))
+
+
+async def _predict_image(contents: Union[bytes, Image.Image], tta: Optional[str],
+                         classifier: Optional[FoodClassifier] = None) -> Dict:
+    """Predict một ảnh (qua micro-batcher nếu bật), lỗi -> 500"""
+    if settings.BATCH_ENABLED:
+        result = await get_batcher().predict(contents, tta, classifier)
+    else:
+        result = await get_executor().run(
+            get_prediction_cache().predict, classifier or get_classifier(), contents, np.full(1, tta_margin(tta))
+        )
     
     if not result['success']:
         raise HTTPException(
             status_code=500,
             detail=result.get('error', 'Prediction failed')
         )
+    return result
+
+
+def _prediction_response(request: Request, result: Dict) -> Union[PredictionResponse, Response]:
+    """Response JSON hoặc frame nhị phân tuỳ header Accept"""
+    if accepts_frame(request.headers.get("accept")):
+        with STAGE_LATENCY.time('serialize'):
+            content = encode_response([result], result.get('model_version'))
+        return Response(content=content, media_type=FRAME_CONTENT_TYPE)
     
     return PredictionResponse(
         success=True,
@@ -126,16 +461,461 @@ async def predict(file: UploadFile = File(...)):
             PredictionItem(**pred) for pred in result['predictions']
         ],
         message=f"Đã nhận diện {len(result['predictions'])} món ăn",
-        note=result.get('note')
+        note=result.get('note'),
+        tta=result.get('tta'),
+        stage=result.get('stage'),
+        model_version=result.get('model_version')
+    )
+
+
+MAX_IMAGE_SIZE = 10 * 1024 * 1024
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.bmp')
+ARCHIVE_TYPES = (
+    'application/zip', 'application/x-zip-compressed',
+    'application/x-tar', 'application/gzip', 'application/x-gzip'
+)
+
+
+def _is_archive(file: UploadFile) -> bool:
+    name = (file.filename or '').lower()
+    return file.content_type in ARCHIVE_TYPES or name.endswith(('.zip', '.tar', '.tar.gz', '.tgz'))
+
+
+def _read_archive(file: UploadFile, limit: int) -> List[Tuple[str, bytes]]:
+    """
+    Đọc các ảnh trong file zip/tar theo thứ tự trong archive
+    Tar được đọc dạng stream (r|*), không cần giải nén ra đĩa
+    """
+    images = []
+    name = (file.filename or '').lower()
+    
+    if file.content_type in ARCHIVE_TYPES[:2] or name.endswith('.zip'):
+        with zipfile.ZipFile(file.file) as archive:
+            for info in archive.infolist():
+                if info.is_dir() or not info.filename.lower().endswith(IMAGE_EXTENSIONS):
+                    continue
+                if info.file_size > MAX_IMAGE_SIZE:
+                    raise ValueError(f"{info.filename}: file quá lớn. Tối đa 10MB")
+                images.append((info.filename, archive.read(info)))
+                if len(images) > limit:
+                    break
+    else:
+        with tarfile.open(fileobj=file.file, mode='r|*') as archive:
+            for member in archive:
+                if not member.isfile() or not member.name.lower().endswith(IMAGE_EXTENSIONS):
+                    continue
+                if member.size > MAX_IMAGE_SIZE:
+                    raise ValueError(f"{member.name}: file quá lớn. Tối đa 10MB")
+                images.append((member.name, archive.extractfile(member).read()))
+                if len(images) > limit:
+                    break
+    
+    return images
+
+
+@app.post("/predict/batch", response_model=BatchPredictionResponse)
+async def predict_batch(
+    request: Request,
+    files: Optional[List[UploadFile]] = File(None),
+    tta: Optional[str] = None,
+    model: Optional[str] = None
+):
+    """
+    Nhận diện nhiều ảnh trong một request (dành cho job offline)
+    
+    - **files**: Nhiều file ảnh (multipart), hoặc một file zip/tar chứa ảnh
+    - **tta**: off / auto / always, mặc định TTA_MODE
+    - **model**: Tên (MODELS) hoặc version model, mặc định model chính
+    
+    Body `application/x-food-frame` (nhiều ảnh encode / tensor uint8) và
+    `Accept: application/x-food-frame` được hỗ trợ như /predict.
+    
+    Returns:
+        Kết quả từng ảnh theo đúng thứ tự input
+    """
+    _check_tta(tta)
+    classifier = await _resolve_model(model)
+    limit = settings.BATCH_PREDICT_MAX_IMAGES
+    images: List[Tuple[Optional[str], Union[bytes, Image.Image]]] = []
+    
+    if is_frame(request.headers.get("content-type")):
+        images = [(None, item) for item in _read_frame(await request.body(), max_items=limit)]
+        files = []
+    
+    for file in files or []:
+        if _is_archive(file):
+            try:
+                images.extend(await asyncio.to_thread(_read_archive, file, limit))
+            except (ValueError, zipfile.BadZipFile, tarfile.TarError) as e:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Không đọc được archive {file.filename}: {e}"
+                )
+        elif file.content_type and file.content_type.startswith("image/"):
+            contents = await file.read()
+            if len(contents) > MAX_IMAGE_SIZE:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"{file.filename}: file quá lớn. Tối đa 10MB"
+                )
+            images.append((file.filename, contents))
+        else:
+            raise HTTPException(
+                status_code=400,
+                detail=f"{file.filename}: phải là hình ảnh (JPG, PNG, WEBP) hoặc zip/tar"
+            )
+        
+        if len(images) > limit:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Quá nhiều ảnh. Tối đa {limit} ảnh mỗi request"
+            )
+    
+    if not images:
+        raise HTTPException(status_code=400, detail="Không có ảnh nào để nhận diện")
+    
+    # Mỗi batch BATCH_PREDICT_SIZE ảnh là một job riêng trong executor: request
+    # interactive / standard chen vào giữa các batch, chỉ chờ tối đa một batch
+    contents = [item for _, item in images]
+    size = max(1, settings.BATCH_PREDICT_SIZE)
+    results = []
+    for start in range(0, len(contents), size):
+        results.extend(await get_executor().run(
+            classifier.predict_batch, contents[start:start + size], size, tta,
+            # Request đã được nhận ở batch đầu tiên
+            shed=start == 0
+        ))
+    
+    if accepts_frame(request.headers.get("accept")):
+        with STAGE_LATENCY.time('serialize'):
+            content = encode_response(results, classifier.version)
+        return Response(content=content, media_type=FRAME_CONTENT_TYPE)
+    
+    items = [
+        BatchPredictionResult(
+            index=idx,
+            filename=filename,
+            success=result['success'],
+            predictions=[PredictionItem(**pred) for pred in result['predictions']],
+            error=result.get('error'),
+            tta=result.get('tta'),
+            stage=result.get('stage')
+        )
+        for idx, ((filename, _), result) in enumerate(zip(images, results))
+    ]
+    failed = sum(1 for item in items if not item.success)
+    
+    return BatchPredictionResponse(
+        success=failed < len(items),
+        total=len(items),
+        failed=failed,
+        results=items,
+        model_version=classifier.version
     )
 
 
+async def _upload_chunks(file: UploadFile):
+    while True:
+        chunk = await file.read(CHUNK_SIZE)
+        if not chunk:
+            return
+        yield chunk
+
+
+@app.post("/predict/video", response_model=VideoPredictionResponse)
+async def predict_video(
+    request: Request,
+    file: Optional[UploadFile] = File(None),
+    model: Optional[str] = None,
+    top_k: Optional[int] = Query(None, ge=1, le=20)
+):
+    """
+    Nhận diện các món ăn trong video clip ngắn (quay lướt qua bàn ăn)
+    
+    - **file**: Video (MP4, MOV, WEBM), hoặc gửi thẳng body với Content-Type video/*
+    - **model**: Tên (MODELS) hoặc version model, mặc định model chính
+    
+    Clip được ghi ra file tạm theo từng chunk, chỉ các frame lấy mẫu và khác
+    frame trước được nhận diện trong một batch, kết quả gộp theo thời gian.
+    """
+    classifier = await _resolve_model(model)
+    content_type = request.headers.get("content-type", "")
+    if file is not None:
+        if file.content_type and not file.content_type.startswith(("video/", "application/octet-stream")):
+            raise HTTPException(status_code=400, detail="File phải là video (MP4, MOV, WEBM)")
+        chunks = _upload_chunks(file)
+        suffix = os.path.splitext(file.filename or '')[1] or '.mp4'
+    elif content_type.startswith("video/"):
+        chunks = request.stream()
+        suffix = '.' + content_type.split(';')[0].split('/')[1]
+    else:
+        raise HTTPException(status_code=400, detail="Không có video để nhận diện")
+    
+    try:
+        with STAGE_LATENCY.time('upload_read'):
+            path = await spool_upload(chunks, settings.VIDEO_MAX_BYTES, suffix)
+    except VideoError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    try:
+        result = await get_executor().run(recognize_clip, classifier, path, top_k or settings.TOP_K)
+    except VideoError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except VideoDecoderMissingError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    finally:
+        os.unlink(path)
+    
+    return VideoPredictionResponse(
+        message=f"Đã nhận diện {len(result['predictions'])} món ăn trong {result['stats']['kept']} frame",
+        **result
+    )
+
+
+def _check_admin(token: Optional[str]):
+    if settings.ADMIN_TOKEN and token != settings.ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Sai admin token")
+
+
+async def _embed_image(contents: Union[bytes, Image.Image]):
+    """Embedding của ảnh (chạy qua InferenceExecutor), ảnh lỗi -> 400"""
+    classifier = get_classifier()
+    try:
+        return classifier, await get_executor().run(classifier.embed, contents)
+    except QueueFullError:
+        raise
+    except ImportError as e:
+        # Embedding của model ONNX cần package onnx để sửa graph
+        raise HTTPException(status_code=501, detail=f"Server chưa hỗ trợ embedding cho model này: {e}")
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Không lấy được embedding: {e}")
+
+
+@app.post("/embed", response_model=EmbeddingResponse)
+async def embed(request: Request, file: Optional[UploadFile] = File(None)):
+    """
+    Embedding của ảnh: output lớp áp chót của classifier, chuẩn hoá L2
+    (so sánh 2 ảnh bằng tích vô hướng)
+    """
+    classifier, embedding = await _embed_image(await _read_image(request, file))
+    return EmbeddingResponse(
+        dimension=len(embedding),
+        embedding=embedding.tolist(),
+        model_version=classifier.version
+    )
+
+
+@app.post("/similar", response_model=SimilarResponse)
+async def similar(
+    request: Request,
+    file: Optional[UploadFile] = File(None),
+    k: Optional[int] = Query(None, ge=1, le=50)
+):
+    """
+    Tìm món ăn có ảnh giống ảnh upload nhất trong ANN index
+    (mỗi món lấy ảnh giống nhất, sắp xếp theo cosine similarity)
+    """
+    index = get_similar_index()
+    if index is None:
+        raise HTTPException(status_code=404, detail="Chưa có index ảnh (chạy tools/build_index.py)")
+    
+    classifier, embedding = await _embed_image(await _read_image(request, file))
+    started = time.perf_counter()
+    try:
+        results = index.search(embedding, k or settings.SIMILAR_TOP_K, classifier.embedding_version)
+    except IndexMismatchError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    
+    return SimilarResponse(
+        results=[SimilarItem(**item) for item in results],
+        index_size=index.count,
+        search_ms=round((time.perf_counter() - started) * 1000, 3),
+        model_version=classifier.version
+    )
+
+
+@app.post("/index/items")
+async def add_index_item(
+    request: Request,
+    file: Optional[UploadFile] = File(None),
+    food_id: int = Form(...),
+    image_id: int = Form(0),
+    x_admin_token: Optional[str] = Header(None)
+):
+    """
+    Thêm một ảnh vào ANN index (ảnh mới của FoodImage / Food.image_url)
+    
+    Ghi xuống đĩa ngay, không cần build lại index. Ảnh đã có (food_id, image_id) được bỏ qua.
+    """
+    _check_admin(x_admin_token)
+    if not settings.INDEX_DIR:
+        raise HTTPException(status_code=404, detail="INDEX_DIR chưa được cấu hình")
+    
+    classifier, embedding = await _embed_image(await _read_image(request, file))
+    index = get_similar_index(create_dim=len(embedding), model_version=classifier.embedding_version)
+    try:
+        added = await asyncio.to_thread(index.add, embedding[None], [[food_id, image_id]], classifier.embedding_version)
+    except IndexMismatchError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"added": added, "count": index.count}
+
+
+@app.websocket("/ws/camera")
+async def camera_stream(websocket: WebSocket):
+    """
+    Live camera recognition
+    
+    Client gửi frame ảnh dạng binary message, server đẩy về JSON
+    {"type": "prediction", "frame", "predictions", "latency_ms", "stats"} mỗi khi
+    có kết quả mới. Frame đến khi đang predict bị bỏ (chỉ xử lý frame mới nhất),
+    frame gần như không đổi so với frame đã nhận diện được bỏ qua.
+    """
+    await websocket.accept()
+    session = CameraSession(
+        websocket,
+        skip_distance=settings.STREAM_SKIP_DISTANCE,
+        max_frame_bytes=MAX_IMAGE_SIZE
+    )
+    await session.run()
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """
+    Prometheus metrics: latency từng stage, số prediction theo framework / label,
+    số lỗi, RSS của process, trạng thái hàng đợi
+    """
+    return PlainTextResponse(
+        render_prometheus(),
+        media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+def _tta_stats() -> dict:
+    """Tỉ lệ ảnh phải chạy TTA trong số ảnh được xét"""
+    decisions = TTA_DECISIONS.values()
+    escalated = decisions.get(('escalated',), 0)
+    checked = escalated + decisions.get(('confident',), 0)
+    return {
+        "mode": settings.TTA_MODE,
+        "margin": settings.TTA_MARGIN,
+        "views": settings.TTA_VIEWS,
+        "checked": checked,
+        "escalated": escalated,
+        "escalation_rate": round(escalated / checked, 4) if checked else 0.0
+    }
+
+
+def _cascade_stats() -> dict:
+    """Tỉ lệ ảnh phải chạy model chính trong cascade"""
+    decisions = CASCADE_DECISIONS.values()
+    full = decisions.get(('full',), 0)
+    total = full + decisions.get(('fast',), 0)
+    return {
+        "enabled": settings.CASCADE_ENABLED,
+        "model": settings.CASCADE_MODEL or "low-resolution pass",
+        "image_size": get_classifier().cascade_size,
+        "confidence": settings.CASCADE_CONFIDENCE,
+        "margin": settings.CASCADE_MARGIN,
+        "total": total,
+        "escalated": full,
+        "escalation_rate": round(full / total, 4) if total else 0.0
+    }
+
+
+def _lane_stats() -> Dict:
+    """Thời gian chờ slot inference (giây) và số request bị bỏ vì quá deadline theo lane"""
+    dropped = {key[0]: int(value) for key, value in DEADLINE_DROPS.values().items()}
+    return {
+        lane: {
+            "queue_wait": LANE_QUEUE_TIME.labels(lane).snapshot(),
+            "deadline_dropped": dropped.get(lane, 0)
+        }
+        for lane in LANES
+    }
+
+
+@app.get("/stats")
+async def get_stats():
+    """
+    Thống kê nội bộ (batch size, thời gian chờ hàng đợi) để tune cấu hình
+    """
+    pool = get_worker_pool()
+    classifier = get_classifier()
+    return {
+        "startup": classifier.startup_timings,
+        "executor": get_executor().stats(),
+        "lanes": _lane_stats(),
+        "batching": get_batcher().stats(),
+        "cache": get_prediction_cache().stats(),
+        "worker_pool": pool.stats() if pool is not None else None,
+        "tta": _tta_stats(),
+        "cascade": _cascade_stats(),
+        "similar_index": get_similar_index().stats() if get_similar_index() is not None else None,
+        "compiled": classifier.compiled.stats() if classifier.compiled is not None else None,
+        "models": get_model_registry().stats(),
+        "mock": {
+            "latency": classifier.model.profile,
+            "calls": classifier.model.calls,
+            "errors": classifier.model.errors
+        } if classifier.framework == 'mock' else None
+    }
+
+
+@app.post("/workers/restart")
+async def restart_workers():
+    """
+    Rolling restart các worker process (vd sau khi đổi model / bị leak memory)
+    Các worker khác vẫn phục vụ request trong lúc restart
+    """
+    pool = get_worker_pool()
+    if pool is None:
+        raise HTTPException(status_code=400, detail="Process pool chưa được bật (WORKER_PROCESSES=0)")
+    
+    await asyncio.to_thread(pool.restart_all)
+    return pool.stats()
+
+
+@app.get("/model")
+async def model_info():
+    """Version model đang phục vụ và lịch sử hot reload"""
+    return get_model_reloader().stats()
+
+
+@app.post("/model/reload")
+async def reload_model(
+    body: Optional[ModelReloadRequest] = None,
+    x_admin_token: Optional[str] = Header(None)
+):
+    """
+    Hot reload model không downtime
+    
+    Load + warmup model mới ở background rồi swap; request đang chạy vẫn hoàn
+    thành trên model cũ. Không truyền body = load lại file model / labels hiện tại.
+    """
+    _check_admin(x_admin_token)
+    
+    body = body or ModelReloadRequest()
+    try:
+        return await get_model_reloader().reload(body.model_path, body.labels_path)
+    except ReloadInProgressError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Reload thất bại, vẫn dùng model cũ: {e}")
+
+
+@app.get("/models")
+async def list_models():
+    """Các model trong registry: đã load chưa, thời gian load, RAM, số request"""
+    return get_model_registry().stats()
+
+
 @app.get("/labels")
-async def get_labels():
+async def get_labels(model: Optional[str] = None):
     """
     Lấy danh sách các nhãn món ăn model có thể nhận diện
     """
-    classifier = get_classifier()
+    classifier = await _resolve_model(model)
     return {
         "total": len(classifier.labels),
         "labels": classifier.labels
@@ -143,9 +923,13 @@ async def get_labels():
 
 
 if __name__ == "__main__":
-    uvicorn.run(
-        "main:app",
-        host=settings.HOST,
-        port=settings.PORT,
-        reload=settings.DEBUG
-    )
+    if settings.UDS_PATH:
+        # TCP + Unix socket trong cùng process (không dùng auto reload)
+        serve(app, settings.HOST, settings.PORT, settings.UDS_PATH)
+    else:
+        uvicorn.run(
+            "main:app",
+            host=settings.HOST,
+            port=settings.PORT,
+            reload=settings.DEBUG
+        )
@@ -0,0 +1,305 @@
+"""
+Metrics cho AI Server
+Histogram / Counter / Gauge xuất ra định dạng text của Prometheus (GET /metrics)
+
+Hot path không dùng lock: mỗi thread ghi vào shard riêng của nó (threading.local),
+chỉ khi scrape mới gộp các shard lại. Nhờ vậy có thể bật metrics ở production.
+"""
+import bisect
+import os
+import sys
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+
+# Bucket latency theo giây cho các stage trong predict
+STAGE_BUCKETS = [0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5]
+
+_registry: List["_Metric"] = []
+_registry_lock = threading.Lock()
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + '}'
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    """Metric có tên thì được đăng ký để xuất ra /metrics"""
+
+    type = 'untyped'
+
+    def __init__(self, name: Optional[str], help: str):
+        self.name = name
+        self.help = help
+        if name:
+            with _registry_lock:
+                _registry.append(self)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"] + self._samples()
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class _Sharded:
+    """Mỗi thread có shard riêng, đăng ký một lần khi thread ghi lần đầu"""
+
+    def __init__(self):
+        self._local = threading.local()
+        self._shards: list = []
+        self._shards_lock = threading.Lock()
+
+    def _new_shard(self):
+        raise NotImplementedError
+
+    def _shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._new_shard()
+            self._local.shard = shard
+            with self._shards_lock:
+                self._shards.append(shard)
+        return shard
+
+
+class _HistogramShard:
+    __slots__ = ('counts', 'sum')
+
+    def __init__(self, size: int):
+        self.counts = [0] * size
+        self.sum = 0.0
+
+
+class _Timer:
+    __slots__ = ('_histogram', '_started')
+
+    def __init__(self, histogram: "Histogram"):
+        self._histogram = histogram
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._histogram.observe(time.perf_counter() - self._started)
+        return False
+
+
+class Histogram(_Sharded, _Metric):
+    """
+    Histogram với các bucket cố định (giống kiểu Prometheus: le = upper bound)
+    """
+
+    type = 'histogram'
+
+    def __init__(self, buckets: Sequence[float], name: Optional[str] = None, help: str = '',
+                 labels: Optional[Dict[str, str]] = None):
+        _Sharded.__init__(self)
+        self.buckets = sorted(buckets)
+        self.labels = labels or {}
+        _Metric.__init__(self, name, help)
+
+    def _new_shard(self):
+        return _HistogramShard(len(self.buckets) + 1)  # bucket cuối là +Inf
+
+    def observe(self, value: float):
+        """Ghi nhận một giá trị"""
+        shard = self._shard()
+        shard.counts[bisect.bisect_left(self.buckets, value)] += 1
+        shard.sum += value
+
+    def time(self) -> _Timer:
+        """Context manager đo thời gian (giây)"""
+        return _Timer(self)
+
+    def _merged(self) -> Tuple[List[int], float]:
+        counts = [0] * (len(self.buckets) + 1)
+        total = 0.0
+        with self._shards_lock:
+            shards = list(self._shards)
+        for shard in shards:
+            for i, c in enumerate(shard.counts):
+                counts[i] += c
+            total += shard.sum
+        return counts, total
+
+    def snapshot(self) -> Dict:
+        """Trả về số liệu tích lũy theo từng bucket"""
+        counts, total = self._merged()
+        count = sum(counts)
+
+        cumulative = 0
+        buckets = {}
+        for bound, c in zip(self.buckets + [float('inf')], counts):
+            cumulative += c
+            buckets['+Inf' if bound == float('inf') else str(bound)] = cumulative
+
+        return {
+            'count': count,
+            'sum': round(total, 4),
+            'avg': round(total / count, 4) if count else 0.0,
+            'buckets': buckets
+        }
+
+    def _samples(self) -> List[str]:
+        labels = self.labels
+        counts, total = self._merged()
+        lines = []
+        cumulative = 0
+        for bound, c in zip(self.buckets + [float('inf')], counts):
+            cumulative += c
+            bucket_labels = dict(labels, le=_format_value(bound))
+            lines.append(f"{self.name}_bucket{_format_labels(bucket_labels)} {cumulative}")
+        lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(total)}")
+        lines.append(f"{self.name}_count{_format_labels(labels)} {cumulative}")
+        return lines
+
+
+class LabeledHistogram(_Metric):
+    """Họ histogram theo một label (vd stage="decode")"""
+
+    type = 'histogram'
+
+    def __init__(self, name: str, help: str, label: str, buckets: Sequence[float]):
+        self.label = label
+        self.buckets = buckets
+        self._children: Dict[str, Histogram] = {}
+        self._lock = threading.Lock()
+        super().__init__(name, help)
+
+    def labels(self, value: str) -> Histogram:
+        child = self._children.get(value)
+        if child is None:
+            with self._lock:
+                child = self._children.get(value)
+                if child is None:
+                    child = Histogram(self.buckets, labels={self.label: value})
+                    child.name = self.name
+                    self._children[value] = child
+        return child
+
+    def time(self, value: str) -> _Timer:
+        return self.labels(value).time()
+
+    def snapshot(self) -> Dict:
+        return {value: child.snapshot() for value, child in list(self._children.items())}
+
+    def _samples(self) -> List[str]:
+        lines = []
+        for child in list(self._children.values()):
+            lines.extend(child._samples())
+        return lines
+
+
+class Counter(_Sharded, _Metric):
+    """Counter theo tập label (tuple giá trị theo thứ tự label_names)"""
+
+    type = 'counter'
+
+    def __init__(self, name: str, help: str, label_names: Sequence[str] = ()):
+        _Sharded.__init__(self)
+        self.label_names = tuple(label_names)
+        _Metric.__init__(self, name, help)
+
+    def _new_shard(self):
+        return {}
+
+    def inc(self, *label_values: str, amount: float = 1):
+        shard = self._shard()
+        shard[label_values] = shard.get(label_values, 0) + amount
+
+    def values(self) -> Dict[Tuple[str, ...], float]:
+        merged: Dict[Tuple[str, ...], float] = {}
+        with self._shards_lock:
+            shards = list(self._shards)
+        for shard in shards:
+            for key, value in list(shard.items()):
+                merged[key] = merged.get(key, 0) + value
+        return merged
+
+    def _samples(self) -> List[str]:
+        values = self.values()
+        if not values and not self.label_names:
+            values = {(): 0}
+        return [
+            f"{self.name}{_format_labels(dict(zip(self.label_names, key)))} {_format_value(value)}"
+            for key, value in sorted(values.items())
+        ]
+
+
+class Gauge(_Metric):
+    """
+    Gauge đọc giá trị qua callback lúc scrape
+    (type='counter' cho các bộ đếm đã có sẵn ở nơi khác, vd cache.hits)
+    """
+
+    type = 'gauge'
+
+    def __init__(self, name: str, help: str, fn: Callable[[], float], type: str = 'gauge'):
+        self.fn = fn
+        self.type = type
+        super().__init__(name, help)
+
+    def _samples(self) -> List[str]:
+        try:
+            value = self.fn()
+        except Exception:
+            return []
+        return [] if value is None else [f"{self.name} {_format_value(value)}"]
+
+
+def process_rss_bytes() -> Optional[int]:
+    """RSS hiện tại của process (Linux: /proc, nơi khác: psutil nếu có)"""
+    if sys.platform.startswith('linux'):
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        return None
+
+
+def render_prometheus() -> str:
+    """Xuất toàn bộ metric đã đăng ký theo text exposition format"""
+    with _registry_lock:
+        metrics = list(_registry)
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+# Metrics của pipeline predict
+STAGE_LATENCY = LabeledHistogram(
+    'ai_predict_stage_seconds',
+    'Latency từng stage trong /predict (upload_read, decode, preprocess, forward_fast, forward, tta, postprocess, embed, serialize)',
+    'stage', STAGE_BUCKETS
+)
+PREDICTIONS = Counter('ai_predictions_total', 'Số ảnh đã chạy qua model theo framework', ['framework'])
+PREDICTED_LABELS = Counter('ai_predicted_label_total', 'Số lần mỗi label là top-1', ['label'])
+PREDICTION_ERRORS = Counter('ai_prediction_errors_total', 'Số lỗi predict theo stage', ['stage'])
+CASCADE_DECISIONS = Counter('ai_cascade_decisions_total', 'Stage cascade trả lời từng ảnh (fast / full)', ['stage'])
+MODEL_REQUESTS = Counter('ai_model_requests_total', 'Số request theo model trong registry (?model=)', ['model'])
+TTA_DECISIONS = Counter('ai_tta_decisions_total', 'Quyết định TTA cho từng ảnh (escalated / confident)', ['decision'])
+PROCESS_RSS = Gauge('process_resident_memory_bytes', 'Resident memory của process AI server', process_rss_bytes)
+LANE_QUEUE_TIME = LabeledHistogram(
+    'ai_lane_queue_seconds',
+    'Thời gian chờ slot inference theo priority lane (interactive, standard, batch)',
+    'lane', STAGE_BUCKETS
+)
+DEADLINE_DROPS = Counter('ai_deadline_dropped_total', 'Số request bị bỏ vì quá deadline trước khi tới model', ['lane'])
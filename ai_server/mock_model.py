@@ -0,0 +1,176 @@
+"""
+Mock model cho load test
+Thay forward pass thật bằng kết quả deterministic theo hash của ảnh, cùng với
+latency / tỉ lệ lỗi / giới hạn concurrency cấu hình được. Không cần cài
+TensorFlow / PyTorch / ONNX Runtime.
+"""
+import bisect
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from config import settings
+
+
+LATENCY_PROFILES = ('fixed', 'lognormal', 'replay')
+
+# Dòng bucket của histogram forward trong /metrics
+_PROMETHEUS_BUCKET = re.compile(
+    r'^ai_predict_stage_seconds_bucket\{(?=[^}]*stage="forward")[^}]*le="([^"]+)"[^}]*\}\s+(\S+)'
+)
+
+
+class MockModelError(RuntimeError):
+    """Lỗi giả lập của mock model"""
+
+
+def load_latency_histogram(path: str) -> Tuple[List[float], List[float]]:
+    """
+    Đọc histogram latency đã ghi lại, trả về (upper bounds giây, số mẫu mỗi bucket)
+
+    - File .json: {"unit": "ms" | "s", "buckets": {"le": cumulative_count, ...}}
+      (cùng dạng với "buckets" trong /stats)
+    - File khác: text của GET /metrics, dùng ai_predict_stage_seconds{stage="forward"}
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        content = f.read()
+
+    if path.endswith('.json'):
+        data = json.loads(content)
+        scale = 0.001 if data.get('unit', 's') == 'ms' else 1.0
+        cumulative = [(float(le), float(count)) for le, count in data['buckets'].items()]
+    else:
+        scale = 1.0
+        cumulative = [
+            (float(match.group(1)), float(match.group(2)))
+            for match in map(_PROMETHEUS_BUCKET.match, content.splitlines()) if match
+        ]
+
+    cumulative.sort()
+    bounds, counts = [], []
+    previous = 0.0
+    for le, count in cumulative:
+        bounds.append(le * scale)
+        counts.append(max(count - previous, 0.0))
+        previous = count
+    if not bounds or sum(counts) == 0:
+        raise ValueError(f"Histogram latency trong {path} không có mẫu nào")
+    return bounds, counts
+
+
+class MockModel:
+    """
+    Model giả lập: gọi như một hàm batch (N, ...) -> logits (N, num_classes)
+
+    - Logits của mỗi ảnh sinh từ hash nội dung tensor: cùng ảnh -> cùng kết quả
+    - Latency mỗi lần gọi theo profile: fixed, lognormal hoặc replay histogram
+    - `error_rate`: tỉ lệ lần gọi raise MockModelError
+    - `concurrency` > 0: tối đa bấy nhiêu lần gọi chạy cùng lúc, còn lại phải chờ
+    """
+
+    def __init__(self, num_classes: int, profile: str = 'fixed', latency_ms: float = 30.0,
+                 per_image_ms: float = 0.0, sigma: float = 0.5, histogram: Optional[str] = None,
+                 error_rate: float = 0.0, concurrency: int = 0, seed: int = 0):
+        if profile not in LATENCY_PROFILES:
+            raise ValueError(
+                f"MOCK_LATENCY không hợp lệ: {profile} (chọn một trong {', '.join(LATENCY_PROFILES)})"
+            )
+        if profile == 'replay' and not histogram:
+            raise ValueError("MOCK_LATENCY=replay cần MOCK_LATENCY_HISTOGRAM")
+
+        self.num_classes = num_classes
+        self.profile = profile
+        self.latency = latency_ms / 1000.0
+        self.per_image = per_image_ms / 1000.0
+        self.sigma = sigma
+        self.error_rate = error_rate
+        self.concurrency = concurrency
+
+        self._histogram = None
+        if profile == 'replay':
+            bounds, counts = load_latency_histogram(histogram)
+            total = sum(counts)
+            self._histogram = (bounds, list(np.cumsum(counts) / total))
+
+        self._random = random.Random(seed)
+        self._random_lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(concurrency) if concurrency > 0 else None
+
+        self.calls = 0
+        self.errors = 0
+
+    @classmethod
+    def from_settings(cls, num_classes: int) -> "MockModel":
+        return cls(
+            num_classes,
+            profile=settings.MOCK_LATENCY.lower(),
+            latency_ms=settings.MOCK_LATENCY_MS,
+            per_image_ms=settings.MOCK_LATENCY_PER_IMAGE_MS,
+            sigma=settings.MOCK_LATENCY_SIGMA,
+            histogram=settings.MOCK_LATENCY_HISTOGRAM or None,
+            error_rate=settings.MOCK_ERROR_RATE,
+            concurrency=settings.MOCK_CONCURRENCY,
+            seed=settings.MOCK_SEED
+        )
+
+    def sample_latency(self, batch_size: int) -> Tuple[float, bool]:
+        """Latency (giây) của một lần forward với batch_size ảnh và lần gọi này có lỗi không"""
+        with self._random_lock:
+            if self.profile == 'fixed':
+                base = self.latency
+            elif self.profile == 'lognormal':
+                # latency_ms là median của phân phối
+                base = self.latency * self._random.lognormvariate(0.0, self.sigma)
+            else:
+                bounds, cdf = self._histogram
+                idx = min(bisect.bisect_left(cdf, self._random.random()), len(bounds) - 1)
+                upper = bounds[idx]
+                lower = bounds[idx - 1] if idx > 0 else 0.0
+                if upper == float('inf'):
+                    upper = lower * 2 or self.latency
+                base = self._random.uniform(lower, upper)
+            failed = self._random.random() < self.error_rate
+        return base + self.per_image * max(batch_size - 1, 0), failed
+
+    def logits(self, batch: np.ndarray) -> np.ndarray:
+        """Logits deterministic theo nội dung từng ảnh"""
+        outputs = np.empty((len(batch), self.num_classes), dtype=np.float32)
+        for i, row in enumerate(batch):
+            digest = hashlib.blake2b(np.ascontiguousarray(row).tobytes(), digest_size=8).digest()
+            rng = np.random.default_rng(int.from_bytes(digest, 'little'))
+            logits = rng.normal(0.0, 1.0, self.num_classes)
+            # Một class nổi bật với độ tự tin khác nhau giữa các ảnh
+            logits[rng.integers(self.num_classes)] += rng.uniform(1.0, 6.0)
+            outputs[i] = logits
+        return outputs
+
+    def features(self, batch: np.ndarray, dim: int = 64) -> np.ndarray:
+        """
+        Embedding giả lập (N, dim): trung bình từng đoạn của tensor ảnh,
+        ảnh gần giống nhau cho embedding gần nhau
+        """
+        flat = batch.reshape(len(batch), -1).astype(np.float32)
+        bounds = np.linspace(0, flat.shape[1], dim + 1).astype(np.intp)
+        features = np.add.reduceat(flat, bounds[:-1], axis=1) / np.diff(bounds)
+        return features - features.mean(axis=1, keepdims=True)
+
+    def __call__(self, batch: np.ndarray) -> np.ndarray:
+        latency, failed = self.sample_latency(len(batch))
+        if self._slots is not None:
+            self._slots.acquire()
+        try:
+            self.calls += 1
+            time.sleep(latency)
+            if failed:
+                self.errors += 1
+                raise MockModelError("Mock inference error")
+            return self.logits(batch)
+        finally:
+            if self._slots is not None:
+                self._slots.release()
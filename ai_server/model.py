@@ -6,55 +6,188 @@ import os
 import json
 import numpy as np
 from PIL import Image
-from typing import List, Dict, Tuple, Optional
+from typing import List, Dict, Tuple, Optional, Union
 import io
+import hashlib
+import importlib.util
+import threading
+import time
 
-# Kiểm tra xem có GPU không
-try:
-    import tensorflow as tf
-    # Disable GPU nếu không cần (chạy trên CPU cho demo)
-    # tf.config.set_visible_devices([], 'GPU')
-    USE_TENSORFLOW = True
-except ImportError:
-    USE_TENSORFLOW = False
-
-try:
-    import torch
-    import torchvision.transforms as transforms
-    from torchvision import models
-    USE_PYTORCH = True
-except ImportError:
-    USE_PYTORCH = False
+# ML framework được import lazy: chỉ framework được chọn mới được load
+# (import cả TensorFlow lẫn PyTorch tốn nhiều giây và hàng trăm MB RSS)
+tf = None
+torch = None
+models = None
+ort = None
+
+FRAMEWORK_MODULES = {
+    'tensorflow': 'tensorflow',
+    'pytorch': 'torch',
+    'onnx': 'onnxruntime',
+}
+MODEL_EXTENSIONS = {
+    '.h5': 'tensorflow',
+    '.keras': 'tensorflow',
+    '.pth': 'pytorch',
+    '.onnx': 'onnx',
+}
+# Pre-trained ImageNet demo theo kiến trúc (khi không có model file).
+# TF chỉ gồm model nhận input 0-255 giống EfficientNet
+DEMO_MODELS = {
+    'pytorch': {'efficientnet': 'efficientnet_b0', 'mobilenet': 'mobilenet_v3_small', 'resnet': 'resnet50'},
+    'tensorflow': {'efficientnet': 'EfficientNetB0', 'mobilenet': 'MobileNetV3Small'},
+}
+DEMO_ARCHS = ('efficientnet', 'mobilenet', 'resnet')
 
 from config import settings
+from compiled import CompiledModel, compile_model, resolve_mode
+from mock_model import MockModel
+from preprocessing import BufferPool, Preprocessor
+from metrics import (
+    CASCADE_DECISIONS, PREDICTED_LABELS, PREDICTION_ERRORS, PREDICTIONS, STAGE_LATENCY, TTA_DECISIONS
+)
+
+
+def is_framework_available(framework: str) -> bool:
+    """Kiểm tra framework đã được cài mà không import nó"""
+    return importlib.util.find_spec(FRAMEWORK_MODULES[framework]) is not None
+
+
+def select_framework(model_path: Optional[str] = None) -> str:
+    """
+    Chọn framework từ model_path / MODEL_PATH (theo đuôi file) hoặc MODEL_TYPE
+    
+    - MODEL_PATH tồn tại: .h5/.keras -> tensorflow, .pth -> pytorch, .onnx -> onnx
+    - Không có model file: dùng pre-trained demo theo MODEL_TYPE nếu là tên
+      framework, nếu không thì ưu tiên PyTorch rồi TensorFlow
+    - Không có framework nào hoặc MOCK_MODE: mock
+    """
+    if settings.MOCK_MODE:
+        return 'mock'
+    model_path = model_path or settings.MODEL_PATH
+    
+    if os.path.exists(model_path):
+        ext = os.path.splitext(model_path)[1].lower()
+        framework = MODEL_EXTENSIONS.get(ext)
+        if framework is None:
+            raise ValueError(f"Không hỗ trợ model file {model_path}")
+        if not is_framework_available(framework):
+            raise ImportError(f"{model_path} cần {FRAMEWORK_MODULES[framework]} nhưng chưa được cài")
+        return framework
+    
+    model_type = settings.MODEL_TYPE.lower()
+    if model_type in ('tensorflow', 'pytorch') and is_framework_available(model_type):
+        return model_type
+    for framework in ('pytorch', 'tensorflow'):
+        if is_framework_available(framework):
+            return framework
+    return 'mock'
+
+
+def import_framework(framework: str):
+    """Import framework được chọn vào các biến global của module (idempotent)"""
+    global tf, torch, models, ort
+    
+    if framework == 'tensorflow' and tf is None:
+        import tensorflow
+        # Disable GPU nếu không cần (chạy trên CPU cho demo)
+        # tensorflow.config.set_visible_devices([], 'GPU')
+        tf = tensorflow
+    elif framework == 'pytorch' and torch is None:
+        import torch as _torch
+        from torchvision import models as _models
+        torch, models = _torch, _models
+    elif framework == 'onnx' and ort is None:
+        import onnxruntime
+        ort = onnxruntime
 
 
 class FoodClassifier:
     """
     Food Classification Model
-    Hỗ trợ cả TensorFlow và PyTorch
+    Hỗ trợ TensorFlow, PyTorch và ONNX Runtime
     """
     
-    def __init__(self):
+    def __init__(self, model_path: Optional[str] = None, labels_path: Optional[str] = None,
+                 arch: Optional[str] = None, cascade: Optional[bool] = None,
+                 load_weights: bool = True):
+        """
+        Args:
+            arch: Kiến trúc pre-trained demo khi không có model file, mặc định theo MODEL_TYPE
+            cascade: Bật cascade 2 stage, mặc định theo CASCADE_ENABLED
+            load_weights: False ở process FastAPI khi bật worker pool: chỉ load labels
+                          và tiền xử lý, weights chỉ nằm trong worker (xem attach_pool)
+        """
+        # Mặc định dùng MODEL_PATH / LABELS_PATH, hot reload có thể chỉ định file khác
+        self.model_path = model_path or settings.MODEL_PATH
+        self.labels_path = labels_path or settings.LABELS_PATH
+        model_type = settings.MODEL_TYPE.lower()
+        self.arch = arch or (model_type if model_type in DEMO_ARCHS else 'efficientnet')
         self.model = None
         self.labels: List[str] = []
         self.image_size = settings.IMAGE_SIZE
         self.confidence_threshold = settings.CONFIDENCE_THRESHOLD
+        # WorkerPool (process pool mode): forward pass chạy ở worker process
+        self.pool = None
+        # Cache chỉ giữ kết quả của một version: model phụ trong registry không dùng cache
+        self.use_prediction_cache = True
+        # Thời gian khởi động (ms): import framework, load weights, inference đầu tiên
+        self.startup_timings: Dict[str, Optional[float]] = {
+            'import_ms': None,
+            'load_ms': None,
+            'compile_ms': None,
+            'first_inference_ms': None,
+            'warmup_ms': None
+        }
+        
+        # Trích embedding (lớp áp chót), khởi tạo lazy khi /embed được gọi lần đầu
+        self._feature_lock = threading.Lock()
+        self._feature_extractor = None
+        self._feature_capture = threading.local()
         
         # Load labels
+        self.class_map: Dict[str, List[int]] = {}
+        self._projections: Dict[int, np.ndarray] = {}
         self._load_labels()
         
         # Load model
-        self._load_model()
+        self.framework = select_framework(self.model_path)
+        self.weights_loaded = load_weights or self.framework == 'mock'
+        if self.weights_loaded:
+            self._load_model()
+        else:
+            # ONNX: layout thật được lấy từ worker trong attach_pool
+            self.input_layout = 'NCHW'
+        self.preprocessor = self._make_preprocessor()
+        # Batch buffer dùng lại cho micro-batcher
+        self.batch_buffers = BufferPool(self.preprocessor.shape, settings.BATCH_MAX_SIZE)
+        # Graph đã compile (COMPILE_MODE), None = chạy eager
+        self.compiled: Optional[CompiledModel] = self._compile() if self.weights_loaded else None
+        
+        # Cascade: stage nhanh chạy cho mọi ảnh, model này chỉ chạy cho ảnh chưa chắc chắn
+        # (khi không load weights thì worker chạy cascade)
+        self.cascade_enabled = settings.CASCADE_ENABLED if cascade is None else cascade
+        self.cascade: Optional[FoodClassifier] = None  # None = chính model này ở độ phân giải thấp
+        self.cascade_size = self.image_size
+        if self.cascade_enabled and self.weights_loaded:
+            self._load_cascade()
+        
+        # Version của model + labels, dùng để invalidate cache khi model đổi
+        self.version = self._compute_version()
+        # Embedding chỉ phụ thuộc weights (không đổi khi sửa labels / bật cascade)
+        self.embedding_version = self._compute_embedding_version()
+        self.loaded_at = time.time()
     
     def _load_labels(self):
         """Load danh sách nhãn món ăn"""
-        labels_path = settings.LABELS_PATH
+        labels_path = self.labels_path
         
         if os.path.exists(labels_path):
             with open(labels_path, 'r', encoding='utf-8') as f:
                 data = json.load(f)
                 self.labels = data.get('labels', [])
+                # Tuỳ chọn: {label: [index output của model]} khi model không train trực tiếp trên labels
+                self.class_map = data.get('class_map', {})
         else:
             # Default labels cho demo
             self.labels = [
@@ -101,64 +234,626 @@ class FoodClassifier:
         
         print(f"Loaded {len(self.labels)} food labels")
     
+    def _compute_version(self) -> str:
+        """Fingerprint ngắn từ file model, file labels và framework đang dùng"""
+        digest = hashlib.sha1(self.framework.encode())
+        for path in (self.model_path, self.labels_path):
+            if os.path.exists(path):
+                stat = os.stat(path)
+                digest.update(f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+        digest.update(json.dumps(self.labels).encode())
+        if self.cascade_enabled:
+            digest.update(f"cascade:{self.cascade_size}:{self.cascade.version if self.cascade else ''}".encode())
+        return digest.hexdigest()[:12]
+    
+    def _compute_embedding_version(self) -> str:
+        """Fingerprint chỉ từ file weights, framework và kích thước input (ANN index gắn với version này)"""
+        digest = hashlib.sha1(f"{self.framework}:{self.image_size}".encode())
+        if os.path.exists(self.model_path):
+            stat = os.stat(self.model_path)
+            digest.update(f"{os.path.abspath(self.model_path)}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+        return digest.hexdigest()[:12]
+    
     def _load_model(self):
-        """Load model nhận diện"""
-        model_path = settings.MODEL_PATH
+        """Load model nhận diện (chỉ import framework cần dùng)"""
+        model_path = self.model_path
+        framework = select_framework(model_path)
         
-        if os.path.exists(model_path):
+        started = time.perf_counter()
+        import_framework(framework)
+        self.startup_timings['import_ms'] = round((time.perf_counter() - started) * 1000, 1)
+        
+        started = time.perf_counter()
+        if framework == 'mock':
+            # Kết quả deterministic theo ảnh + latency giả lập (load test)
+            self.model = MockModel.from_settings(len(self.labels))
+            if settings.MOCK_MODE:
+                print(f"⚠️ MOCK_MODE: mock model ({self.model.profile} latency)")
+            else:
+                print("⚠️ No ML framework available. Using mock predictions.")
+        elif os.path.exists(model_path):
             # Load pre-trained model
-            if USE_TENSORFLOW and model_path.endswith('.h5'):
+            if framework == 'tensorflow':
                 self.model = tf.keras.models.load_model(model_path)
-                self.framework = 'tensorflow'
                 print(f"Loaded TensorFlow model from {model_path}")
-            elif USE_PYTORCH and model_path.endswith('.pth'):
+            elif framework == 'pytorch':
                 self.model = torch.load(model_path)
                 self.model.eval()
-                self.framework = 'pytorch'
                 print(f"Loaded PyTorch model from {model_path}")
+            elif framework == 'onnx':
+                self._load_onnx(model_path)
+                print(f"Loaded ONNX model from {model_path} ({self.input_layout})")
         else:
             # Sử dụng pre-trained model cho demo
-            if USE_PYTORCH:
-                print("Loading pre-trained EfficientNet (PyTorch) for demo...")
-                self.model = models.efficientnet_b0(pretrained=True)
+            name = DEMO_MODELS.get(framework, {}).get(self.arch) or DEMO_MODELS[framework]['efficientnet']
+            if framework == 'pytorch':
+                print(f"Loading pre-trained {name} (PyTorch) for demo...")
+                self.model = getattr(models, name)(pretrained=True)
                 self.model.eval()
-                self.framework = 'pytorch'
-            elif USE_TENSORFLOW:
-                print("Loading pre-trained EfficientNet (TensorFlow) for demo...")
-                self.model = tf.keras.applications.EfficientNetB0(
+            elif framework == 'tensorflow':
+                print(f"Loading pre-trained {name} (TensorFlow) for demo...")
+                self.model = getattr(tf.keras.applications, name)(
                     weights='imagenet',
                     include_top=True
                 )
-                self.framework = 'tensorflow'
-            else:
-                print("⚠️ No ML framework available. Using mock predictions.")
-                self.framework = 'mock'
+        self.framework = framework
+        self.startup_timings['load_ms'] = round((time.perf_counter() - started) * 1000, 1)
     
-    def preprocess_image(self, image: Image.Image) -> np.ndarray:
+    def memory_bytes(self) -> int:
         """
-        Tiền xử lý ảnh trước khi đưa vào model
+        RAM ước lượng của model: tổng kích thước weights (ONNX: file model),
+        cộng model cascade riêng; mock / weights ở worker pool = 0
         """
-        # Resize về kích thước chuẩn
-        image = image.convert('RGB')
-        image = image.resize((self.image_size, self.image_size))
+        if not self.weights_loaded:
+            return 0
+        if self.framework == 'pytorch':
+            tensors = list(self.model.parameters()) + list(self.model.buffers())
+            size = sum(t.numel() * t.element_size() for t in tensors)
+        elif self.framework == 'tensorflow':
+            size = sum(int(np.prod(w.shape)) * w.dtype.size for w in self.model.weights)
+        elif self.framework == 'onnx':
+            size = os.path.getsize(self.model_path)
+        else:
+            size = 0
+        if self.compiled is not None and self.compiled.mode == 'torchscript':
+            # Module đã freeze giữ bản copy weights riêng
+            size *= 2
+        if self.cascade is not None:
+            size += self.cascade.memory_bytes()
+        return size
+    
+    def _compile(self) -> Optional[CompiledModel]:
+        """Compile model theo COMPILE_MODE (artifact cache trong COMPILE_CACHE_DIR)"""
+        mode = resolve_mode(settings.COMPILE_MODE, self.framework)
+        if mode is None:
+            return None
+        source = self.model_path if os.path.exists(self.model_path) else f"demo:{self.framework}:{self.arch}"
+        try:
+            compiled = compile_model(
+                self.model, self.framework, mode, self.preprocessor.shape, source, settings.COMPILE_CACHE_DIR
+            )
+        except Exception as e:
+            # Model không trace / compile được vẫn phục vụ bằng eager
+            print(f"⚠️ Compile {mode} failed, using eager: {e}")
+            return None
+        self.startup_timings['compile_ms'] = compiled.compile_ms
+        print(f"✓ Compiled model ({mode}, {'cached artifact' if compiled.cache_hit else 'new'}): "
+              f"{compiled.compile_ms:.0f}ms")
+        return compiled
+    
+    def _load_cascade(self):
+        """
+        Chuẩn bị stage nhanh của cascade
+
+        - CASCADE_MODEL là file model hoặc tên kiến trúc demo (vd mobilenet): load
+          model riêng, cùng labels
+        - CASCADE_MODEL rỗng: chạy chính model này ở CASCADE_IMAGE_SIZE
+        Input stage nhanh được thu nhỏ từ tensor đã tiền xử lý nên hai model phải
+        cùng layout / chuẩn hoá (NCHW ImageNet hoặc NHWC 0-255).
+        """
+        self.cascade_size = settings.CASCADE_IMAGE_SIZE or self.image_size
+        if self.cascade_size > self.image_size:
+            raise ValueError(f"CASCADE_IMAGE_SIZE ({self.cascade_size}) lớn hơn IMAGE_SIZE ({self.image_size})")
+        
+        source = settings.CASCADE_MODEL
+        if not source:
+            if self.cascade_size == self.image_size:
+                raise ValueError("Cascade không có CASCADE_MODEL cần CASCADE_IMAGE_SIZE nhỏ hơn IMAGE_SIZE")
+            if self._fixed_input_size() is not None:
+                raise ValueError(
+                    f"Model có input cố định {self._fixed_input_size()}px, không chạy được ở "
+                    f"{self.cascade_size}px: cần CASCADE_MODEL riêng"
+                )
+            print(f"✓ Cascade: {self.framework} {self.cascade_size}px -> {self.image_size}px")
+            return
         
-        # Convert to numpy array
-        img_array = np.array(image, dtype=np.float32)
+        fast = FoodClassifier(
+            model_path=source, labels_path=self.labels_path,
+            arch=source.lower() if source.lower() in DEMO_ARCHS else None, cascade=False
+        )
+        if fast._spatial_axes() != self._spatial_axes():
+            raise ValueError(
+                f"Model cascade ({fast.framework}) và model chính ({self.framework}) "
+                f"khác layout / chuẩn hoá input"
+            )
+        # Model nhanh export với input cố định thì dùng đúng kích thước đó
+        fixed = fast._fixed_input_size()
+        if fixed is not None:
+            if fixed > self.image_size:
+                raise ValueError(f"Model cascade có input {fixed}px lớn hơn IMAGE_SIZE ({self.image_size})")
+            self.cascade_size = fixed
+        self.cascade = fast
+        print(f"✓ Cascade: {fast.framework} {source} ({self.cascade_size}px) -> {self.framework}")
+    
+    def _onnx_session(self, model) -> "ort.InferenceSession":
+        """Tạo InferenceSession ONNX Runtime (file hoặc bytes) với cấu hình threads / optimization"""
+        opt_levels = {
+            'disable': ort.GraphOptimizationLevel.ORT_DISABLE_ALL,
+            'basic': ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+            'extended': ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+            'all': ort.GraphOptimizationLevel.ORT_ENABLE_ALL,
+        }
+        level = settings.ONNX_GRAPH_OPTIMIZATION.lower()
+        if level not in opt_levels:
+            raise ValueError(
+                f"ONNX_GRAPH_OPTIMIZATION không hợp lệ: {level} "
+                f"(chọn một trong {', '.join(opt_levels)})"
+            )
         
+        options = ort.SessionOptions()
+        options.graph_optimization_level = opt_levels[level]
+        # 0 = để ORT tự chọn theo số core
+        options.intra_op_num_threads = settings.ONNX_INTRA_OP_THREADS
+        options.inter_op_num_threads = settings.ONNX_INTER_OP_THREADS
+        if settings.ONNX_INTER_OP_THREADS > 1:
+            options.execution_mode = ort.ExecutionMode.ORT_PARALLEL
+        
+        return ort.InferenceSession(
+            model,
+            sess_options=options,
+            providers=['CPUExecutionProvider']
+        )
+    
+    def _load_onnx(self, model_path: str):
+        """Load model ONNX, xác định layout và batch dim của input"""
+        self.model = self._onnx_session(model_path)
+        
+        model_input = self.model.get_inputs()[0]
+        self._onnx_input_name = model_input.name
+        self._onnx_output_name = self.model.get_outputs()[0].name
+        
+        # Model export từ PyTorch dùng NCHW, từ TensorFlow dùng NHWC
+        self.input_layout = 'NCHW' if model_input.shape[1] == 3 else 'NHWC'
+        # Batch dim cố định = 1 thì phải chạy từng ảnh một
+        self._onnx_fixed_batch = model_input.shape[0] == 1
+        self._onnx_input_shape = model_input.shape
+    
+    def _run_onnx(self, batch: np.ndarray) -> np.ndarray:
+        """Chạy ONNX session, dùng IO binding nếu được bật"""
+        batch = np.ascontiguousarray(batch, dtype=np.float32)
+        
+        if self._onnx_fixed_batch and len(batch) > 1:
+            return np.concatenate([self._run_onnx(row[None]) for row in batch], axis=0)
+        
+        if settings.ONNX_IO_BINDING:
+            binding = self.model.io_binding()
+            binding.bind_cpu_input(self._onnx_input_name, batch)
+            binding.bind_output(self._onnx_output_name)
+            self.model.run_with_iobinding(binding)
+            return binding.copy_outputs_to_cpu()[0]
+        
+        return self.model.run([self._onnx_output_name], {self._onnx_input_name: batch})[0]
+    
+    def _make_preprocessor(self) -> Preprocessor:
+        """Layout / chuẩn hoá input theo framework của model"""
+        if self.framework == 'pytorch' or (self.framework == 'onnx' and self.input_layout == 'NCHW'):
+            # Normalize ImageNet cho PyTorch
+            return Preprocessor(self.image_size, 'NCHW', normalize=True)
+        # TF: efficientnet.preprocess_input là identity (model Keras tự rescale 0-255)
+        return Preprocessor(self.image_size, 'NHWC', normalize=False)
+    
+    def attach_pool(self, pool):
+        """
+        Chuyển forward pass sang worker pool đã ready: tiền xử lý theo layout và
+        version theo model mà worker đã load
+        """
+        info = pool.model_info
+        if (info['layout'], info['normalize']) != (self.preprocessor.layout, self.preprocessor.normalize):
+            self.input_layout = info['layout']
+            self.preprocessor = Preprocessor(self.image_size, info['layout'], info['normalize'])
+            self.batch_buffers = BufferPool(self.preprocessor.shape, settings.BATCH_MAX_SIZE)
+        self.version = info['version']
+        self.embedding_version = info['embedding_version']
+        self.pool = pool
+    
+    def preprocess_image(self, image: Image.Image) -> np.ndarray:
+        """
+        Tiền xử lý ảnh trước khi đưa vào model, trả về tensor (1, ...) float32
+        """
+        with STAGE_LATENCY.time('preprocess'):
+            return self.preprocessor(image)
+    
+    def preprocess_into(self, image: Image.Image, out: np.ndarray) -> np.ndarray:
+        """Tiền xử lý ảnh ghi thẳng vào một dòng của batch buffer"""
+        with STAGE_LATENCY.time('preprocess'):
+            return self.preprocessor.into(image, out)
+    
+    def decode(self, image_bytes: Union[bytes, Image.Image]) -> Image.Image:
+        """
+        Decode bytes ảnh ở kích thước gần IMAGE_SIZE
+        (ảnh đã decode sẵn, vd tensor uint8 từ wire format, được giữ nguyên)
+        """
+        if isinstance(image_bytes, Image.Image):
+            return image_bytes
+        try:
+            with STAGE_LATENCY.time('decode'):
+                image = decode_image(image_bytes, self.image_size, fast=settings.FAST_DECODE)
+                image.load()
+        except Exception:
+            PREDICTION_ERRORS.inc('decode')
+            raise
+        return image
+    
+    def load_tensor(self, image_bytes: bytes) -> np.ndarray:
+        """
+        Decode bytes ảnh và tiền xử lý thành tensor shape (1, ...)
+        """
+        return self.preprocess_image(self.decode(image_bytes))
+    
+    def _forward(self, batch: np.ndarray) -> np.ndarray:
+        """
+        Chạy forward pass cho cả batch, trả về output shape (N, num_classes)
+        (logits hoặc xác suất tuỳ model, softmax được làm ở _postprocess)
+        """
+        if not self.weights_loaded:
+            raise RuntimeError("Model chạy ở worker pool, worker chưa sẵn sàng")
+        if self.compiled is not None:
+            outputs = self.compiled(batch)
+            if outputs is not None:
+                return outputs
         if self.framework == 'tensorflow':
-            # Normalize cho EfficientNet TF
-            img_array = tf.keras.applications.efficientnet.preprocess_input(img_array)
-            img_array = np.expand_dims(img_array, axis=0)
+            return self.model.predict(batch, verbose=0)
         elif self.framework == 'pytorch':
-            # Normalize cho PyTorch
-            img_array = img_array / 255.0
-            mean = np.array([0.485, 0.456, 0.406])
-            std = np.array([0.229, 0.224, 0.225])
-            img_array = (img_array - mean) / std
-            img_array = np.transpose(img_array, (2, 0, 1))
-            img_array = np.expand_dims(img_array, axis=0)
+            with torch.no_grad():
+                tensor = torch.from_numpy(batch).float()
+                return self.model(tensor).numpy()
+        elif self.framework == 'onnx':
+            return self._run_onnx(batch)
+        elif self.framework == 'mock':
+            return self.model(batch)
+        raise RuntimeError(f"Framework {self.framework} không hỗ trợ forward pass")
+    
+    def predict_tensors(self, batch: np.ndarray,
+                        tta_margins: Optional[np.ndarray] = None) -> List[Dict]:
+        """
+        Nhận diện một batch tensor đã tiền xử lý (N, ...) trong một forward pass
+        
+        Args:
+            tta_margins: Ngưỡng margin TTA cho từng dòng (xem tta_margin()),
+                         None = theo TTA_MODE
+        
+        Returns:
+            List kết quả theo đúng thứ tự các dòng trong batch
+        """
+        PREDICTIONS.inc(self.framework, amount=len(batch))
+        full = None
+        if tta_margins is None:
+            tta_margins = np.full(len(batch), tta_margin(None))
+        
+        if self.pool is not None:
+            # Forward pass ở worker process (bao gồm cả thời gian chuyển qua shared memory)
+            with STAGE_LATENCY.time('forward'):
+                results = self.pool.predict_tensors(batch, tta_margins)
+            return self._record_results(results)
+        
+        try:
+            started = time.perf_counter()
+            if self.cascade_enabled:
+                scores, full = self._run_cascade(batch)
+            else:
+                outputs = self._forward(batch)
+                STAGE_LATENCY.labels('forward').observe(time.perf_counter() - started)
+            elapsed = time.perf_counter() - started
+            if self.startup_timings['first_inference_ms'] is None:
+                self.startup_timings['first_inference_ms'] = round(elapsed * 1000, 1)
+        except Exception as e:
+            print(f"Prediction error: {e}")
+            PREDICTION_ERRORS.inc('forward', amount=len(batch))
+            return [
+                {'success': False, 'error': str(e), 'predictions': []}
+                for _ in range(len(batch))
+            ]
+        
+        # Map output của model sang food labels (một lần cho cả batch)
+        started = time.perf_counter()
+        if full is None:
+            scores = self._label_scores(outputs)
+        postprocess = time.perf_counter() - started
+        
+        escalated = None
+        if (tta_margins >= 0).any():
+            try:
+                with STAGE_LATENCY.time('tta'):
+                    escalated = self._apply_tta(batch, scores, tta_margins)
+            except Exception as e:
+                # TTA lỗi thì vẫn trả kết quả single-view
+                print(f"TTA error: {e}")
+                PREDICTION_ERRORS.inc('tta')
+        
+        started = time.perf_counter()
+        results = [
+            {'success': True, 'predictions': predictions}
+            for predictions in self._postprocess(scores)
+        ]
+        STAGE_LATENCY.labels('postprocess').observe(postprocess + time.perf_counter() - started)
+        if full is not None:
+            for result, answered_by_full in zip(results, full.tolist()):
+                result['stage'] = 'full' if answered_by_full else 'fast'
+        if escalated is not None:
+            for result, margin, tta in zip(results, tta_margins, escalated.tolist()):
+                if margin >= 0:
+                    result['tta'] = tta
+        return self._record_results(results)
+    
+    def score_tensors(self, batch: np.ndarray) -> np.ndarray:
+        """
+        Xác suất theo label (N, num_labels) của một batch trong một forward pass
+        (không cascade / TTA / postprocess, chạy trong process hiện tại kể cả khi
+        chạy ở worker nếu bật worker pool), dùng khi cần gộp kết quả nhiều ảnh như
+        frame của video
+        """
+        PREDICTIONS.inc(self.framework, amount=len(batch))
+        with STAGE_LATENCY.time('forward'):
+            if self.pool is not None:
+                return self.pool.score_tensors(batch)
+            outputs = self._forward(batch)
+        return self._label_scores(outputs)
+    
+    def embed_tensors(self, batch: np.ndarray) -> np.ndarray:
+        """
+        Embedding (N, D) của batch tensor đã tiền xử lý: output lớp áp chót
+        (input của lớp fully-connected cuối), chuẩn hoá L2 để so sánh bằng cosine
+        """
+        if self.pool is not None:
+            with STAGE_LATENCY.time('embed'):
+                return self.pool.embed_tensors(batch)
+        with STAGE_LATENCY.time('embed'):
+            features = self._features(batch)
+        features = np.asarray(features, dtype=np.float32).reshape(len(batch), -1)
+        norms = np.linalg.norm(features, axis=1, keepdims=True)
+        return features / np.maximum(norms, 1e-12)
+    
+    def embed(self, image_bytes: Union[bytes, Image.Image]) -> np.ndarray:
+        """Embedding (D,) của một ảnh"""
+        return self.embed_tensors(self.load_tensor(image_bytes))[0]
+    
+    def _features(self, batch: np.ndarray) -> np.ndarray:
+        if self.framework == 'mock':
+            return self.model.features(batch)
+        if self._feature_extractor is None:
+            with self._feature_lock:
+                if self._feature_extractor is None:
+                    self._feature_extractor = self._build_feature_extractor()
+        return self._feature_extractor(batch)
+    
+    def _build_feature_extractor(self):
+        """Hàm batch -> output lớp áp chót cho từng framework"""
+        if self.framework == 'tensorflow':
+            # Layer cuối là Dense phân loại (sau dropout), lấy output của layer ngay trước
+            extractor = tf.keras.Model(self.model.inputs, self.model.layers[-2].output)
+            return lambda batch: extractor(batch, training=False).numpy()
+        
+        if self.framework == 'pytorch':
+            linear = [m for m in self.model.modules() if isinstance(m, torch.nn.Linear)]
+            if not linear:
+                raise RuntimeError("Model không có lớp Linear để lấy embedding")
+            model, capture = self.model, self._feature_capture
+            
+            # Hook ghi input của lớp Linear cuối vào thread-local của thread đang
+            # forward, chỉ khi thread đó đang lấy embedding (predict không bị ảnh hưởng)
+            def hook(module, inputs, output):
+                if getattr(capture, 'active', False):
+                    capture.value = inputs[0]
+            linear[-1].register_forward_hook(hook)
+            
+            def extract(batch: np.ndarray) -> np.ndarray:
+                capture.active = True
+                try:
+                    with torch.no_grad():
+                        model(torch.from_numpy(batch).float())
+                    return capture.value.numpy()
+                finally:
+                    capture.active = False
+                    capture.value = None
+            return extract
+        
+        if self.framework == 'onnx':
+            return self._onnx_feature_extractor()
+        raise RuntimeError(f"Framework {self.framework} không hỗ trợ embedding")
+    
+    def _onnx_feature_extractor(self):
+        """
+        Session thứ hai với thêm output là input của Gemm / MatMul cuối
+        (ONNX Runtime chỉ trả về được graph output)
+        """
+        import onnx
+        
+        graph_model = onnx.load(self.model_path)
+        graph = graph_model.graph
+        producers = {output: node for node in graph.node for output in node.output}
+        # Đi ngược từ output (qua Softmax, Flatten, ...) đến lớp fully-connected cuối
+        node = producers.get(graph.output[0].name)
+        while node is not None and node.op_type not in ('Gemm', 'MatMul'):
+            node = producers.get(node.input[0]) if node.input else None
+        if node is None:
+            raise RuntimeError("Không tìm thấy lớp Gemm / MatMul cuối trong model ONNX")
+        
+        feature_name = node.input[0]
+        graph.output.append(onnx.helper.make_tensor_value_info(feature_name, onnx.TensorProto.FLOAT, None))
+        session = self._onnx_session(graph_model.SerializeToString())
+        input_name, fixed_batch = self._onnx_input_name, self._onnx_fixed_batch
         
-        return img_array
+        def extract(batch: np.ndarray) -> np.ndarray:
+            batch = np.ascontiguousarray(batch, dtype=np.float32)
+            if fixed_batch and len(batch) > 1:
+                return np.concatenate([extract(row[None]) for row in batch], axis=0)
+            return session.run([feature_name], {input_name: batch})[0]
+        return extract
+    
+    def _run_cascade(self, batch: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Stage nhanh cho cả batch, chỉ các dòng chưa chắc chắn (top-1 < CASCADE_CONFIDENCE
+        hoặc top-1 - top-2 < CASCADE_MARGIN) mới chạy model chính trong một forward pass
+        
+        Returns:
+            (xác suất theo label (N, num_labels), mask (N,) các dòng do model chính trả lời)
+        """
+        fast = self.cascade or self
+        with STAGE_LATENCY.time('forward_fast'):
+            scores = fast._label_scores(fast._forward(self._cascade_input(batch)))
+        top1, margins = top_margins(scores)
+        full = (top1 < settings.CASCADE_CONFIDENCE) | (margins < settings.CASCADE_MARGIN)
+        if full.any():
+            with STAGE_LATENCY.time('forward'):
+                scores[full] = self._label_scores(self._forward(batch[full]))
+        return scores, full
+    
+    def _fixed_input_size(self) -> Optional[int]:
+        """Kích thước input cố định của model ONNX (None nếu H / W động)"""
+        if self.framework != 'onnx':
+            return None
+        height, width = (self._onnx_input_shape[axis] for axis in self._spatial_axes())
+        return height if isinstance(height, int) and height == width else None
+    
+    def _cascade_input(self, batch: np.ndarray) -> np.ndarray:
+        return downscale(batch, self._spatial_axes(), self.cascade_size)
+    
+    def _apply_tta(self, batch: np.ndarray, scores: np.ndarray,
+                   tta_margins: np.ndarray) -> np.ndarray:
+        """
+        Test-time augmentation cho các dòng chưa chắc chắn
+        
+        Dòng có margin top-1 - top-2 < ngưỡng được chạy thêm các view (flip,
+        crop) trong MỘT forward pass cho tất cả dòng và view, rồi lấy trung
+        bình xác suất với view gốc. Cập nhật `scores` tại chỗ.
+        
+        Returns:
+            Mask (N,) các dòng đã chạy TTA
+        """
+        escalate = top_margins(scores)[1] < tta_margins
+        if escalate.any():
+            views = tta_views(batch[escalate], self._spatial_axes(), settings.TTA_VIEWS)
+            num_views, rows = views.shape[:2]
+            view_scores = self._label_scores(
+                self._forward(views.reshape(num_views * rows, *views.shape[2:]))
+            ).reshape(num_views, rows, -1)
+            scores[escalate] = (scores[escalate] + view_scores.sum(axis=0)) / (num_views + 1)
+        return escalate
+    
+    def _spatial_axes(self) -> Tuple[int, int]:
+        """Trục (H, W) của tensor đầu vào model (batch NCHW hoặc NHWC)"""
+        if self.framework == 'pytorch' or (self.framework == 'onnx' and self.input_layout == 'NCHW'):
+            return 2, 3
+        return 1, 2
+    
+    def _record_results(self, results: List[Dict]) -> List[Dict]:
+        """Gắn version của model vào kết quả, đếm label top-1 và lỗi cho /metrics"""
+        for result in results:
+            if not result['success']:
+                PREDICTION_ERRORS.inc('forward')
+                continue
+            # Kết quả từ worker process đã có version của model trong worker
+            result.setdefault('model_version', self.version)
+            if self.framework == 'mock':
+                result['note'] = 'Mock prediction - No ML model loaded'
+            if 'tta' in result:
+                TTA_DECISIONS.inc('escalated' if result['tta'] else 'confident')
+            if 'stage' in result:
+                CASCADE_DECISIONS.inc(result['stage'])
+            if result['predictions']:
+                PREDICTED_LABELS.inc(result['predictions'][0]['label'])
+        return results
+    
+    def warmup(self, batch_sizes: List[int], iterations: int) -> Dict:
+        """
+        Chạy forward pass với ảnh tổng hợp ở từng batch size để framework chọn
+        kernel, cấp phát bộ nhớ, trace graph... trước khi nhận request thật
+        
+        Returns:
+            Thời gian (ms) decode và lần chạy đầu / cuối cho mỗi batch size
+        """
+        started = time.perf_counter()
+        rng = np.random.default_rng(0)
+        pixels = rng.integers(0, 256, (self.image_size, self.image_size, 3), dtype=np.uint8)
+        buf = io.BytesIO()
+        Image.fromarray(pixels).save(buf, format='JPEG')
+        
+        t = time.perf_counter()
+        sample = self.load_tensor(buf.getvalue())
+        timings: Dict = {'decode_ms': round((time.perf_counter() - t) * 1000, 1), 'batches': {}}
+        
+        for batch_size in sorted(set(batch_sizes)):
+            if self.framework == 'mock':
+                break
+            batch = np.repeat(sample, batch_size, axis=0)
+            runs = []
+            # Gọi trực tiếp _forward để warmup không bị tính vào /metrics
+            for _ in range(max(1, iterations)):
+                t = time.perf_counter()
+                if self.cascade_enabled:
+                    fast = self.cascade or self
+                    fast._forward(self._cascade_input(batch))
+                self._postprocess(self._label_scores(self._forward(batch)))
+                runs.append(round((time.perf_counter() - t) * 1000, 1))
+            timings['batches'][batch_size] = {'first_ms': runs[0], 'last_ms': runs[-1]}
+            if self.startup_timings['first_inference_ms'] is None:
+                self.startup_timings['first_inference_ms'] = runs[0]
+        
+        timings['total_ms'] = round((time.perf_counter() - started) * 1000, 1)
+        self.startup_timings['warmup_ms'] = timings['total_ms']
+        return timings
+    
+    def predict_batch(self, images: List[bytes], batch_size: int,
+                      tta: Optional[str] = None) -> List[Dict]:
+        """
+        Nhận diện nhiều ảnh, chạy forward pass theo từng batch cố định
+        
+        Args:
+            images: Danh sách ảnh dạng bytes
+            batch_size: Số ảnh tối đa trong một forward pass
+            tta: Chế độ TTA (off / auto / always), None = TTA_MODE
+            
+        Returns:
+            List kết quả theo đúng thứ tự input, ảnh lỗi decode có success=False
+        """
+        results: List[Optional[Dict]] = [None] * len(images)
+        # Ảnh được tiền xử lý thẳng vào buffer, dùng lại cho mọi batch của request
+        buffer = np.empty((max(1, min(batch_size, len(images))),) + self.preprocessor.shape, dtype=np.float32)
+        pending: List[int] = []
+        margin = tta_margin(tta)
+        
+        def flush():
+            batch = buffer[:len(pending)]
+            margins = np.full(len(batch), margin)
+            for idx, result in zip(pending, self.predict_tensors(batch, margins)):
+                results[idx] = result
+            pending.clear()
+        
+        for idx, image_bytes in enumerate(images):
+            try:
+                self.preprocess_into(self.decode(image_bytes), buffer[len(pending)])
+                pending.append(idx)
+            except Exception as e:
+                results[idx] = {'success': False, 'error': str(e), 'predictions': []}
+                continue
+            
+            if len(pending) >= batch_size:
+                flush()
+        
+        if pending:
+            flush()
+        
+        return results
     
     def predict(self, image_bytes: bytes) -> Dict:
         """
@@ -171,35 +866,7 @@ class FoodClassifier:
             Dict chứa predictions và thông tin
         """
         try:
-            # Load ảnh
-            image = Image.open(io.BytesIO(image_bytes))
-            
-            if self.framework == 'mock':
-                # Mock prediction cho demo
-                return self._mock_predict()
-            
-            # Preprocess
-            img_array = self.preprocess_image(image)
-            
-            # Predict
-            if self.framework == 'tensorflow':
-                predictions = self.model.predict(img_array, verbose=0)[0]
-            elif self.framework == 'pytorch':
-                with torch.no_grad():
-                    tensor = torch.from_numpy(img_array).float()
-                    outputs = self.model(tensor)
-                    predictions = torch.nn.functional.softmax(outputs, dim=1)[0].numpy()
-            
-            # Map predictions to labels
-            # Với pre-trained ImageNet model, ta mock mapping sang food labels
-            # Trong thực tế, cần train model với dataset món ăn Việt
-            results = self._map_predictions(predictions)
-            
-            return {
-                'success': True,
-                'predictions': results
-            }
-            
+            img_array = self.load_tensor(image_bytes)
         except Exception as e:
             print(f"Prediction error: {e}")
             return {
@@ -207,69 +874,221 @@ class FoodClassifier:
                 'error': str(e),
                 'predictions': []
             }
+        
+        return self.predict_tensors(img_array)[0]
     
-    def _map_predictions(self, predictions: np.ndarray) -> List[Dict]:
+    def _projection_for(self, num_classes: int) -> np.ndarray:
         """
-        Map predictions sang food labels
-        Đây là demo, trong thực tế model được train với food dataset
+        Ma trận chiếu (num_classes, num_labels) từ output class của model sang labels.json
+
+        - labels.json có "class_map" {label: [index output]}: dùng mapping đó
+        - Số class bằng số label (model train với food dataset): ma trận đơn vị
+        - Còn lại (pre-trained ImageNet demo): class i -> label i % num_labels
         """
-        import random
-        
-        # Simulate food classification results
-        # Random chọn một số labels với confidence ngẫu nhiên
-        results = []
-        
-        # Chọn top food ngẫu nhiên để demo
-        num_predictions = min(5, len(self.labels))
-        selected_indices = random.sample(range(len(self.labels)), num_predictions)
+        projection = self._projections.get(num_classes)
+        if projection is not None:
+            return projection
         
-        # Tạo confidence scores giảm dần
-        confidences = sorted([random.uniform(0.5, 0.98) for _ in range(num_predictions)], reverse=True)
+        num_labels = len(self.labels)
+        projection = np.zeros((num_classes, num_labels), dtype=np.float32)
+        if self.class_map:
+            for label_idx, label in enumerate(self.labels):
+                indices = [i for i in self.class_map.get(label, []) if 0 <= i < num_classes]
+                projection[indices, label_idx] = 1.0
+        elif num_classes == num_labels:
+            projection = np.eye(num_labels, dtype=np.float32)
+        else:
+            projection[np.arange(num_classes), np.arange(num_classes) % num_labels] = 1.0
         
-        for i, idx in enumerate(selected_indices):
-            label = self.labels[idx]
-            confidence = confidences[i]
-            
-            if confidence >= self.confidence_threshold:
-                results.append({
-                    'label': label,
-                    'confidence': round(confidence, 4),
-                    'rank': i + 1
-                })
+        self._projections[num_classes] = projection
+        return projection
+    
+    def _label_scores(self, outputs: np.ndarray) -> np.ndarray:
+        """
+        Output (N, num_classes) của model -> xác suất theo labels.json (N, num_labels)
+        Softmax (nếu output là logits) rồi chiếu sang labels.json
+        """
+        probs = _to_probabilities(outputs)
+        scores = probs @ self._projection_for(probs.shape[1])
+        # Class không thuộc món ăn nào bị bỏ, chuẩn hoá lại trên các label
+        totals = scores.sum(axis=1, keepdims=True)
+        return np.divide(scores, totals, out=np.zeros_like(scores), where=totals > 0)
+    
+    def _postprocess(self, scores: np.ndarray, top_k: Optional[int] = None) -> List[List[Dict]]:
+        """
+        Chuyển xác suất theo label (N, num_labels) thành top-k label cho cả batch
+
+        argpartition top-k -> mask theo confidence threshold, vectorized trên batch
+        """
+        k = min(top_k or settings.TOP_K, scores.shape[1])
+        top_idx = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(scores, top_idx, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind='stable')
+        top_idx = np.take_along_axis(top_idx, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+        keep = top_scores >= self.confidence_threshold
         
-        return results
+        labels = self.labels
+        return [
+            [
+                {'label': labels[idx], 'confidence': round(score, 4), 'rank': rank}
+                for rank, (idx, score) in enumerate(zip(row_idx, row_scores), start=1)
+            ]
+            for row_idx, row_scores in (
+                (idx_row[mask_row].tolist(), score_row[mask_row].tolist())
+                for idx_row, score_row, mask_row in zip(top_idx, top_scores, keep)
+            )
+        ]
+
+
+def warmup_batch_sizes() -> List[int]:
+    """
+    Batch size cần warmup: WARMUP_BATCH_SIZES nếu được cấu hình, nếu không thì
+    các luỹ thừa của 2 đến BATCH_MAX_SIZE và BATCH_PREDICT_SIZE
+    """
+    if settings.WARMUP_BATCH_SIZES:
+        return sorted(set(settings.WARMUP_BATCH_SIZES))
+    sizes = {1, settings.BATCH_PREDICT_SIZE}
+    size = 1
+    while size < settings.BATCH_MAX_SIZE:
+        size *= 2
+        sizes.add(min(size, settings.BATCH_MAX_SIZE))
+    return sorted(sizes)
+
+
+TTA_MODES = ('off', 'auto', 'always')
+
+
+def tta_margin(mode: Optional[str]) -> float:
+    """
+    Ngưỡng margin (top-1 - top-2) để chạy TTA theo chế độ
     
-    def _mock_predict(self) -> Dict:
-        """Mock prediction khi không có ML framework"""
-        import random
-        
-        # Random chọn món ăn
-        num_results = random.randint(1, 3)
-        selected = random.sample(self.labels, num_results)
-        
-        results = []
-        for i, label in enumerate(selected):
-            confidence = max(0.5, 0.95 - (i * 0.15) + random.uniform(-0.1, 0.1))
-            results.append({
-                'label': label,
-                'confidence': round(confidence, 4),
-                'rank': i + 1
-            })
-        
-        return {
-            'success': True,
-            'predictions': results,
-            'note': 'Mock prediction - No ML model loaded'
-        }
+    - off: không bao giờ (-1), auto: TTA_MARGIN, always: luôn chạy (inf)
+    - None: theo TTA_MODE
+    """
+    mode = (mode or settings.TTA_MODE).lower()
+    if mode not in TTA_MODES:
+        raise ValueError(f"TTA mode không hợp lệ: {mode} (chọn một trong {', '.join(TTA_MODES)})")
+    if mode == 'off':
+        return -1.0
+    if mode == 'always':
+        return float('inf')
+    return settings.TTA_MARGIN
+
+
+def tta_views(batch: np.ndarray, axes: Tuple[int, int], views: List[str],
+              crop_scale: float = 0.875) -> np.ndarray:
+    """
+    Tạo các view augment từ batch tensor đã tiền xử lý (không cần decode lại ảnh)
+    
+    - hflip / vflip: lật theo trục W / H
+    - crops: crop giữa + 4 góc (crop_scale cạnh ảnh), phóng lại về kích thước cũ
+      bằng nearest-neighbor index
+    
+    Returns:
+        Mảng (num_views, N, ...) cùng shape từng view với batch
+    """
+    h_axis, w_axis = axes
+    result = []
+    if 'hflip' in views:
+        result.append(np.flip(batch, axis=w_axis))
+    if 'vflip' in views:
+        result.append(np.flip(batch, axis=h_axis))
+    if 'crops' in views:
+        height, width = batch.shape[h_axis], batch.shape[w_axis]
+        crop_h, crop_w = int(height * crop_scale), int(width * crop_scale)
+        # Index nearest-neighbor để phóng crop (crop_h, crop_w) về (height, width)
+        rows = (np.arange(height) * crop_h / height).astype(np.intp)
+        cols = (np.arange(width) * crop_w / width).astype(np.intp)
+        offsets = [
+            ((height - crop_h) // 2, (width - crop_w) // 2),
+            (0, 0), (0, width - crop_w), (height - crop_h, 0), (height - crop_h, width - crop_w)
+        ]
+        for top, left in offsets:
+            view = np.take(batch, rows + top, axis=h_axis)
+            result.append(np.take(view, cols + left, axis=w_axis))
+    if not result:
+        raise ValueError("TTA_VIEWS rỗng")
+    return np.ascontiguousarray(np.stack(result))
+
+
+def top_margins(scores: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Xác suất top-1 và margin top-1 - top-2 của từng dòng (N, num_labels)"""
+    if scores.shape[1] == 1:
+        return scores[:, 0], scores[:, 0]
+    top2 = np.partition(scores, -2, axis=1)[:, -2:]
+    return top2[:, 1], top2[:, 1] - top2[:, 0]
+
+
+def downscale(batch: np.ndarray, axes: Tuple[int, int], size: int) -> np.ndarray:
+    """
+    Thu nhỏ batch tensor đã tiền xử lý về size x size trên trục (H, W)
+    Lấy mẫu nearest-neighbor theo tâm pixel, đủ cho stage nhanh của cascade
+    """
+    height, width = batch.shape[axes[0]], batch.shape[axes[1]]
+    if height == size and width == size:
+        return batch
+    rows = ((np.arange(size) + 0.5) * height / size).astype(np.intp)
+    cols = ((np.arange(size) + 0.5) * width / size).astype(np.intp)
+    return batch.take(rows, axis=axes[0]).take(cols, axis=axes[1])
+
+
+def decode_image(image_bytes: bytes, target_size: int, fast: bool = True) -> Image.Image:
+    """
+    Mở ảnh từ bytes
+    
+    Với JPEG và fast=True, dùng Image.draft để libjpeg scale trong miền DCT
+    (1/2, 1/4, 1/8) khi decode, nên ảnh 12MP chỉ được giải mã ở kích thước
+    gần target_size thay vì full resolution. Ảnh trả về luôn >= target_size.
+    """
+    image = Image.open(io.BytesIO(image_bytes))
+    if fast and image.format == 'JPEG':
+        image.draft('RGB', (target_size, target_size))
+    return image
+
+
+def _softmax(logits: np.ndarray) -> np.ndarray:
+    """Softmax ổn định số học theo trục class"""
+    shifted = logits - logits.max(axis=1, keepdims=True)
+    exp = np.exp(shifted)
+    return exp / exp.sum(axis=1, keepdims=True)
+
+
+def _to_probabilities(outputs: np.ndarray) -> np.ndarray:
+    """
+    Model PyTorch / ONNX export từ PyTorch trả về logits, Keras đã có softmax:
+    chỉ áp softmax khi output chưa phải phân phối xác suất
+    """
+    outputs = np.asarray(outputs, dtype=np.float32)
+    if outputs.min() < 0 or not np.allclose(outputs.sum(axis=1), 1.0, atol=1e-3):
+        return _softmax(outputs)
+    return outputs
 
 
 # Singleton instance
 _classifier: Optional[FoodClassifier] = None
+_classifier_lock = threading.Lock()
 
 
 def get_classifier() -> FoodClassifier:
-    """Get or create classifier instance"""
+    """
+    Get or create classifier instance
+
+    Request nên gọi một lần và giữ reference đến hết request: khi hot reload
+    swap sang model mới, request đang chạy vẫn hoàn thành trên model cũ.
+    """
     global _classifier
     if _classifier is None:
-        _classifier = FoodClassifier()
+        with _classifier_lock:
+            if _classifier is None:
+                # Worker pool: weights chỉ load trong worker process
+                _classifier = FoodClassifier(load_weights=settings.WORKER_PROCESSES <= 0)
     return _classifier
+
+
+def swap_classifier(classifier: FoodClassifier) -> Optional[FoodClassifier]:
+    """Thay classifier đang phục vụ (atomic), trả về classifier cũ"""
+    global _classifier
+    with _classifier_lock:
+        old, _classifier = _classifier, classifier
+    return old
@@ -0,0 +1,212 @@
+"""
+Registry nhiều model phục vụ song song (/predict?model=...)
+
+Model mặc định là classifier của get_classifier() (MODEL_PATH, hot reload), luôn
+được giữ trong RAM. Các model khai báo trong MODELS (vd model chuyên vùng miền,
+model món chay, model ứng viên) được load khi có request đầu tiên; tổng RAM ước
+lượng của các model đã load vượt MODEL_MEMORY_BUDGET_MB thì model ít được dùng
+gần đây nhất bị giải phóng (load lại ở lần dùng sau).
+
+Model phụ chạy forward pass trong process FastAPI (không qua worker pool), không
+bật cascade và không dùng prediction cache.
+"""
+import asyncio
+import gc
+import os
+import time
+import weakref
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from config import settings
+from metrics import MODEL_REQUESTS, process_rss_bytes
+from model import DEMO_ARCHS, FoodClassifier, get_classifier
+
+DEFAULT_MODEL = 'default'
+
+
+class UnknownModelError(KeyError):
+    """Tên / version model không có trong registry"""
+
+
+class _Entry:
+    """Một model khai báo trong MODELS, classifier = None khi chưa load hoặc đã bị evict"""
+
+    def __init__(self, name: str, model_path: str, labels_path: Optional[str]):
+        self.name = name
+        self.model_path = model_path
+        self.labels_path = labels_path
+        self.classifier: Optional[FoodClassifier] = None
+        self.memory_bytes = 0
+        self.rss_delta_bytes: Optional[int] = None
+        self.load_ms: Optional[float] = None
+        self.loads = 0
+        self.evictions = 0
+        self.last_used: Optional[float] = None
+
+
+class ModelRegistry:
+    """
+    Tra model theo tên hoặc version, lazy load + LRU eviction theo RAM budget
+
+    Request giữ reference đến classifier trong suốt request, nên model bị evict
+    giữa chừng vẫn hoàn thành request rồi mới được giải phóng.
+    """
+
+    def __init__(self, models: Dict[str, Dict[str, str]], memory_budget_mb: float):
+        self.memory_budget_mb = memory_budget_mb
+        self.memory_budget = int(memory_budget_mb * 1024 * 1024)
+        self._entries: Dict[str, _Entry] = {}
+        for name, spec in models.items():
+            if name == DEFAULT_MODEL:
+                raise ValueError(f"Tên model '{DEFAULT_MODEL}' dành cho MODEL_PATH")
+            if not spec.get('model_path'):
+                raise ValueError(f"MODELS['{name}'] thiếu model_path")
+            self._entries[name] = _Entry(name, spec['model_path'], spec.get('labels_path'))
+        # Thứ tự dùng gần nhất của các model đang load (cuối = mới nhất)
+        self._loaded: "OrderedDict[str, _Entry]" = OrderedDict()
+        # Load tuần tự: tránh hai request cùng load một model và đo RSS lẫn nhau
+        self._load_lock: Optional[asyncio.Lock] = None
+
+    def _find(self, model: str) -> Optional[_Entry]:
+        """Entry theo tên hoặc version của model đang load"""
+        if model in self._entries:
+            return self._entries[model]
+        for entry in self._loaded.values():
+            if entry.classifier is not None and entry.classifier.version == model:
+                return entry
+        return None
+
+    async def get(self, model: Optional[str] = None) -> FoodClassifier:
+        """
+        Classifier cho tên / version model, None = model mặc định
+
+        Raises:
+            UnknownModelError: model không có trong registry
+        """
+        default = get_classifier()
+        if not model or model in (DEFAULT_MODEL, default.version):
+            MODEL_REQUESTS.inc(DEFAULT_MODEL)
+            return default
+
+        entry = self._find(model)
+        if entry is None:
+            raise UnknownModelError(model)
+        classifier = entry.classifier
+        if classifier is None:
+            classifier = await self._load(entry)
+        else:
+            self._loaded.move_to_end(entry.name)
+        entry.last_used = time.time()
+        MODEL_REQUESTS.inc(entry.name)
+        return classifier
+
+    async def _load(self, entry: _Entry) -> FoodClassifier:
+        if self._load_lock is None:
+            self._load_lock = asyncio.Lock()
+        async with self._load_lock:
+            if entry.classifier is not None:
+                # Request khác vừa load xong
+                self._loaded.move_to_end(entry.name)
+                return entry.classifier
+
+            arch = entry.model_path.lower() if entry.model_path.lower() in DEMO_ARCHS else None
+            if arch is None and not os.path.exists(entry.model_path):
+                raise FileNotFoundError(f"Không tìm thấy model {entry.model_path}")
+            print(f"🔄 Loading model '{entry.name}' from {entry.model_path}...")
+            started = time.perf_counter()
+            rss_before = process_rss_bytes()
+            # Load ngoài event loop và ngoài InferenceExecutor như hot reload
+            classifier = await asyncio.to_thread(
+                FoodClassifier, entry.model_path, entry.labels_path, arch, False
+            )
+            classifier.use_prediction_cache = False
+            rss_after = process_rss_bytes()
+
+            entry.classifier = classifier
+            entry.memory_bytes = classifier.memory_bytes()
+            entry.rss_delta_bytes = rss_after - rss_before if rss_before is not None and rss_after is not None else None
+            entry.load_ms = round((time.perf_counter() - started) * 1000, 1)
+            entry.loads += 1
+            self._loaded[entry.name] = entry
+            print(f"✓ Model '{entry.name}' loaded: {classifier.framework} {classifier.version} "
+                  f"({entry.load_ms:.0f}ms, ~{entry.memory_bytes / 1024 / 1024:.0f}MB)")
+            self._evict(keep=entry.name)
+            return classifier
+
+    def _used_bytes(self) -> int:
+        return get_classifier().memory_bytes() + sum(entry.memory_bytes for entry in self._loaded.values())
+
+    def _evict(self, keep: str):
+        """Giải phóng model ít dùng gần đây nhất đến khi tổng RAM <= budget"""
+        if self.memory_budget <= 0:
+            return
+        evicted = False
+        while self._used_bytes() > self.memory_budget:
+            name = next((name for name in self._loaded if name != keep), None)
+            if name is None:
+                print(f"⚠️ Model '{keep}' vượt MODEL_MEMORY_BUDGET_MB, vẫn giữ để phục vụ request")
+                break
+            entry = self._loaded.pop(name)
+            version = entry.classifier.version
+            # Weights được giải phóng khi request cuối cùng dùng model này xong
+            weakref.finalize(entry.classifier, print, f"✓ Freed model '{name}' ({version})")
+            entry.classifier = None
+            entry.memory_bytes = 0
+            entry.evictions += 1
+            evicted = True
+            print(f"⚠️ Evicted model '{name}' (LRU, RAM budget {self.memory_budget_mb:g}MB)")
+        if evicted:
+            gc.collect()
+
+    def stats(self) -> Dict:
+        requests = {key[0]: int(value) for key, value in MODEL_REQUESTS.values().items()}
+        default = get_classifier()
+        models = [{
+            'name': DEFAULT_MODEL,
+            'model_path': default.model_path,
+            'loaded': True,
+            'version': default.version,
+            'framework': default.framework,
+            'load_ms': default.startup_timings['load_ms'],
+            'memory_mb': round(default.memory_bytes() / 1024 / 1024, 1),
+            'rss_delta_mb': None,
+            'requests': requests.get(DEFAULT_MODEL, 0),
+            'loads': 1,
+            'evictions': 0,
+            'last_used': None
+        }]
+        for entry in self._entries.values():
+            classifier = entry.classifier
+            models.append({
+                'name': entry.name,
+                'model_path': entry.model_path,
+                'loaded': classifier is not None,
+                'version': classifier.version if classifier is not None else None,
+                'framework': classifier.framework if classifier is not None else None,
+                'load_ms': entry.load_ms,
+                'memory_mb': round(entry.memory_bytes / 1024 / 1024, 1),
+                'rss_delta_mb': round(entry.rss_delta_bytes / 1024 / 1024, 1) if entry.rss_delta_bytes is not None else None,
+                'requests': requests.get(entry.name, 0),
+                'loads': entry.loads,
+                'evictions': entry.evictions,
+                'last_used': entry.last_used
+            })
+        return {
+            'memory_budget_mb': self.memory_budget_mb,
+            'memory_used_mb': round(self._used_bytes() / 1024 / 1024, 1),
+            'loaded': [DEFAULT_MODEL] + list(self._loaded),
+            'models': models
+        }
+
+
+# Singleton instance
+_registry: Optional[ModelRegistry] = None
+
+
+def get_model_registry() -> ModelRegistry:
+    """Get or create registry instance"""
+    global _registry
+    if _registry is None:
+        _registry = ModelRegistry(settings.MODELS, settings.MODEL_MEMORY_BUDGET_MB)
+    return _registry
@@ -0,0 +1,211 @@
+"""
+Hot reload model không downtime
+Load model + labels mới ở background, warmup, rồi swap atomic classifier mà
+get_classifier() trả về. Request đang chạy vẫn hoàn thành trên model cũ, weights
+cũ được giải phóng khi request cuối cùng giữ reference kết thúc.
+"""
+import asyncio
+import gc
+import os
+import time
+import weakref
+from typing import Dict, List, Optional, Tuple
+
+from config import settings
+from model import FoodClassifier, get_classifier, swap_classifier, warmup_batch_sizes
+from worker_pool import get_worker_pool
+
+
+class ReloadInProgressError(Exception):
+    """Đang có một lần reload khác chạy"""
+
+
+def _file_signature(path: str) -> Optional[Tuple[int, int]]:
+    """(size, mtime) của file, None nếu không tồn tại"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+class ModelReloader:
+    """
+    Quản lý hot reload model
+
+    - reload(): load + warmup model mới trong thread riêng rồi swap
+    - Watcher (MODEL_WATCH_INTERVAL > 0): poll mtime của file model / labels,
+      file đổi và đã ghi xong (2 lần poll giống nhau) thì tự reload
+    """
+
+    def __init__(self, watch_interval: float):
+        self.watch_interval = watch_interval
+        self._lock: Optional[asyncio.Lock] = None
+        self._task: Optional[asyncio.Task] = None
+
+        self.reloading = False
+        self.reloads = 0
+        self.last_error: Optional[str] = None
+        self.history: List[Dict] = []
+
+    @property
+    def watching(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self):
+        """Bật file watcher nếu được cấu hình"""
+        if self.watch_interval > 0 and not self.watching:
+            self._task = asyncio.create_task(self._watch())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def reload(self, model_path: Optional[str] = None,
+                     labels_path: Optional[str] = None) -> Dict:
+        """
+        Load model mới và swap sang phục vụ request
+
+        Args:
+            model_path / labels_path: file mới, mặc định dùng lại file của model hiện tại
+
+        Raises:
+            ReloadInProgressError: đang có lần reload khác chạy
+        """
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        if self._lock.locked():
+            raise ReloadInProgressError("Model đang được reload")
+
+        async with self._lock:
+            self.reloading = True
+            try:
+                return await self._reload(model_path, labels_path)
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"⚠️ Model reload failed: {e}")
+                raise
+            finally:
+                self.reloading = False
+
+    async def _reload(self, model_path: Optional[str], labels_path: Optional[str]) -> Dict:
+        current = get_classifier()
+        model_path = model_path or current.model_path
+        labels_path = labels_path or current.labels_path
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"Không tìm thấy model {model_path}")
+
+        started = time.perf_counter()
+        print(f"🔄 Reloading model from {model_path}...")
+        pool = get_worker_pool()
+        use_pool = pool is not None and current.pool is not None
+        # Load ngoài event loop và ngoài InferenceExecutor để không chiếm slot inference
+        # (process pool: process này chỉ load labels, weights nằm trong worker)
+        classifier = await asyncio.to_thread(
+            FoodClassifier, model_path, labels_path, None, None, not use_pool
+        )
+
+        if use_pool:
+            # Process pool: các worker tự load + warmup model mới (rolling restart)
+            await asyncio.to_thread(pool.reload, model_path, labels_path)
+            classifier.attach_pool(pool)
+            warmup = {w["id"]: w["warmup_ms"] for w in pool.stats()["processes"]}
+        elif settings.WARMUP_ENABLED:
+            timings = await asyncio.to_thread(
+                classifier.warmup, warmup_batch_sizes(), settings.WARMUP_ITERATIONS
+            )
+            warmup = timings['total_ms']
+        else:
+            warmup = None
+
+        old = swap_classifier(classifier)
+        event = {
+            'version': classifier.version,
+            'previous_version': old.version if old is not None else None,
+            'model_path': model_path,
+            'labels_path': labels_path,
+            'framework': classifier.framework,
+            'load_ms': classifier.startup_timings['load_ms'],
+            'warmup': warmup,
+            'total_ms': round((time.perf_counter() - started) * 1000, 1),
+            'reloaded_at': classifier.loaded_at
+        }
+        self.reloads += 1
+        self.last_error = None
+        self.history = (self.history + [event])[-10:]
+        print(f"✓ Model swapped: {event['previous_version']} -> {classifier.version} "
+              f"({event['total_ms']:.0f}ms)")
+
+        if old is not None:
+            # Weights cũ được giải phóng khi request cuối cùng dùng model cũ xong
+            version = old.version
+            weakref.finalize(old, print, f"✓ Freed model {version}")
+            del old, current
+            gc.collect()
+        return event
+
+    async def _watch(self):
+        """Poll file model / labels, reload khi có thay đổi"""
+        def signature(classifier: FoodClassifier):
+            return _file_signature(classifier.model_path), _file_signature(classifier.labels_path)
+
+        classifier = get_classifier()
+        # (version, chữ ký file) của model đang phục vụ
+        known = (classifier.version, signature(classifier))
+        pending = None
+        while True:
+            await asyncio.sleep(self.watch_interval)
+            classifier = get_classifier()
+            current = signature(classifier)
+            if known[0] != classifier.version:
+                # Model đã được reload qua admin endpoint
+                known, pending = (classifier.version, current), None
+                continue
+            if current == known[1] or current[0] is None:
+                pending = None
+                continue
+            if current != pending:
+                # File vừa đổi, có thể đang được ghi dở -> chờ lần poll sau
+                pending = current
+                continue
+
+            pending = None
+            try:
+                await self.reload()
+            except ReloadInProgressError:
+                continue  # Thử lại ở lần poll sau
+            except Exception:
+                # Đã log trong reload(), tiếp tục phục vụ model cũ đến khi file đổi tiếp
+                known = (classifier.version, current)
+
+    def stats(self) -> Dict:
+        classifier = get_classifier()
+        return {
+            'version': classifier.version,
+            'framework': classifier.framework,
+            'model_path': classifier.model_path,
+            'labels_path': classifier.labels_path,
+            'loaded_at': classifier.loaded_at,
+            'reloading': self.reloading,
+            'watching': self.watching,
+            'reloads': self.reloads,
+            'last_error': self.last_error,
+            'history': self.history
+        }
+
+
+# Singleton instance
+_reloader: Optional[ModelReloader] = None
+
+
+def get_model_reloader() -> ModelReloader:
+    """Get or create reloader instance"""
+    global _reloader
+    if _reloader is None:
+        _reloader = ModelReloader(watch_interval=settings.MODEL_WATCH_INTERVAL)
+    return _reloader
@@ -0,0 +1,202 @@
+"""
+Near-duplicate prediction cache
+Camera gửi nhiều frame gần giống nhau của cùng một món; cache kết quả theo
+perceptual hash (dHash 64-bit) để bỏ qua forward pass cho các frame đó.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from config import settings
+
+
+HASH_SIZE = 8  # dHash 8x8 = 64 bit
+
+
+def dhash(image: Image.Image, hash_size: int = HASH_SIZE) -> int:
+    """
+    Difference hash: thumbnail grayscale (hash_size+1) x hash_size,
+    mỗi bit = pixel bên trái sáng hơn pixel bên phải
+    """
+    thumb = image.convert('L').resize((hash_size + 1, hash_size), Image.BILINEAR)
+    pixels = np.asarray(thumb, dtype=np.int16)
+    bits = (pixels[:, :-1] > pixels[:, 1:]).ravel()
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count('1')
+
+
+class PredictionCache:
+    """
+    LRU cache (có TTL) kết quả predict theo dHash
+
+    - `max_distance` > 0: frame có hash lệch <= max_distance bit vẫn được coi là trùng
+    - Key gồm cả ngưỡng TTA của request (xem model.tta_margin): kết quả không TTA
+      không được trả cho request ?tta=always và ngược lại
+    - Key gồm cả version của model/labels: ngay sau hot reload, request của model
+      cũ và mới cùng dùng cache mà không xoá kết quả của nhau; entry của version
+      cũ tự bị đẩy ra theo LRU / TTL
+    """
+
+    def __init__(self, max_size: int, ttl_seconds: float, max_distance: int, enabled: bool = True):
+        self.enabled = enabled and max_size > 0
+        self.max_size = max_size
+        self.ttl = ttl_seconds
+        self.max_distance = max_distance
+
+        # (hash, tta_margin, version) -> (result, expires_at)
+        self._entries: "OrderedDict[Tuple[int, float, str], Tuple[Dict, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.hash_time_ms = 0.0
+
+    def get(self, image_hash: int, version: str, tta_margin: float = -1.0) -> Optional[Dict]:
+        """Tìm kết quả cho hash (chính xác hoặc gần đúng trong max_distance bit) cùng ngưỡng TTA và version"""
+        now = time.monotonic()
+        with self._lock:
+            key = (image_hash, tta_margin, version)
+            if not self._live(key, now):
+                key = self._nearest(image_hash, tta_margin, version, now) if self.max_distance > 0 else None
+
+            if key is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            if key[0] == image_hash:
+                self.hits += 1
+            else:
+                self.near_hits += 1
+            return self._entries[key][0]
+
+    def _live(self, key: Tuple[int, float, str], now: float) -> bool:
+        """Entry có trong cache và còn hạn (entry hết hạn bị xoá)"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return False
+        if entry[1] <= now:
+            del self._entries[key]
+            self.expirations += 1
+            return False
+        return True
+
+    def _nearest(self, image_hash: int, tta_margin: float, version: str,
+                 now: float) -> Optional[Tuple[int, float, str]]:
+        """Entry còn hạn gần nhất trong max_distance bit, entry hết hạn gặp khi quét bị xoá"""
+        key, best = None, self.max_distance + 1
+        expired = []
+        for candidate, (_, expires_at) in self._entries.items():
+            if candidate[1] != tta_margin or candidate[2] != version:
+                continue
+            if expires_at <= now:
+                expired.append(candidate)
+                continue
+            distance = hamming(candidate[0], image_hash)
+            if distance < best:
+                key, best = candidate, distance
+        for candidate in expired:
+            del self._entries[candidate]
+        self.expirations += len(expired)
+        return key
+
+    def put(self, image_hash: int, version: str, result: Dict, tta_margin: float = -1.0):
+        """Lưu kết quả thành công, evict entry ít dùng nhất khi đầy"""
+        if not result.get('success'):
+            return
+        key = (image_hash, tta_margin, version)
+        with self._lock:
+            self._entries[key] = (result, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def prepare(self, classifier, image_bytes: bytes,
+                tta_margin: float = -1.0) -> Tuple[Optional[int], Optional[Dict], Optional[np.ndarray]]:
+        """
+        Decode ảnh một lần, tính hash từ ảnh đã decode và tra cache
+
+        Args:
+            tta_margin: Ngưỡng TTA của request, thuộc key cache
+
+        Returns:
+            (hash, kết quả cache, None) nếu hit,
+            (hash, None, tensor đã tiền xử lý) nếu miss
+        """
+        image = classifier.decode(image_bytes)
+        if not self.enabled or not classifier.use_prediction_cache:
+            return None, None, classifier.preprocess_image(image)
+
+        started = time.perf_counter()
+        image_hash = dhash(image)
+        self.hash_time_ms += (time.perf_counter() - started) * 1000
+
+        cached = self.get(image_hash, classifier.version, tta_margin)
+        if cached is not None:
+            return image_hash, cached, None
+        return image_hash, None, classifier.preprocess_image(image)
+
+    def predict(self, classifier, image_bytes: bytes, tta_margins: Optional[np.ndarray] = None) -> Dict:
+        """FoodClassifier.predict có cache (dùng khi tắt micro-batching)"""
+        margin = float(tta_margins[0]) if tta_margins is not None else -1.0
+        try:
+            image_hash, cached, tensor = self.prepare(classifier, image_bytes, margin)
+        except Exception as e:
+            print(f"Prediction error: {e}")
+            return {'success': False, 'error': str(e), 'predictions': []}
+
+        if cached is not None:
+            return cached
+
+        result = classifier.predict_tensors(tensor, tta_margins)[0]
+        if image_hash is not None:
+            self.put(image_hash, classifier.version, result, margin)
+        return result
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.near_hits + self.misses
+        return {
+            'enabled': self.enabled,
+            'size': len(self._entries),
+            'max_size': self.max_size,
+            'ttl_seconds': self.ttl,
+            'max_distance': self.max_distance,
+            'hits': self.hits,
+            'near_hits': self.near_hits,
+            'misses': self.misses,
+            'hit_rate': round((self.hits + self.near_hits) / lookups, 4) if lookups else 0.0,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'avg_hash_ms': round(self.hash_time_ms / lookups, 4) if lookups else 0.0
+        }
+
+
+# Singleton instance
+_cache: Optional[PredictionCache] = None
+
+
+def get_prediction_cache() -> PredictionCache:
+    """Get or create cache instance"""
+    global _cache
+    if _cache is None:
+        _cache = PredictionCache(
+            max_size=settings.CACHE_MAX_SIZE,
+            ttl_seconds=settings.CACHE_TTL_SECONDS,
+            max_distance=settings.CACHE_MAX_DISTANCE,
+            enabled=settings.CACHE_ENABLED
+        )
+    return _cache
@@ -0,0 +1,110 @@
+"""
+Tiền xử lý ảnh không cấp phát tạm
+
+Ảnh PIL đã resize -> uint8 HWC -> ghi thẳng vào tensor float32 đích (CHW hoặc
+HWC) trong một lượt: chuẩn hoá ImageNet gộp thành một phép nhân-cộng float32
+mỗi kênh (x * scale + bias), không qua float64, transpose hay expand_dims.
+Đích có thể là một dòng trong batch buffer cấp phát sẵn (BufferPool).
+"""
+import threading
+from typing import List, Tuple
+
+import numpy as np
+from PIL import Image
+
+
+IMAGENET_MEAN = (0.485, 0.456, 0.406)
+IMAGENET_STD = (0.229, 0.224, 0.225)
+# Filter resize (mặc định của Pillow), backend dùng cùng filter khi tự resize
+# ảnh thành tensor uint8 (app/core/ai_client.py image_to_tensor)
+RESAMPLE = Image.BICUBIC
+
+
+class Preprocessor:
+    """
+    Tiền xử lý cho một model
+
+    - layout 'NCHW' + normalize: chuẩn hoá ImageNet (PyTorch, ONNX export từ PyTorch)
+    - layout 'NHWC', không normalize: pixel 0-255 float32 (Keras EfficientNet /
+      MobileNetV3 tự rescale trong model, ONNX export từ TF, mock)
+    """
+
+    def __init__(self, size: int, layout: str = 'NCHW', normalize: bool = True):
+        self.size = size
+        self.layout = layout
+        self.normalize = normalize
+        self.shape: Tuple[int, int, int] = (3, size, size) if layout == 'NCHW' else (size, size, 3)
+        # (x / 255 - mean) / std = x * scale + bias, tính sẵn bằng float32
+        std = np.asarray(IMAGENET_STD, dtype=np.float64)
+        self._scale = (1.0 / (255.0 * std)).astype(np.float32)
+        self._bias = (-np.asarray(IMAGENET_MEAN, dtype=np.float64) / std).astype(np.float32)
+
+    def pixels(self, image: Image.Image) -> np.ndarray:
+        """Ảnh PIL -> uint8 (size, size, 3), chỉ resize / convert khi cần"""
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        if image.size != (self.size, self.size):
+            image = image.resize((self.size, self.size), RESAMPLE)
+        return np.asarray(image)
+
+    def into(self, image: Image.Image, out: np.ndarray) -> np.ndarray:
+        """Ghi ảnh đã tiền xử lý vào out (shape self.shape, float32), trả về out"""
+        pixels = self.pixels(image)
+        if self.layout == 'NCHW':
+            for c in range(3):
+                # uint8 -> float32 được ufunc cast theo từng khối nhỏ, không tạo mảng tạm
+                channel = out[c]
+                if self.normalize:
+                    np.multiply(pixels[:, :, c], self._scale[c], out=channel, casting='unsafe')
+                    channel += self._bias[c]
+                else:
+                    np.copyto(channel, pixels[:, :, c], casting='unsafe')
+        elif self.normalize:
+            np.multiply(pixels, self._scale, out=out, casting='unsafe')
+            out += self._bias
+        else:
+            np.copyto(out, pixels, casting='unsafe')
+        return out
+
+    def __call__(self, image: Image.Image) -> np.ndarray:
+        """Tensor (1, ...) float32 mới cho một ảnh"""
+        out = np.empty((1,) + self.shape, dtype=np.float32)
+        self.into(image, out[0])
+        return out
+
+
+class BufferPool:
+    """
+    Các batch buffer (max_batch, ...) float32 dùng lại giữa các batch
+
+    Mỗi batch đang chạy giữ một buffer (acquire / release), buffer thiếu thì cấp
+    phát thêm; giữ lại tối đa `keep` buffer rảnh.
+    """
+
+    def __init__(self, shape: Tuple[int, ...], max_batch: int, keep: int = 4):
+        self.shape = tuple(shape)
+        self.max_batch = max_batch
+        self.keep = keep
+        self._free: List[np.ndarray] = []
+        self._lock = threading.Lock()
+        self.allocated = 0
+
+    def acquire(self, n: int) -> np.ndarray:
+        """View (n, ...) của một buffer rảnh (n > max_batch thì cấp phát riêng)"""
+        if n > self.max_batch:
+            return np.empty((n,) + self.shape, dtype=np.float32)
+        with self._lock:
+            buffer = self._free.pop() if self._free else None
+        if buffer is None:
+            buffer = np.empty((self.max_batch,) + self.shape, dtype=np.float32)
+            self.allocated += 1
+        return buffer[:n]
+
+    def release(self, batch: np.ndarray):
+        """Trả buffer (view từ acquire) về pool"""
+        buffer = batch.base if batch.base is not None else batch
+        if buffer.shape != (self.max_batch,) + self.shape:
+            return
+        with self._lock:
+            if len(self._free) < self.keep:
+                self._free.append(buffer)
@@ -0,0 +1,100 @@
+"""
+Priority lane + deadline cho hàng đợi inference
+
+Backend gửi kèm mỗi request:
+    X-Priority: interactive | standard | batch
+    X-Deadline-Ms: thời gian (ms, tính từ lúc AI server nhận request) mà sau đó
+                   kết quả không còn dùng được
+
+Lane + deadline của request được giữ trong contextvar (middleware set, WebSocket
+camera set là interactive), InferenceExecutor và MicroBatcher đọc để:
+- cấp slot inference theo lane trước (interactive > standard > batch), trong
+  cùng lane thì deadline sớm hơn trước
+- bỏ request đã hết hạn trước khi tới model (504)
+"""
+import contextvars
+import time
+from typing import Optional
+
+from metrics import DEADLINE_DROPS
+
+LANES = ('interactive', 'standard', 'batch')  # thứ tự = độ ưu tiên
+PRIORITY_HEADER = 'X-Priority'
+DEADLINE_HEADER = 'X-Deadline-Ms'
+
+
+class DeadlineExceededError(Exception):
+    """Request hết hạn trước khi tới model, server trả 504"""
+
+    def __init__(self, lane: str):
+        super().__init__(f"Request ({lane}) đã quá deadline trước khi được xử lý")
+        self.lane = lane
+
+
+class RequestClass:
+    """Lane và deadline (time.perf_counter) của một request"""
+
+    __slots__ = ('lane', 'deadline')
+
+    def __init__(self, lane: str = 'standard', deadline: Optional[float] = None):
+        self.lane = lane
+        self.deadline = deadline
+
+    @property
+    def priority(self) -> int:
+        return LANES.index(self.lane)
+
+    def expired(self, now: Optional[float] = None) -> bool:
+        return self.deadline is not None and (now or time.perf_counter()) >= self.deadline
+
+    def check(self):
+        """Raise DeadlineExceededError (và đếm vào DEADLINE_DROPS) nếu đã hết hạn"""
+        if self.expired():
+            DEADLINE_DROPS.inc(self.lane)
+            raise DeadlineExceededError(self.lane)
+
+
+DEFAULT_CLASS = RequestClass()
+_current: contextvars.ContextVar[RequestClass] = contextvars.ContextVar('request_class', default=DEFAULT_CLASS)
+
+
+def parse_request_class(priority: Optional[str], deadline_ms: Optional[str],
+                        default_lane: str = 'standard', default_deadline_ms: float = 0) -> RequestClass:
+    """
+    Đọc header X-Priority / X-Deadline-Ms
+
+    Deadline là khoảng thời gian tương đối (không phụ thuộc đồng hồ của backend),
+    tính từ lúc AI server nhận request.
+
+    Raises:
+        ValueError: lane không hợp lệ hoặc deadline không phải số dương
+    """
+    lane = (priority or default_lane).strip().lower()
+    if lane not in LANES:
+        raise ValueError(f"{PRIORITY_HEADER} không hợp lệ: {priority} (chọn một trong {', '.join(LANES)})")
+    budget = default_deadline_ms
+    if deadline_ms:
+        try:
+            budget = float(deadline_ms)
+        except ValueError:
+            raise ValueError(f"{DEADLINE_HEADER} phải là số ms")
+        if budget <= 0:
+            raise ValueError(f"{DEADLINE_HEADER} phải lớn hơn 0")
+    return RequestClass(lane, deadline_after(budget))
+
+
+def deadline_after(budget_ms: float) -> Optional[float]:
+    """Deadline (time.perf_counter) sau budget_ms, 0 = không giới hạn"""
+    return time.perf_counter() + budget_ms / 1000.0 if budget_ms > 0 else None
+
+
+def current_request_class() -> RequestClass:
+    return _current.get()
+
+
+def set_request_class(request_class: RequestClass) -> contextvars.Token:
+    return _current.set(request_class)
+
+
+def reset_request_class(token: contextvars.Token):
+    _current.reset(token)
@@ -0,0 +1,83 @@
+"""
+Test AI server ở MOCK_MODE: không cần TensorFlow / PyTorch / file model
+
+Chạy từ thư mục ai_server:
+    python -m pytest -q
+"""
+import io
+import os
+import sys
+
+# Settings được đọc khi import config, phải set trước khi import module của server
+os.environ.update(
+    MOCK_MODE='True',
+    MOCK_LATENCY='fixed',
+    MOCK_LATENCY_MS='5',
+    CONFIDENCE_THRESHOLD='0',
+    WARMUP_ENABLED='False',
+    WORKER_PROCESSES='0',
+    MODEL_WATCH_INTERVAL='0',
+    INDEX_DIR='',
+)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+import pytest  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+from PIL import Image  # noqa: E402
+
+import ann_index  # noqa: E402
+import batching  # noqa: E402
+import executor  # noqa: E402
+import main  # noqa: E402
+import model  # noqa: E402
+import prediction_cache  # noqa: E402
+from config import settings  # noqa: E402
+
+
+def _reset_singletons():
+    model._classifier = None
+    batching._batcher = None
+    executor._executor = None
+    prediction_cache._cache = None
+    ann_index._index = None
+
+
+@pytest.fixture
+def make_client(monkeypatch):
+    """
+    TestClient với settings ghi đè, vd make_client(BATCH_MAX_SIZE=4)
+
+    Classifier, micro-batcher, executor, cache và ANN index được tạo lại theo settings mới.
+    """
+    clients = []
+
+    def factory(**overrides) -> TestClient:
+        # Shutdown dừng singleton hiện tại nên mỗi lúc chỉ mở một client
+        while clients:
+            clients.pop().__exit__(None, None, None)
+        for name, value in overrides.items():
+            monkeypatch.setattr(settings, name, value)
+        _reset_singletons()
+        client = TestClient(main.app)
+        client.__enter__()
+        clients.append(client)
+        return client
+
+    yield factory
+    for client in clients:
+        client.__exit__(None, None, None)
+    _reset_singletons()
+
+
+def make_jpeg(seed: int, size=(64, 48)) -> bytes:
+    """Ảnh JPEG nhiễu ngẫu nhiên, seed khác nhau -> dHash khác nhau"""
+    pixels = np.random.default_rng(seed).integers(0, 256, (size[1] // 8, size[0] // 8, 3), dtype=np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).resize(size, Image.NEAREST).save(buffer, 'JPEG')
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def jpeg():
+    return make_jpeg
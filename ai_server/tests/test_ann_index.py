@@ -0,0 +1,60 @@
+"""ANN index (IVF) cho /similar"""
+import numpy as np
+import pytest
+
+from ann_index import IndexMismatchError, IVFIndex
+
+
+def _unit_vectors(n: int, dim: int, seed: int = 0) -> np.ndarray:
+    vectors = np.random.default_rng(seed).normal(size=(n, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def test_add_search_and_reload(tmp_path):
+    vectors = _unit_vectors(200, 16)
+    items = np.stack([np.arange(200) // 2 + 1, np.arange(200)], axis=1)
+    index = IVFIndex.build(str(tmp_path), vectors, items, 'w1', nlist=8, nprobe=8)
+    assert index.count == 200
+
+    # nprobe = nlist: tìm chính xác, vector trong index là kết quả đầu với score 1
+    top = index.search(vectors[37], 3, 'w1')[0]
+    assert (top['food_id'], top['image_id']) == (19, 37)
+    assert top['score'] == pytest.approx(1.0, abs=1e-3)
+    # Mỗi món chỉ xuất hiện một lần
+    results = index.search(vectors[37], 10, 'w1')
+    assert len({r['food_id'] for r in results}) == len(results) == 10
+
+    # Item đã có bị bỏ qua, item mới được ghi xuống đĩa
+    extra = _unit_vectors(2, 16, seed=1)
+    assert index.add(extra, [[1, 0], [500, 0]], 'w1') == 1
+    assert index.count == 201
+
+    reloaded = IVFIndex.load(str(tmp_path), nprobe=8)
+    assert reloaded.count == 201
+    assert reloaded.model_version == 'w1'
+    top = reloaded.search(extra[1], 1, 'w1')[0]
+    assert (top['food_id'], top['image_id']) == (500, 0)
+
+
+def test_version_mismatch(tmp_path):
+    index = IVFIndex.create(str(tmp_path), 8, 'w1')
+    with pytest.raises(IndexMismatchError):
+        index.add(_unit_vectors(1, 8), [[1, 0]], 'w2')
+    with pytest.raises(IndexMismatchError):
+        index.search(_unit_vectors(1, 8)[0], 1, 'w2')
+
+
+def test_index_survives_cascade_toggle(make_client, jpeg, tmp_path):
+    """Index gắn với weights: bật cascade (đổi classifier.version) không làm index mất hiệu lực"""
+    client = make_client(INDEX_DIR=str(tmp_path), CASCADE_ENABLED=False)
+    image = jpeg(3)
+    response = client.post('/index/items', files={'file': ('a.jpg', image, 'image/jpeg')}, data={'food_id': 7})
+    assert response.status_code == 200, response.text
+    assert response.json()['added'] == 1
+    version = client.post('/embed', files={'file': ('a.jpg', image, 'image/jpeg')}).json()['model_version']
+
+    client = make_client(INDEX_DIR=str(tmp_path), CASCADE_ENABLED=True)
+    assert client.post('/embed', files={'file': ('a.jpg', image, 'image/jpeg')}).json()['model_version'] != version
+    response = client.post('/similar', files={'file': ('a.jpg', image, 'image/jpeg')})
+    assert response.status_code == 200, response.text
+    assert response.json()['results'][0]['food_id'] == 7
@@ -0,0 +1,64 @@
+"""Micro-batcher chạy nhiều batch song song theo INFERENCE_CONCURRENCY"""
+import asyncio
+import time
+
+import httpx
+
+import main
+
+
+async def _concurrent_predict(images, headers=None, **params):
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+        started = time.perf_counter()
+        responses = await asyncio.gather(*(
+            client.post('/predict', params=params, headers=headers,
+                        files={'file': ('a.jpg', image, 'image/jpeg')})
+            for image in images
+        ))
+        return responses, time.perf_counter() - started
+
+
+def test_batches_run_concurrently(make_client, jpeg):
+    client = make_client(
+        BATCH_ENABLED=True, BATCH_MAX_SIZE=2, BATCH_MAX_WAIT_MS=5.0,
+        INFERENCE_CONCURRENCY=4, CACHE_ENABLED=False, MOCK_LATENCY_MS=100.0
+    )
+    images = [jpeg(seed) for seed in range(8)]
+    responses, elapsed = client.portal.call(_concurrent_predict, images)
+
+    assert [r.status_code for r in responses] == [200] * 8
+    # 8 ảnh / batch 2 = 4 forward pass 100ms; chạy tuần tự sẽ mất >= 0.4s
+    assert elapsed < 0.35, elapsed
+    stats = client.get('/stats').json()['batching']
+    assert stats['max_in_flight'] == 4
+    assert stats['in_flight'] == 0
+
+
+def test_batching_not_slower_than_unbatched(make_client, jpeg):
+    images = [jpeg(seed) for seed in range(8)]
+    common = dict(INFERENCE_CONCURRENCY=4, CACHE_ENABLED=False, MOCK_LATENCY_MS=100.0)
+
+    client = make_client(BATCH_ENABLED=False, **common)
+    _, unbatched = client.portal.call(_concurrent_predict, images)
+    client = make_client(BATCH_ENABLED=True, BATCH_MAX_SIZE=2, BATCH_MAX_WAIT_MS=5.0, **common)
+    responses, batched = client.portal.call(_concurrent_predict, images)
+
+    assert all(r.status_code == 200 for r in responses)
+    assert batched <= unbatched + 0.05, (batched, unbatched)
+
+
+def test_interactive_requests_are_batched(make_client, jpeg):
+    """Backend gửi request người dùng ở lane interactive: lane này cũng phải được gom batch"""
+    client = make_client(
+        BATCH_ENABLED=True, BATCH_MAX_SIZE=4, BATCH_MAX_WAIT_MS=10.0,
+        INFERENCE_CONCURRENCY=2, CACHE_ENABLED=False, MOCK_LATENCY_MS=50.0
+    )
+    images = [jpeg(seed) for seed in range(8)]
+    responses, _ = client.portal.call(_concurrent_predict, images, {'X-Priority': 'interactive'})
+
+    assert [r.status_code for r in responses] == [200] * 8
+    stats = client.get('/stats').json()['batching']
+    assert stats['max_batch_size'] > 1
+    assert stats['batch_size']['sum'] == 8
+    assert stats['batch_size']['count'] < 8
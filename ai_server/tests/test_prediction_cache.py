@@ -0,0 +1,69 @@
+"""Near-duplicate prediction cache: key theo TTA và version, entry hết hạn"""
+import prediction_cache
+from prediction_cache import PredictionCache
+
+RESULT = {'success': True, 'predictions': []}
+
+
+def predict(client, image, **params):
+    response = client.post('/predict', params=params, files={'file': ('a.jpg', image, 'image/jpeg')})
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def test_tta_mode_is_part_of_cache_key(make_client, jpeg):
+    client = make_client(CACHE_ENABLED=True, TTA_MODE='off')
+    image = jpeg(1)
+
+    assert predict(client, image)['tta'] is None
+    assert predict(client, image, tta='always')['tta'] is True
+    assert predict(client, image, tta='off')['tta'] is None
+
+    stats = client.get('/stats').json()['cache']
+    assert (stats['hits'], stats['misses']) == (1, 2)
+
+    # Lần thứ hai cùng chế độ TTA thì hit
+    assert predict(client, image, tta='always')['tta'] is True
+    assert client.get('/stats').json()['cache']['hits'] == 2
+
+
+def test_cache_disabled_never_hits(make_client, jpeg):
+    client = make_client(CACHE_ENABLED=False)
+    image = jpeg(2)
+    predict(client, image)
+    predict(client, image)
+    assert client.get('/stats').json()['cache']['hits'] == 0
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def monotonic(self):
+        return self.now
+
+
+def test_expired_nearest_entry_does_not_hide_valid_one(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(prediction_cache, 'time', clock)
+    cache = PredictionCache(max_size=8, ttl_seconds=10, max_distance=4)
+    cache.put(0b1, 'v1', {'success': True, 'id': 'near'})
+    clock.now = 8
+    cache.put(0b111, 'v1', {'success': True, 'id': 'far'})
+
+    # Entry gần nhất (lệch 1 bit) đã hết hạn, entry lệch 3 bit vẫn còn hạn
+    clock.now = 12
+    assert cache.get(0b0, 'v1')['id'] == 'far'
+    assert (cache.near_hits, cache.misses, cache.expirations) == (1, 0, 1)
+
+
+def test_versions_share_cache_during_reload():
+    cache = PredictionCache(max_size=8, ttl_seconds=60, max_distance=0)
+    cache.put(1, 'new', RESULT)
+    # Request của model cũ còn đang chạy sau hot reload
+    cache.put(2, 'old', RESULT)
+    assert cache.get(1, 'new') is RESULT
+    assert cache.get(2, 'old') is RESULT
+    # Kết quả của version khác không được trả về
+    assert cache.get(1, 'old') is None
+    assert cache.get(2, 'new') is None
@@ -0,0 +1,106 @@
+"""Priority lane + deadline của hàng đợi inference"""
+import asyncio
+import time
+
+import httpx
+
+import executor
+import main
+from executor import InferenceExecutor
+from scheduling import DeadlineExceededError, RequestClass, deadline_after
+
+
+def test_slots_granted_by_lane():
+    async def scenario():
+        pool = InferenceExecutor(max_concurrency=1, max_queue=16, retry_after=1)
+        order = []
+
+        def job(name):
+            time.sleep(0.02)
+            order.append(name)
+
+        # Job đầu giữ slot, các job sau chờ theo thứ tự đến: batch, standard, interactive
+        tasks = [asyncio.create_task(pool.run(job, 'running', request_class=RequestClass('batch')))]
+        await asyncio.sleep(0.005)
+        for lane in ('batch', 'standard', 'interactive'):
+            tasks.append(asyncio.create_task(pool.run(job, lane, request_class=RequestClass(lane))))
+            await asyncio.sleep(0)
+        # Hết hạn trong lúc chờ: không được chạy
+        expired = asyncio.create_task(
+            pool.run(job, 'expired', request_class=RequestClass('interactive', deadline_after(5)))
+        )
+        await asyncio.gather(*tasks)
+        try:
+            await expired
+        except DeadlineExceededError:
+            pass
+        else:
+            raise AssertionError('job quá deadline vẫn chạy')
+        pool.shutdown()
+        return order
+
+    assert asyncio.run(scenario()) == ['running', 'interactive', 'standard', 'batch']
+
+
+async def _predict_behind_slow_request(slow_image, image, headers):
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+        slow = asyncio.create_task(client.post('/predict', files={'file': ('a.jpg', slow_image, 'image/jpeg')}))
+        await asyncio.sleep(0.02)
+        response = await client.post('/predict', headers=headers, files={'file': ('b.jpg', image, 'image/jpeg')})
+        await slow
+        return response
+
+
+def test_deadline_exceeded_returns_504(make_client, jpeg):
+    client = make_client(
+        BATCH_ENABLED=False, INFERENCE_CONCURRENCY=1, CACHE_ENABLED=False, MOCK_LATENCY_MS=150.0
+    )
+    response = client.portal.call(_predict_behind_slow_request, jpeg(1), jpeg(2), {'X-Deadline-Ms': '30'})
+    assert response.status_code == 504, response.text
+    lanes = client.get('/stats').json()['lanes']
+    assert lanes['standard']['deadline_dropped'] == 1
+
+    assert client.post('/predict', headers={'X-Priority': 'vip'},
+                       files={'file': ('a.jpg', jpeg(3), 'image/jpeg')}).status_code == 400
+
+
+async def _interactive_behind_batch_work(batch_images, images):
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+        finished = {}
+
+        async def timed(name, request):
+            response = await request
+            finished[name] = time.perf_counter()
+            return response
+
+        batch = asyncio.create_task(timed('batch', client.post('/predict/batch', files=[
+            ('files', (f'{i}.jpg', image, 'image/jpeg')) for i, image in enumerate(batch_images)
+        ])))
+        await asyncio.sleep(0.02)
+        interactive = await asyncio.gather(*(
+            timed(i, client.post('/predict', headers={'X-Priority': 'interactive'},
+                                 files={'file': ('a.jpg', image, 'image/jpeg')}))
+            for i, image in enumerate(images)
+        ))
+        await batch
+        return interactive, finished
+
+
+def test_interactive_requests_batched_ahead_of_batch_lane(make_client, jpeg):
+    """Request interactive đồng thời được gom vào một forward pass và chạy trước việc của lane batch"""
+    client = make_client(
+        BATCH_ENABLED=True, BATCH_MAX_SIZE=4, BATCH_MAX_WAIT_MS=30.0, BATCH_PREDICT_SIZE=2,
+        INFERENCE_CONCURRENCY=1, CACHE_ENABLED=False, MOCK_LATENCY_MS=60.0
+    )
+    responses, finished = client.portal.call(
+        _interactive_behind_batch_work, [jpeg(seed) for seed in range(8)], [jpeg(seed) for seed in range(10, 14)]
+    )
+
+    assert [r.status_code for r in responses] == [200] * 4
+    # 4 request interactive -> một forward pass 4 ảnh
+    batch_size = client.get('/stats').json()['batching']['batch_size']
+    assert (batch_size['count'], batch_size['sum']) == (1, 4)
+    # /predict/batch còn 3 chunk đang chờ khi request interactive tới: chúng xong trước
+    assert max(finished[i] for i in range(4)) < finished['batch']
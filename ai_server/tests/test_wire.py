@@ -0,0 +1,78 @@
+"""Wire format nhị phân: backend (app/core/ai_client.py) <-> AI server (wire.py)"""
+import io
+import os
+import sys
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import wire
+from config import settings
+from model import decode_image
+from preprocessing import Preprocessor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'backend'))
+ai_client = pytest.importorskip('app.core.ai_client')
+
+
+def _jpeg(size) -> bytes:
+    pixels = np.random.default_rng(0).integers(0, 256, (size[1] // 16, size[0] // 16, 3), dtype=np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).resize(size, Image.BILINEAR).save(buffer, 'JPEG')
+    return buffer.getvalue()
+
+
+def test_request_round_trip(jpeg):
+    encoded = jpeg(1)
+    tensor = np.random.default_rng(1).integers(0, 256, (24, 32, 3), dtype=np.uint8)
+    images = wire.decode_request(ai_client.encode_frame([encoded, tensor]), max_items=2, max_item_bytes=1 << 20)
+
+    assert images[0] == encoded
+    assert np.array_equal(np.asarray(images[1]), tensor)
+    with pytest.raises(wire.FrameError):
+        wire.decode_request(ai_client.encode_frame([encoded, tensor]), max_items=1, max_item_bytes=1 << 20)
+
+
+def test_response_round_trip():
+    results = [
+        {'success': True, 'tta': True, 'stage': 'full', 'predictions': [
+            {'label': 'pho_bo', 'confidence': 0.75, 'rank': 1},
+            {'label': 'bun_cha', 'confidence': 0.125, 'rank': 2},
+        ]},
+        {'success': True, 'predictions': [{'label': 'bun_cha', 'confidence': 0.5, 'rank': 1}]},
+        {'success': False, 'error': 'Ảnh hỏng', 'predictions': []},
+    ]
+    decoded = ai_client.decode_frame(wire.encode_response(results, 'abc123'))
+
+    assert decoded['model_version'] == 'abc123'
+    first, second, failed = decoded['results']
+    assert first['predictions'] == results[0]['predictions']
+    assert (first['tta'], first['stage']) == (True, 'full')
+    assert second['predictions'] == results[1]['predictions']
+    assert (second['tta'], second['stage']) == (None, None)
+    assert failed == {'success': False, 'predictions': [], 'model_version': 'abc123',
+                      'tta': None, 'stage': None, 'error': 'Ảnh hỏng'}
+
+
+@pytest.mark.parametrize('size', [(64, 48), (1280, 960)])
+def test_backend_resize_matches_server(size):
+    """Tensor resize ở backend phải giống pixel server tự decode + resize"""
+    image = _jpeg(size)
+    server = Preprocessor(settings.IMAGE_SIZE).pixels(decode_image(image, settings.IMAGE_SIZE))
+    assert np.array_equal(ai_client.image_to_tensor(image, settings.IMAGE_SIZE), server)
+
+
+def test_tensor_frame_predicts_like_encoded_image(make_client):
+    client = make_client(CACHE_ENABLED=False)
+    image = _jpeg((640, 480))
+    expected = client.post('/predict', files={'file': ('a.jpg', image, 'image/jpeg')}).json()['predictions']
+
+    body = ai_client.encode_frame([ai_client.image_to_tensor(image, settings.IMAGE_SIZE)])
+    response = client.post('/predict', content=body, headers={
+        'Content-Type': wire.FRAME_CONTENT_TYPE, 'Accept': wire.FRAME_CONTENT_TYPE
+    })
+    assert response.status_code == 200, response.text
+    result = ai_client.decode_frame(response.content)['results'][0]
+    assert [p['label'] for p in result['predictions']] == [p['label'] for p in expected]
+    assert [p['confidence'] for p in result['predictions']] == pytest.approx([p['confidence'] for p in expected], abs=1e-4)
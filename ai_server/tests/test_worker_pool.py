@@ -0,0 +1,70 @@
+"""Worker pool: worker chết và restart lỗi"""
+import numpy as np
+import pytest
+
+import worker_pool
+from worker_pool import WorkerPool
+
+
+class _FakeWorker:
+    def __init__(self, worker_id, crash=False, restart_error=None):
+        self.worker_id = worker_id
+        self.crash = crash
+        self.restart_error = restart_error
+        self.restarts = 0
+        # Thuộc tính đọc trong WorkerPool.stats
+        self.pid = self.cpus = self.version = self.warmup = None
+        self.alive = True
+        self.jobs = 0
+
+    def infer(self, method, batch, *args):
+        if self.crash:
+            raise BrokenPipeError('worker đã chết')
+        return f'{method}:{self.worker_id}'
+
+    def restart(self, timeout):
+        self.restarts += 1
+        if self.restart_error is not None:
+            raise self.restart_error
+        self.crash = False
+
+
+def _pool(*workers):
+    pool = WorkerPool(num_workers=len(workers), threads_per_worker=1, capacity=4, sample_shape=(3,))
+    for worker in workers:
+        pool._workers.append(worker)
+        pool._idle.put(worker)
+    return pool
+
+
+def test_crashed_worker_requeued_after_restart():
+    worker = _FakeWorker(0, crash=True)
+    pool = _pool(worker)
+    with pytest.raises(RuntimeError, match='crashed'):
+        pool._call('score_tensors', np.zeros((1, 3), np.float32))
+    assert pool._call('score_tensors', np.zeros((1, 3), np.float32)) == 'score_tensors:0'
+
+
+def test_failed_restart_keeps_dead_worker_out_of_pool(monkeypatch):
+    monkeypatch.setattr(worker_pool, 'RESTART_RETRY_SECONDS', 60.0)
+    dead = _FakeWorker(0, crash=True, restart_error=RuntimeError('Worker 0 không sẵn sàng sau 1s'))
+    healthy = _FakeWorker(1)
+    pool = _pool(dead, healthy)
+    try:
+        # Caller vẫn nhận lỗi crash, không phải lỗi của lần restart
+        with pytest.raises(RuntimeError, match='crashed'):
+            pool._call('score_tensors', np.zeros((1, 3), np.float32))
+        assert pool.stats()['failed'] == [0]
+        # Các batch sau chỉ chạy trên worker còn sống
+        for _ in range(3):
+            assert pool._call('score_tensors', np.zeros((1, 3), np.float32)) == 'score_tensors:1'
+
+        # Lần thử lại thành công -> worker quay lại pool
+        dead.restart_error = None
+        pool._failed[0].cancel()
+        pool._recover(dead)
+        assert pool.stats()['failed'] == []
+        assert pool._idle.qsize() == 2
+    finally:
+        for timer in pool._failed.values():
+            timer.cancel()
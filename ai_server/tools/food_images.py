@@ -0,0 +1,76 @@
+"""
+Đọc ảnh món ăn từ database của backend (bảng food_images / foods)
+Dùng chung cho các tool offline (calibration, build index, ...)
+
+Cần sqlalchemy + driver DB (có sẵn trong backend/requirements.txt)
+"""
+import os
+import random
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+# Thư mục backend chứa uploads/ (image_url dạng /uploads/...)
+DEFAULT_IMAGE_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'backend')
+
+
+@dataclass
+class FoodImageRecord:
+    food_id: int
+    ai_label: Optional[str]
+    image_url: str
+    image_id: int = 0  # id trong food_images, 0 = ảnh chính Food.image_url
+
+
+def load_food_images(database_url: str, training_only: bool = True,
+                     include_food_images: bool = False) -> List[FoodImageRecord]:
+    """
+    Lấy danh sách ảnh từ bảng food_images (is_training=True nếu training_only)
+
+    include_food_images: thêm ảnh chính Food.image_url của các món đang active
+    """
+    from sqlalchemy import create_engine, text
+
+    query = """
+        SELECT fi.id, fi.food_id, f.ai_label, fi.image_url
+        FROM food_images fi
+        JOIN foods f ON f.id = fi.food_id
+    """
+    if training_only:
+        query += " WHERE fi.is_training = true"
+
+    engine = create_engine(database_url)
+    with engine.connect() as conn:
+        rows = conn.execute(text(query)).fetchall()
+        records = [FoodImageRecord(r.food_id, r.ai_label, r.image_url, r.id) for r in rows]
+
+        if include_food_images:
+            rows = conn.execute(text(
+                "SELECT id, ai_label, image_url FROM foods "
+                "WHERE is_active = true AND image_url IS NOT NULL AND image_url != ''"
+            )).fetchall()
+            records.extend(FoodImageRecord(r.id, r.ai_label, r.image_url) for r in rows)
+
+    engine.dispose()
+    return records
+
+
+def read_image_bytes(image_url: str, image_root: str = DEFAULT_IMAGE_ROOT, timeout: float = 30.0) -> bytes:
+    """Đọc ảnh từ URL http(s) hoặc đường dẫn /uploads/... của backend"""
+    if image_url.startswith(('http://', 'https://')):
+        import httpx
+        response = httpx.get(image_url, timeout=timeout, follow_redirects=True)
+        response.raise_for_status()
+        return response.content
+
+    path = image_url if os.path.isabs(image_url) and os.path.exists(image_url) \
+        else os.path.join(image_root, image_url.lstrip('/'))
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def split_sample(records: List[FoodImageRecord], first: int, second: int,
+                 seed: int = 0) -> Tuple[List[FoodImageRecord], List[FoodImageRecord]]:
+    """Chia ngẫu nhiên thành 2 tập rời nhau (vd calibration / evaluation)"""
+    shuffled = list(records)
+    random.Random(seed).shuffle(shuffled)
+    return shuffled[:first], shuffled[first:first + second]
@@ -0,0 +1,64 @@
+"""
+Transport cho backend chạy cùng host với AI server
+- Unix domain socket: bỏ qua TCP stack của localhost
+- Shared memory: backend ghi bytes ảnh vào một segment, chỉ gửi tên segment
+"""
+import os
+import socket
+from multiprocessing import resource_tracker, shared_memory
+
+import uvicorn
+
+
+def read_shared_image(name: str, size: int) -> bytes:
+    """
+    Đọc bytes ảnh từ shared memory segment do backend tạo
+
+    Backend giữ quyền sở hữu segment (tạo + unlink), AI server chỉ attach rồi đóng.
+
+    Raises:
+        FileNotFoundError: segment không tồn tại
+        ValueError: size lớn hơn segment
+    """
+    segment = shared_memory.SharedMemory(name=name)
+    try:
+        # Python < 3.13 đăng ký cả segment attach vào resource tracker và sẽ
+        # unlink nó khi process thoát -> bỏ đăng ký vì segment thuộc về backend
+        resource_tracker.unregister(segment._name, 'shared_memory')
+        if size > segment.size:
+            raise ValueError(f"size {size} lớn hơn segment ({segment.size} bytes)")
+        return bytes(segment.buf[:size])
+    finally:
+        segment.close()
+
+
+def bind_unix_socket(path: str) -> socket.socket:
+    """Tạo Unix socket tại path (xoá socket cũ còn sót lại từ lần chạy trước)"""
+    if os.path.exists(path):
+        os.unlink(path)
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.bind(path)
+    # Chỉ user / group chạy server được kết nối
+    os.chmod(path, 0o660)
+    return sock
+
+
+def serve(app, host: str, port: int, uds_path: str):
+    """
+    Chạy uvicorn nghe đồng thời TCP (host:port) và Unix socket (uds_path)
+    trong cùng một process, dùng chung model / batcher / cache
+    """
+    config = uvicorn.Config(app, host=host, port=port)
+    tcp = config.bind_socket()
+    # Với socket truyền vào sẵn, event loop không tự bật TCP_NODELAY cho kết nối mới;
+    # Linux cho socket accept() kế thừa option từ listening socket
+    tcp.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    sockets = [tcp, bind_unix_socket(uds_path)]
+    print(f"✓ Listening on http://{host}:{port} and unix:{uds_path}")
+    try:
+        uvicorn.Server(config).run(sockets=sockets)
+    finally:
+        for sock in sockets:
+            sock.close()
+        if os.path.exists(uds_path):
+            os.unlink(uds_path)
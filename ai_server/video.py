@@ -0,0 +1,198 @@
+"""
+Nhận diện món ăn từ video clip ngắn (quay lướt qua bàn ăn)
+
+- Clip được ghi từng chunk xuống file tạm, không giữ cả clip trong RAM
+- OpenCV đọc tuần tự: frame không lấy mẫu chỉ grab() (không chuyển màu / copy
+  ra numpy), frame lấy mẫu (VIDEO_SAMPLE_FPS) được thu nhỏ ngay về IMAGE_SIZE
+- Frame gần giống frame giữ gần nhất (chênh lệch trung bình trên thumbnail xám
+  32x32 < VIDEO_DIFF_THRESHOLD) bị bỏ
+- Frame giữ lại được tiền xử lý thẳng vào một batch, chạy một forward pass rồi
+  gộp theo thời gian: mỗi label lấy confidence cao nhất qua các frame
+"""
+import math
+import os
+import tempfile
+from typing import AsyncIterator, Callable, Dict, List, Tuple
+
+import numpy as np
+from PIL import Image
+
+from config import settings
+
+THUMB_SIZE = 32
+CHUNK_SIZE = 1024 * 1024
+
+
+class VideoError(ValueError):
+    """Clip không hợp lệ (quá lớn, không decode được, không có frame)"""
+
+
+class VideoDecoderMissingError(RuntimeError):
+    """Chưa cài opencv-python"""
+
+
+def _import_cv2():
+    try:
+        import cv2
+    except ImportError:
+        raise VideoDecoderMissingError("Cần cài opencv-python để nhận diện video")
+    return cv2
+
+
+async def spool_upload(chunks: AsyncIterator[bytes], max_bytes: int, suffix: str = '.mp4') -> str:
+    """
+    Ghi clip (đọc theo chunk) xuống file tạm, trả về đường dẫn; caller xoá file
+
+    Raises:
+        VideoError: clip rỗng hoặc lớn hơn max_bytes
+    """
+    fd, path = tempfile.mkstemp(prefix='food_clip_', suffix=suffix)
+    size = 0
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            async for chunk in chunks:
+                size += len(chunk)
+                if size > max_bytes:
+                    raise VideoError(f"Video quá lớn. Tối đa {max_bytes // (1024 * 1024)}MB")
+                f.write(chunk)
+        if size == 0:
+            raise VideoError("Video rỗng")
+    except BaseException:
+        os.unlink(path)
+        raise
+    return path
+
+
+def sample_frames(path: str, size: int, preprocess_into: Callable[[Image.Image, np.ndarray], np.ndarray],
+                  out: np.ndarray, sample_fps: float, diff_threshold: float,
+                  max_duration_s: float) -> Tuple[List[int], Dict]:
+    """
+    Decode tuần tự clip, tiền xử lý frame giữ lại vào out[0], out[1], ...
+
+    Clip dài hơn len(out) / sample_fps giây thì giãn bước lấy mẫu để phủ cả clip.
+
+    Returns:
+        (timestamp ms của từng frame giữ lại, thống kê decode)
+    """
+    cv2 = _import_cv2()
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        raise VideoError("Không đọc được video (định dạng không hỗ trợ)")
+
+    try:
+        fps = capture.get(cv2.CAP_PROP_FPS)
+        if not fps or math.isnan(fps) or fps <= 0:
+            fps = 30.0
+        limit = int(max_duration_s * fps)
+        total = int(capture.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+        step = max(1, round(fps / sample_fps))
+        if total > 0:
+            step = max(step, math.ceil(min(total, limit) / len(out)))
+
+        timestamps: List[int] = []
+        last_thumb = None
+        index = grabbed = sampled = duplicates = 0
+        truncated = False
+        while len(timestamps) < len(out):
+            if index >= limit:
+                truncated = True
+                break
+            if not capture.grab():
+                break
+            grabbed += 1
+            index += 1
+            if (index - 1) % step:
+                continue
+
+            ok, frame = capture.retrieve()
+            if not ok:
+                continue
+            sampled += 1
+            small = cv2.resize(frame, (size, size), interpolation=cv2.INTER_AREA)
+            thumb = cv2.resize(cv2.cvtColor(small, cv2.COLOR_BGR2GRAY), (THUMB_SIZE, THUMB_SIZE),
+                               interpolation=cv2.INTER_AREA).astype(np.int16)
+            if last_thumb is not None and np.abs(thumb - last_thumb).mean() < diff_threshold:
+                duplicates += 1
+                continue
+            last_thumb = thumb
+
+            rgb = cv2.cvtColor(small, cv2.COLOR_BGR2RGB)
+            preprocess_into(Image.fromarray(rgb), out[len(timestamps)])
+            timestamps.append(round((index - 1) * 1000 / fps))
+    finally:
+        capture.release()
+
+    return timestamps, {
+        'fps': round(fps, 2),
+        'duration_ms': round(index * 1000 / fps),
+        'sample_step': step,
+        'decoded': grabbed,
+        'sampled': sampled,
+        'duplicates': duplicates,
+        'kept': len(timestamps),
+        'truncated': truncated
+    }
+
+
+def aggregate(scores: np.ndarray, timestamps: List[int], labels: List[str],
+              top_k: int, threshold: float) -> Tuple[List[Dict], List[Dict]]:
+    """
+    Gộp xác suất theo label của từng frame (N, num_labels) theo thời gian
+
+    Clip lướt qua nhiều món nên mỗi label lấy confidence cao nhất qua các frame
+    (kèm trung bình, số frame là top-1 và thời điểm rõ nhất).
+
+    Returns:
+        (top-k label của cả clip, top-1 của từng frame)
+    """
+    peak = scores.max(axis=0)
+    peak_frame = scores.argmax(axis=0)
+    mean = scores.mean(axis=0)
+    top1 = scores.argmax(axis=1)
+    counts = np.bincount(top1, minlength=scores.shape[1])
+
+    order = np.argsort(-peak, kind='stable')[:top_k]
+    predictions = [
+        {
+            'label': labels[idx],
+            'confidence': round(float(peak[idx]), 4),
+            'mean_confidence': round(float(mean[idx]), 4),
+            'frames': int(counts[idx]),
+            'peak_ms': timestamps[peak_frame[idx]],
+            'rank': rank
+        }
+        for rank, idx in enumerate((idx for idx in order.tolist() if peak[idx] >= threshold), start=1)
+    ]
+    frames = [
+        {'timestamp_ms': ts, 'label': labels[idx], 'confidence': round(float(scores[row, idx]), 4)}
+        for row, (ts, idx) in enumerate(zip(timestamps, top1.tolist()))
+    ]
+    return predictions, frames
+
+
+def recognize_clip(classifier, path: str, top_k: int) -> Dict:
+    """
+    Nhận diện clip đã ghi ở path bằng classifier (chạy trong InferenceExecutor)
+
+    Raises:
+        VideoError: không decode được hoặc không có frame nào
+    """
+    batch = np.empty((settings.VIDEO_MAX_FRAMES,) + classifier.preprocessor.shape, dtype=np.float32)
+    timestamps, stats = sample_frames(
+        path, classifier.image_size, classifier.preprocess_into, batch,
+        settings.VIDEO_SAMPLE_FPS, settings.VIDEO_DIFF_THRESHOLD, settings.VIDEO_MAX_DURATION_S
+    )
+    if not timestamps:
+        raise VideoError("Không decode được frame nào từ video")
+
+    scores = classifier.score_tensors(batch[:len(timestamps)])
+    predictions, frames = aggregate(
+        scores, timestamps, classifier.labels, top_k, classifier.confidence_threshold
+    )
+    return {
+        'success': True,
+        'predictions': predictions,
+        'frames': frames,
+        'stats': stats,
+        'model_version': classifier.version
+    }
@@ -0,0 +1,150 @@
+"""
+Wire format nhị phân cho /predict và /predict/batch
+Thay multipart (request) và JSON (response) bằng frame length-prefixed, không
+cần thư viện ngoài. Số nguyên little-endian.
+
+Request (Content-Type: application/x-food-frame):
+    b"FRQ1" | u16 số ảnh | mỗi ảnh:
+        u8 kind | [kind=1: u16 height, u16 width, u8 channels] | u32 length | payload
+    kind 0: bytes ảnh đã encode (JPEG / PNG / WEBP)
+    kind 1: tensor uint8 HWC đã resize sẵn (channels = 3, RGB)
+
+Response (Accept: application/x-food-frame):
+    b"FRS1" | str model_version | u16 số label | label: str ...
+          | u16 số kết quả | mỗi kết quả:
+        u8 flags (bit0 success, bit1 có tta, bit2 đã chạy tta,
+                  bit3 có stage cascade, bit4 stage = full) | u8 k
+        | k x (u16 chỉ số trong bảng label, f32 confidence) | [lỗi: str]
+    str = u16 length + utf-8; rank = thứ tự trong frame
+"""
+import struct
+from typing import Dict, List, Optional, Union
+
+import numpy as np
+from PIL import Image
+
+FRAME_CONTENT_TYPE = 'application/x-food-frame'
+
+REQUEST_MAGIC = b'FRQ1'
+RESPONSE_MAGIC = b'FRS1'
+
+KIND_ENCODED = 0
+KIND_TENSOR = 1
+
+FLAG_SUCCESS = 1
+FLAG_HAS_TTA = 2
+FLAG_TTA = 4
+FLAG_HAS_STAGE = 8
+FLAG_STAGE_FULL = 16
+
+MAX_TENSOR_SIDE = 4096
+
+_COUNT = struct.Struct('<H')
+_KIND = struct.Struct('<B')
+_SHAPE = struct.Struct('<HHB')
+_LENGTH = struct.Struct('<I')
+_RESULT = struct.Struct('<BB')
+_PREDICTION = struct.Struct('<Hf')
+
+
+class FrameError(ValueError):
+    """Frame request không hợp lệ"""
+
+
+def accepts_frame(accept: Optional[str]) -> bool:
+    """Client yêu cầu response dạng frame (header Accept)"""
+    return bool(accept) and FRAME_CONTENT_TYPE in accept
+
+
+def is_frame(content_type: Optional[str]) -> bool:
+    """Body request là frame (header Content-Type)"""
+    return bool(content_type) and content_type.split(';')[0].strip() == FRAME_CONTENT_TYPE
+
+
+def decode_request(body: bytes, max_items: int, max_item_bytes: int) -> List[Union[bytes, Image.Image]]:
+    """
+    Đọc frame request thành list ảnh: bytes (kind 0) hoặc PIL Image từ tensor (kind 1)
+
+    Tensor được wrap bằng np.frombuffer (không copy) rồi Image.fromarray.
+
+    Raises:
+        FrameError: sai magic, thiếu dữ liệu, vượt giới hạn
+    """
+    view = memoryview(body)
+    if view[:4] != REQUEST_MAGIC:
+        raise FrameError("Sai magic của frame request")
+    offset = 4
+    try:
+        (count,) = _COUNT.unpack_from(view, offset)
+        offset += _COUNT.size
+        if count == 0:
+            raise FrameError("Frame không có ảnh nào")
+        if count > max_items:
+            raise FrameError(f"Quá nhiều ảnh. Tối đa {max_items} ảnh mỗi request")
+
+        images = []
+        for idx in range(count):
+            (kind,) = _KIND.unpack_from(view, offset)
+            offset += _KIND.size
+            if kind == KIND_TENSOR:
+                height, width, channels = _SHAPE.unpack_from(view, offset)
+                offset += _SHAPE.size
+            elif kind != KIND_ENCODED:
+                raise FrameError(f"Ảnh {idx}: kind {kind} không hợp lệ")
+
+            (length,) = _LENGTH.unpack_from(view, offset)
+            offset += _LENGTH.size
+            if length > max_item_bytes:
+                raise FrameError(f"Ảnh {idx}: quá lớn. Tối đa {max_item_bytes // (1024 * 1024)}MB")
+            if offset + length > len(view):
+                raise FrameError(f"Ảnh {idx}: frame bị cắt cụt")
+            payload = view[offset:offset + length]
+            offset += length
+
+            if kind == KIND_ENCODED:
+                images.append(payload.tobytes())
+                continue
+            if channels != 3 or not (0 < height <= MAX_TENSOR_SIDE and 0 < width <= MAX_TENSOR_SIDE):
+                raise FrameError(f"Ảnh {idx}: tensor phải là uint8 HxWx3, cạnh tối đa {MAX_TENSOR_SIDE}")
+            if length != height * width * channels:
+                raise FrameError(f"Ảnh {idx}: {length} bytes không khớp shape {height}x{width}x{channels}")
+            array = np.frombuffer(payload, dtype=np.uint8).reshape(height, width, channels)
+            images.append(Image.fromarray(array, 'RGB'))
+    except struct.error:
+        raise FrameError("Frame bị cắt cụt")
+
+    if offset != len(view):
+        raise FrameError("Dữ liệu thừa cuối frame")
+    return images
+
+
+def _pack_str(value: str) -> bytes:
+    data = value.encode('utf-8')
+    return _COUNT.pack(len(data)) + data
+
+
+def encode_response(results: List[Dict], model_version: Optional[str]) -> bytes:
+    """
+    Kết quả predict (dict như FoodClassifier.predict) -> frame response
+
+    Label được gom vào một bảng chung, mỗi prediction chỉ còn (chỉ số, f32)
+    """
+    table: Dict[str, int] = {}
+    body = [_COUNT.pack(len(results))]
+    for result in results:
+        predictions = result['predictions'] if result['success'] else []
+        flags = FLAG_SUCCESS if result['success'] else 0
+        if result.get('tta') is not None:
+            flags |= FLAG_HAS_TTA | (FLAG_TTA if result['tta'] else 0)
+        if result.get('stage') is not None:
+            flags |= FLAG_HAS_STAGE | (FLAG_STAGE_FULL if result['stage'] == 'full' else 0)
+        body.append(_RESULT.pack(flags, len(predictions)))
+        for pred in predictions:
+            ref = table.setdefault(pred['label'], len(table))
+            body.append(_PREDICTION.pack(ref, pred['confidence']))
+        if not result['success']:
+            body.append(_pack_str(result.get('error') or 'Prediction failed'))
+
+    header = [RESPONSE_MAGIC, _pack_str(model_version or ''), _COUNT.pack(len(table))]
+    header += [_pack_str(label) for label in table]
+    return b''.join(header + body)
@@ -0,0 +1,413 @@
+"""
+Multi-process inference worker pool
+Mỗi worker process giữ một FoodClassifier riêng; process FastAPI (chỉ load
+labels + tiền xử lý, không load weights) gửi tensor đã tiền xử lý qua shared
+memory (không pickle mảng), chỉ kết quả top-k / xác suất / embedding đi qua pipe.
+
+Lưu ý: module này không import model ở top-level để worker process có thể
+giới hạn số thread (OMP/MKL) trước khi TensorFlow/PyTorch được import.
+"""
+import math
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+from multiprocessing import shared_memory
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from config import settings
+
+
+THREAD_ENV_VARS = ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'TF_NUM_INTRAOP_THREADS')
+# Method của FoodClassifier mà process FastAPI được gọi trên worker
+WORKER_METHODS = ('predict_tensors', 'score_tensors', 'embed_tensors')
+# Worker restart lỗi (vd quá ready timeout) được thử lại sau khoảng này
+RESTART_RETRY_SECONDS = 5.0
+
+
+def _limit_threads(threads: int):
+    """Giới hạn số thread của các ML framework trong worker"""
+    for var in THREAD_ENV_VARS:
+        os.environ[var] = str(threads)
+    os.environ['TF_NUM_INTEROP_THREADS'] = '1'
+    settings.ONNX_INTRA_OP_THREADS = threads
+    settings.ONNX_INTER_OP_THREADS = 1
+
+
+def _worker_main(worker_id: int, cpus: Optional[List[int]], threads: int, conn,
+                 shm_name: str, capacity: int, sample_shape: Tuple[int, ...],
+                 model_path: Optional[str] = None, labels_path: Optional[str] = None):
+    """Vòng lặp của worker process"""
+    if cpus and hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cpus)
+    _limit_threads(threads)
+
+    import model
+    framework = model.select_framework(model_path)
+    model.import_framework(framework)
+    # Phải set trước khi runtime của framework khởi tạo (trước khi load model)
+    if framework == 'pytorch':
+        model.torch.set_num_threads(threads)
+    elif framework == 'tensorflow':
+        model.tf.config.threading.set_intra_op_parallelism_threads(threads)
+        model.tf.config.threading.set_inter_op_parallelism_threads(1)
+    classifier = model.FoodClassifier(model_path, labels_path)
+    shape = classifier.preprocessor.shape
+    if math.prod(shape) != math.prod(sample_shape):
+        conn.send(('error', f"Input {shape} của model khác kích thước shared memory {sample_shape}"))
+        return
+    warmup = None
+    if settings.WARMUP_ENABLED:
+        warmup = classifier.warmup(model.warmup_batch_sizes(), settings.WARMUP_ITERATIONS)
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    # Layout theo model trong worker (NCHW / NHWC cùng số phần tử)
+    buffer = np.ndarray((capacity, *shape), dtype=np.float32, buffer=shm.buf)
+    conn.send(('ready', {
+        'pid': os.getpid(), 'framework': classifier.framework,
+        'version': classifier.version, 'embedding_version': classifier.embedding_version, 'warmup': warmup,
+        'layout': classifier.preprocessor.layout, 'normalize': classifier.preprocessor.normalize
+    }))
+
+    try:
+        while True:
+            try:
+                message = conn.recv()
+            except EOFError:
+                break
+            if message is None:
+                break
+            method, n, args = message
+            try:
+                if method not in WORKER_METHODS:
+                    raise ValueError(f"Method không hỗ trợ: {method}")
+                conn.send(('ok', getattr(classifier, method)(buffer[:n], *args)))
+            except Exception as e:
+                conn.send(('error', str(e)))
+    finally:
+        del buffer
+        shm.close()
+
+
+class _Worker:
+    """Một worker process cùng vùng shared memory input của nó"""
+
+    def __init__(self, worker_id: int, cpus: Optional[List[int]], threads: int,
+                 capacity: int, sample_shape: Tuple[int, ...], ctx):
+        self.worker_id = worker_id
+        self.cpus = cpus
+        self.threads = threads
+        self.capacity = capacity
+        self.sample_shape = sample_shape
+        self._ctx = ctx
+
+        nbytes = capacity * math.prod(sample_shape) * np.dtype(np.float32).itemsize
+        self.shm = shared_memory.SharedMemory(create=True, size=nbytes)
+        # View phẳng: layout thực tế do model trong worker quyết định
+        self.buffer = np.ndarray((capacity * math.prod(sample_shape),), dtype=np.float32, buffer=self.shm.buf)
+
+        self.process = None
+        self.conn = None
+        self.pid: Optional[int] = None
+        self.warmup: Optional[Dict] = None
+        self.version: Optional[str] = None
+        # Framework, layout / chuẩn hoá input của model trong worker (ready message)
+        self.info: Dict = {}
+        # Model / labels mà worker load khi spawn (None = MODEL_PATH / LABELS_PATH)
+        self.model_path: Optional[str] = None
+        self.labels_path: Optional[str] = None
+        self.restarts = 0
+        self.jobs = 0
+
+    def spawn(self):
+        """Khởi động process (không chờ model load xong)"""
+        parent_conn, child_conn = self._ctx.Pipe()
+        self.process = self._ctx.Process(
+            target=_worker_main,
+            args=(self.worker_id, self.cpus, self.threads, child_conn,
+                  self.shm.name, self.capacity, self.sample_shape,
+                  self.model_path, self.labels_path),
+            name=f"inference-worker-{self.worker_id}",
+            daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+        self.conn = parent_conn
+
+    def wait_ready(self, timeout: float):
+        """Chờ worker load model xong"""
+        if not self.conn.poll(timeout):
+            raise RuntimeError(f"Worker {self.worker_id} không sẵn sàng sau {timeout}s")
+        status, info = self.conn.recv()
+        if status != 'ready':
+            raise RuntimeError(f"Worker {self.worker_id}: {info}")
+        self.info = info
+        self.pid = info['pid']
+        self.warmup = info['warmup']
+        self.version = info['version']
+        print(f"✓ Worker {self.worker_id} ready (pid={self.pid}, cpus={self.cpus}, "
+              f"{info['framework']}, model {self.version})")
+
+    def infer(self, method: str, batch: np.ndarray, *args):
+        """Copy batch vào shared memory, gọi classifier.<method>(batch, *args) trên worker và chờ kết quả"""
+        n = len(batch)
+        np.copyto(self.buffer[:batch.size].reshape(batch.shape), batch)
+        self.conn.send((method, n, args))
+        status, payload = self.conn.recv()
+        self.jobs += 1
+        if status != 'ok':
+            raise RuntimeError(payload)
+        return payload
+
+    def stop(self, timeout: float = 10.0):
+        """Dừng process: gửi sentinel, quá timeout thì terminate"""
+        if self.process is None:
+            return
+        try:
+            self.conn.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+        self.conn.close()
+        self.process = None
+
+    def restart(self, timeout: float):
+        self.stop()
+        self.spawn()
+        self.wait_ready(timeout)
+        self.restarts += 1
+
+    def close(self):
+        self.stop()
+        del self.buffer
+        self.shm.close()
+        self.shm.unlink()
+
+    @property
+    def alive(self) -> bool:
+        return self.process is not None and self.process.is_alive()
+
+
+class WorkerPool:
+    """
+    Pool N worker process, mỗi worker chạy một batch tại một thời điểm
+
+    predict_tensors() là hàm blocking (gọi từ InferenceExecutor thread),
+    lấy một worker rảnh, chuyển batch qua shared memory và chờ kết quả.
+    """
+
+    def __init__(self, num_workers: int, threads_per_worker: int, capacity: int,
+                 sample_shape: Sequence[int], pin_cpus: bool = True,
+                 ready_timeout: float = 300.0):
+        self.num_workers = num_workers
+        self.threads_per_worker = max(1, threads_per_worker)
+        self.capacity = max(1, capacity)
+        self.sample_shape = tuple(sample_shape)
+        self.pin_cpus = pin_cpus
+        self.ready_timeout = ready_timeout
+
+        self._ctx = mp.get_context('spawn')
+        self._workers: List[_Worker] = []
+        self._idle: "queue.Queue[_Worker]" = queue.Queue()
+        # Worker restart lỗi: không nằm trong _idle, timer thử restart lại
+        self._failed: Dict[int, threading.Timer] = {}
+        self._closed = False
+
+    def _cpu_sets(self) -> List[Optional[List[int]]]:
+        """Chia các CPU được phép dùng thành các nhóm rời nhau cho từng worker"""
+        if not self.pin_cpus or not hasattr(os, 'sched_getaffinity'):
+            return [None] * self.num_workers
+
+        cpus = sorted(os.sched_getaffinity(0))
+        if len(cpus) < self.num_workers * self.threads_per_worker:
+            print("⚠️ Không đủ CPU để pin riêng cho từng worker, bỏ qua CPU pinning")
+            return [None] * self.num_workers
+
+        n = self.threads_per_worker
+        return [cpus[i * n:(i + 1) * n] for i in range(self.num_workers)]
+
+    def start(self):
+        """Khởi động toàn bộ worker và chờ tất cả load model xong"""
+        for worker_id, cpus in enumerate(self._cpu_sets()):
+            worker = _Worker(
+                worker_id, cpus, self.threads_per_worker,
+                self.capacity, self.sample_shape, self._ctx
+            )
+            worker.spawn()
+            self._workers.append(worker)
+
+        for worker in self._workers:
+            worker.wait_ready(self.ready_timeout)
+            self._idle.put(worker)
+
+    @property
+    def model_info(self) -> Dict:
+        """Framework, version, layout / chuẩn hoá input của model trong worker"""
+        return self._workers[0].info
+
+    def predict_tensors(self, batch: np.ndarray, tta_margins: Optional[np.ndarray] = None) -> List[Dict]:
+        """Chạy batch trên một worker rảnh, chia nhỏ nếu vượt capacity"""
+        if len(batch) > self.capacity:
+            results = []
+            for start in range(0, len(batch), self.capacity):
+                end = start + self.capacity
+                results.extend(self.predict_tensors(
+                    batch[start:end], None if tta_margins is None else tta_margins[start:end]
+                ))
+            return results
+
+        try:
+            return self._call('predict_tensors', batch, tta_margins)
+        except RuntimeError as e:
+            return self._error_results(len(batch), str(e))
+
+    def score_tensors(self, batch: np.ndarray) -> np.ndarray:
+        """Xác suất theo label (N, num_labels), xem FoodClassifier.score_tensors"""
+        return np.concatenate([
+            self._call('score_tensors', batch[start:start + self.capacity])
+            for start in range(0, len(batch), self.capacity)
+        ])
+
+    def embed_tensors(self, batch: np.ndarray) -> np.ndarray:
+        """Embedding (N, D) đã chuẩn hoá L2, xem FoodClassifier.embed_tensors"""
+        return np.concatenate([
+            self._call('embed_tensors', batch[start:start + self.capacity])
+            for start in range(0, len(batch), self.capacity)
+        ])
+
+    def _call(self, method: str, batch: np.ndarray, *args):
+        """
+        Gọi method trên một worker rảnh (batch <= capacity)
+
+        Raises:
+            RuntimeError: worker báo lỗi hoặc chết giữa chừng
+        """
+        worker = self._idle.get()
+        try:
+            result = worker.infer(method, batch, *args)
+        except (EOFError, BrokenPipeError, ConnectionResetError, OSError) as e:
+            # Worker chết giữa chừng -> khởi động lại rồi báo lỗi cho batch này
+            print(f"⚠️ Worker {worker.worker_id} crashed: {e!r}, restarting...")
+            self._recover(worker)
+            raise RuntimeError("Inference worker crashed") from e
+        except Exception:
+            # Lỗi do worker báo về, worker vẫn dùng được
+            self._idle.put(worker)
+            raise
+        self._idle.put(worker)
+        return result
+
+    def _recover(self, worker: _Worker) -> Optional[Exception]:
+        """
+        Restart worker, chỉ trả worker về hàng đợi rảnh khi restart thành công;
+        lỗi thì thử lại sau RESTART_RETRY_SECONDS (worker chết không bị lấy ra dùng)
+
+        Returns:
+            Exception của lần restart lỗi, None nếu thành công
+        """
+        self._failed.pop(worker.worker_id, None)
+        if self._closed:
+            return None
+        try:
+            worker.restart(self.ready_timeout)
+        except Exception as e:
+            print(f"⚠️ Worker {worker.worker_id} restart failed: {e}, "
+                  f"thử lại sau {RESTART_RETRY_SECONDS:g}s")
+            timer = threading.Timer(RESTART_RETRY_SECONDS, self._recover, args=(worker,))
+            timer.daemon = True
+            self._failed[worker.worker_id] = timer
+            timer.start()
+            return e
+        self._idle.put(worker)
+        return None
+
+    @staticmethod
+    def _error_results(n: int, error: str) -> List[Dict]:
+        return [{'success': False, 'error': error, 'predictions': []} for _ in range(n)]
+
+    def restart_all(self):
+        """
+        Rolling restart: lần lượt restart từng worker khi nó rảnh,
+        các worker còn lại vẫn tiếp tục phục vụ request
+        """
+        # Worker đang chờ thử restart lại sẽ tự load model mới khi restart được
+        pending = {worker.worker_id for worker in self._workers if worker.worker_id not in self._failed}
+        while pending:
+            worker = self._idle.get()
+            if worker.worker_id not in pending:
+                # Worker này đã restart rồi, nhường cho worker khác rảnh
+                self._idle.put(worker)
+                time.sleep(0.01)
+                continue
+            pending.discard(worker.worker_id)
+            error = self._recover(worker)
+            if error is not None:
+                raise RuntimeError(f"Worker {worker.worker_id} không restart được: {error}") from error
+
+    def reload(self, model_path: str, labels_path: str):
+        """
+        Chuyển các worker sang model / labels mới bằng rolling restart:
+        mỗi worker load + warmup model mới trong khi các worker khác vẫn phục vụ
+        """
+        for worker in self._workers:
+            worker.model_path = model_path
+            worker.labels_path = labels_path
+        self.restart_all()
+
+    def close(self):
+        self._closed = True
+        for timer in list(self._failed.values()):
+            timer.cancel()
+        self._failed.clear()
+        for worker in self._workers:
+            worker.close()
+        self._workers.clear()
+
+    def stats(self) -> Dict:
+        return {
+            'workers': self.num_workers,
+            'threads_per_worker': self.threads_per_worker,
+            'idle': self._idle.qsize(),
+            'failed': sorted(self._failed),
+            'processes': [
+                {
+                    'id': worker.worker_id,
+                    'pid': worker.pid,
+                    'alive': worker.alive,
+                    'cpus': worker.cpus,
+                    'jobs': worker.jobs,
+                    'model_version': worker.version,
+                    'warmup_ms': worker.warmup['total_ms'] if worker.warmup else None,
+                    'restarts': worker.restarts
+                }
+                for worker in self._workers
+            ]
+        }
+
+
+# Singleton instance
+_pool: Optional[WorkerPool] = None
+
+
+def get_worker_pool(sample_shape: Optional[Sequence[int]] = None) -> Optional[WorkerPool]:
+    """
+    Get or create worker pool (None nếu WORKER_PROCESSES = 0)
+
+    sample_shape: shape của một ảnh đã tiền xử lý, bắt buộc khi tạo pool lần đầu
+    """
+    global _pool
+    if _pool is None and settings.WORKER_PROCESSES > 0 and sample_shape is not None:
+        _pool = WorkerPool(
+            num_workers=settings.WORKER_PROCESSES,
+            threads_per_worker=settings.WORKER_THREADS,
+            capacity=max(settings.BATCH_MAX_SIZE, settings.BATCH_PREDICT_SIZE),
+            sample_shape=sample_shape,
+            pin_cpus=settings.WORKER_PIN_CPUS
+        )
+    return _pool
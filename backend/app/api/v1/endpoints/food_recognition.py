@@ -4,62 +4,89 @@ Food Recognition Endpoints
 - Camera capture recognition
 - Recognition history
 """
-from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, status
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Depends, Query, status, WebSocket
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from typing import List, Optional
-import httpx
+from typing import Dict, List, Optional
+import asyncio
+import json
 import os
 import uuid
+import websockets
 from datetime import datetime
 
-from app.core.database import get_db
+from app.core.database import SessionLocal, get_db
 from app.core.config import settings
-from app.core.security import get_current_user
+from app.core.ai_client import get_ai_client
+from app.core.security import get_current_admin, get_current_user, get_user_from_token
 from app.models.user import User, RecognitionHistory
-from app.models.food import Food
+from app.models.food import Food, FoodImage
 from app.models.interaction import Interaction
-from app.schemas.food import RecognitionResponse, RecognitionResult, RecognitionHistoryResponse
+from app.schemas.food import (
+    RecognitionResponse, RecognitionResult, RecognitionHistoryResponse,
+    SimilarFoodResult, SimilarFoodsResponse
+)
 
 router = APIRouter()
 
 # Thư mục lưu ảnh upload
 UPLOAD_DIR = "uploads/recognition"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
+# Ảnh món ăn do admin thêm (bảng food_images)
+FOOD_IMAGE_DIR = "uploads/food_images"
+os.makedirs(FOOD_IMAGE_DIR, exist_ok=True)
 
 
-async def save_upload_file(file: UploadFile) -> str:
+async def save_upload_file(file: UploadFile, directory: str = UPLOAD_DIR) -> str:
     """Lưu file upload và trả về đường dẫn"""
     # Tạo tên file unique
     ext = file.filename.split('.')[-1] if '.' in file.filename else 'jpg'
     filename = f"{uuid.uuid4()}.{ext}"
-    filepath = os.path.join(UPLOAD_DIR, filename)
+    filepath = os.path.join(directory, filename)
     
     # Lưu file
     contents = await file.read()
     with open(filepath, "wb") as f:
         f.write(contents)
     
-    return f"/uploads/recognition/{filename}"
+    return f"/{directory}/{filename}"
 
 
-async def call_ai_server(image_path: str) -> dict:
+async def read_image_upload(file: UploadFile) -> bytes:
+    """Đọc và validate ảnh upload (JPG, PNG, WEBP, tối đa 10MB)"""
+    if not file.content_type or not file.content_type.startswith("image/"):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, 
+            detail="File phải là hình ảnh (JPG, PNG, WEBP)"
+        )
+    
+    contents = await file.read()
+    if len(contents) > 10 * 1024 * 1024:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="File quá lớn. Tối đa 10MB"
+        )
+    
+    # Reset file pointer để có thể lưu file
+    await file.seek(0)
+    return contents
+
+
+async def call_ai_server(image_path: str, contents: Optional[bytes] = None,
+                         priority: str = 'standard') -> dict:
     """
     Gọi AI Server để nhận diện món ăn
+    
+    - contents: bytes ảnh đã có trong memory, nếu không có thì đọc lại từ image_path
+    - priority: lane trên AI Server, 'interactive' cho request người dùng đang chờ kết quả
+    - Transport (http / uds / shm) theo AI_SERVER_TRANSPORT
     """
     try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
+        if contents is None:
             # Đọc file ảnh
             with open(image_path.replace('/uploads/', 'uploads/'), 'rb') as f:
-                files = {'file': (os.path.basename(image_path), f, 'image/jpeg')}
-                response = await client.post(
-                    f"{settings.AI_SERVER_URL}/predict",
-                    files=files
-                )
-            
-            if response.status_code == 200:
-                return response.json()
-            else:
-                return None
+                contents = f.read()
+        return await get_ai_client().predict(contents, os.path.basename(image_path), priority=priority)
     except Exception as e:
         print(f"AI Server error: {e}")
         return None
@@ -77,28 +104,14 @@ async def recognize_from_upload(
     - Max size: 10MB
     """
     # Validate file
-    if not file.content_type or not file.content_type.startswith("image/"):
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST, 
-            detail="File phải là hình ảnh (JPG, PNG, WEBP)"
-        )
-    
-    # Check file size (10MB)
-    contents = await file.read()
-    if len(contents) > 10 * 1024 * 1024:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="File quá lớn. Tối đa 10MB"
-        )
-    
-    # Reset file pointer
-    await file.seek(0)
+    contents = await read_image_upload(file)
     
     # Lưu file
     image_url = await save_upload_file(file)
     
-    # Gọi AI Server
-    ai_result = await call_ai_server(image_url)
+    # Gọi AI Server (dùng bytes đã đọc, không đọc lại file vừa lưu); người dùng
+    # đang chờ kết quả (upload và chụp ảnh camera) nên chạy ở lane interactive
+    ai_result = await call_ai_server(image_url, contents, priority='interactive')
     
     predictions = []
     top_prediction = None
@@ -185,6 +198,251 @@ async def recognize_from_camera(
     return await recognize_from_upload(file, current_user, db)
 
 
+@router.post("/video", response_model=RecognitionResponse)
+async def recognize_from_video(
+    file: UploadFile = File(...),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Nhận diện các món ăn trong video clip ngắn (quay lướt qua bàn ăn)
+    - Hỗ trợ: MP4, MOV, WEBM
+    - Max size: 50MB
+    - Confidence của mỗi món là cao nhất qua các frame của clip
+    """
+    if not file.content_type or not file.content_type.startswith("video/"):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="File phải là video (MP4, MOV, WEBM)"
+        )
+    if file.size is not None and file.size > 50 * 1024 * 1024:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="File quá lớn. Tối đa 50MB"
+        )
+    
+    try:
+        # Upload đã được spool ra đĩa, chuyển tiếp theo chunk
+        ai_result = await get_ai_client().predict_video(file.file, file.filename, file.content_type)
+    except Exception as e:
+        print(f"AI Server error: {e}")
+        ai_result = None
+    
+    if not ai_result:
+        return RecognitionResponse(
+            success=False,
+            predictions=[],
+            message="Không thể nhận diện video (AI Server không sẵn sàng hoặc video không hợp lệ)"
+        )
+    
+    labels = [pred.get('label') for pred in ai_result.get('predictions', [])]
+    foods = {food.ai_label: food for food in db.query(Food).filter(Food.ai_label.in_(labels)).all()}
+    predictions = []
+    for pred in ai_result.get('predictions', []):
+        food = foods.get(pred.get('label'))
+        if food:
+            predictions.append(RecognitionResult(
+                food_id=food.id,
+                food_name=food.name,
+                food_name_en=food.name_en,
+                confidence=pred.get('confidence', 0),
+                region=food.region,
+                description=food.description,
+                image_url=food.image_url
+            ))
+    
+    return RecognitionResponse(
+        success=True,
+        predictions=predictions,
+        top_prediction=predictions[0] if predictions else None,
+        message=f"Nhận diện được {len(predictions)} món trong video" if predictions else "Không thể nhận diện món ăn"
+    )
+
+
+@router.post("/similar", response_model=SimilarFoodsResponse)
+async def find_similar_foods(
+    file: UploadFile = File(...),
+    limit: int = Query(5, ge=1, le=20),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Tìm món ăn có hình ảnh tương tự ảnh upload
+    - So khớp embedding ảnh với index ảnh món ăn (food_images + ảnh chính) trên AI Server
+    - Mỗi món trả về ảnh giống nhất, sắp xếp theo độ tương tự
+    """
+    contents = await read_image_upload(file)
+    
+    try:
+        ai_result = await get_ai_client().similar(contents, limit, file.filename, file.content_type)
+    except Exception as e:
+        print(f"AI Server error: {e}")
+        ai_result = None
+    
+    if not ai_result:
+        return SimilarFoodsResponse(
+            success=False,
+            results=[],
+            message="Không tìm được món tương tự (AI Server hoặc index chưa sẵn sàng)"
+        )
+    
+    matches = ai_result.get('results', [])
+    foods = {
+        food.id: food for food in db.query(Food).filter(
+            Food.id.in_([m['food_id'] for m in matches]),
+            Food.is_active == True
+        ).all()
+    }
+    image_ids = [m['image_id'] for m in matches if m['image_id']]
+    images = {
+        image.id: image.image_url
+        for image in db.query(FoodImage).filter(FoodImage.id.in_(image_ids)).all()
+    } if image_ids else {}
+    
+    results = []
+    for match in matches:
+        food = foods.get(match['food_id'])
+        if food:
+            results.append(SimilarFoodResult(
+                food_id=food.id,
+                food_name=food.name,
+                food_name_en=food.name_en,
+                region=food.region,
+                image_url=images.get(match['image_id']) or food.image_url,
+                similarity=match['score']
+            ))
+    return SimilarFoodsResponse(
+        success=True,
+        results=results,
+        message=f"Tìm thấy {len(results)} món tương tự" if results else "Không có món tương tự"
+    )
+
+
+@router.post("/images", status_code=status.HTTP_201_CREATED)
+async def add_food_image(
+    food_id: int = Form(...),
+    file: UploadFile = File(...),
+    is_training: bool = Form(True),
+    current_admin: User = Depends(get_current_admin),
+    db: Session = Depends(get_db)
+):
+    """
+    [Admin] Thêm ảnh cho món ăn
+    - Lưu vào bảng food_images và thêm ngay vào index tìm món tương tự của AI Server
+    """
+    food = db.query(Food).filter(Food.id == food_id).first()
+    if not food:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Không tìm thấy món ăn"
+        )
+    
+    contents = await read_image_upload(file)
+    image_url = await save_upload_file(file, FOOD_IMAGE_DIR)
+    image = FoodImage(food_id=food.id, image_url=image_url, is_training=is_training, source="upload")
+    db.add(image)
+    db.commit()
+    db.refresh(image)
+    
+    try:
+        indexed = await get_ai_client().index_add(contents, food.id, image.id, file.filename, file.content_type)
+    except Exception as e:
+        print(f"AI Server error: {e}")
+        indexed = False
+    
+    return {"id": image.id, "food_id": food.id, "image_url": image_url, "indexed": indexed}
+
+
+def _load_camera_session(token: Optional[str]) -> Dict[str, dict]:
+    """
+    Xác thực token và load bảng label -> món ăn một lần cho mỗi kết nối camera
+    (query đồng bộ, gọi qua run_in_threadpool để không chặn event loop)
+    
+    Raises:
+        HTTPException: token không hợp lệ
+    """
+    db = SessionLocal()
+    try:
+        get_user_from_token(token, db)
+        return {
+            food.ai_label: {
+                'food_id': food.id,
+                'food_name': food.name,
+                'food_name_en': food.name_en,
+                'region': food.region,
+                'description': food.description,
+                'image_url': food.image_url
+            }
+            for food in db.query(Food).filter(Food.ai_label.isnot(None)).all()
+        }
+    finally:
+        db.close()
+
+
+def _stream_results(predictions: List[dict], foods: Dict[str, dict]) -> List[dict]:
+    """Map label của AI sang món ăn (không query database cho từng kết quả)"""
+    results = []
+    for pred in predictions:
+        food = foods.get(pred.get('label'))
+        if food:
+            results.append(RecognitionResult(confidence=pred.get('confidence', 0), **food).model_dump())
+    return results
+
+
+@router.websocket("/camera/ws")
+async def recognize_camera_stream(websocket: WebSocket, token: Optional[str] = Query(None)):
+    """
+    Nhận diện live từ camera qua WebSocket
+    - Cần đăng nhập: JWT gửi qua query ?token= (browser không đặt được header
+      Authorization cho WebSocket), token sai thì đóng kết nối với mã 1008
+    - Browser gửi frame JPEG dạng binary, backend relay sang AI Server (/ws/camera)
+      mà không lưu file hay mở HTTP request cho từng frame
+    - Mỗi khi AI có kết quả mới, đẩy về {"type": "prediction", "predictions", "top_prediction", ...}
+    - Không lưu lịch sử; chụp ảnh (POST /camera) để lưu kết quả
+    """
+    try:
+        foods = await run_in_threadpool(_load_camera_session, token)
+    except HTTPException:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    
+    await websocket.accept()
+    ai_url = settings.AI_SERVER_URL.replace('http', 'ws', 1) + '/ws/camera'
+    
+    async def forward_frames(upstream):
+        while True:
+            message = await websocket.receive()
+            if message['type'] == 'websocket.disconnect':
+                return
+            if message.get('bytes') is not None:
+                await upstream.send(message['bytes'])
+    
+    async def forward_results(upstream):
+        async for raw in upstream:
+            data = json.loads(raw)
+            if data.get('type') == 'prediction':
+                predictions = _stream_results(data.get('predictions', []), foods)
+                data['predictions'] = predictions
+                data['top_prediction'] = predictions[0] if predictions else None
+            await websocket.send_json(data)
+    
+    try:
+        async with websockets.connect(ai_url, max_size=None) as upstream:
+            tasks = [
+                asyncio.create_task(forward_frames(upstream)),
+                asyncio.create_task(forward_results(upstream))
+            ]
+            done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in pending:
+                task.cancel()
+            for task in done:
+                task.exception()  # Đã xử lý: một phía ngắt kết nối
+    except (OSError, websockets.WebSocketException) as e:
+        print(f"AI Server error: {e}")
+        await websocket.send_json({'type': 'error', 'error': 'AI Server không khả dụng'})
+        await websocket.close()
+
+
 @router.get("/history", response_model=List[RecognitionHistoryResponse])
 async def get_recognition_history(
     limit: int = 20,
@@ -0,0 +1,314 @@
+"""
+Client gọi AI Server
+- http: multipart qua TCP (mặc định)
+- uds: multipart qua Unix domain socket (AI Server chạy cùng host)
+- shm: ghi bytes ảnh vào shared memory, chỉ gửi tên segment (qua Unix socket nếu có)
+
+Wire format:
+- json: request multipart, response JSON (mặc định)
+- binary: request / response dạng frame nhị phân (ai_server/wire.py), tuỳ chọn
+  gửi tensor uint8 đã resize thay cho ảnh encode
+
+Dùng chung một httpx.AsyncClient (keep-alive) thay vì mở kết nối mới mỗi request.
+"""
+import io
+import socket
+import struct
+import uuid
+from multiprocessing import shared_memory
+from typing import BinaryIO, Dict, List, Optional, Union
+
+import httpx
+import numpy as np
+from PIL import Image
+
+from app.core.config import settings
+
+
+TRANSPORTS = ('http', 'uds', 'shm')
+WIRE_FORMATS = ('json', 'binary')
+
+FRAME_CONTENT_TYPE = 'application/x-food-frame'
+
+
+def encode_frame(images: List[Union[bytes, np.ndarray]]) -> bytes:
+    """
+    Frame request: bytes ảnh encode (kind 0) hoặc tensor uint8 HxWx3 (kind 1)
+    Layout giống ai_server/wire.py
+    """
+    parts = [b'FRQ1', struct.pack('<H', len(images))]
+    for image in images:
+        if isinstance(image, np.ndarray):
+            tensor = np.ascontiguousarray(image, dtype=np.uint8)
+            height, width, channels = tensor.shape
+            parts += [struct.pack('<BHHBI', 1, height, width, channels, tensor.nbytes), memoryview(tensor)]
+        else:
+            parts += [struct.pack('<BI', 0, len(image)), image]
+    return b''.join(parts)
+
+
+def decode_frame(content: bytes) -> Dict:
+    """
+    Frame response -> {"model_version", "results": [kết quả như JSON PredictionResponse]}
+    """
+    view = memoryview(content)
+    if view[:4] != b'FRS1':
+        raise ValueError("Sai magic của frame response")
+    offset = 4
+
+    def read_str() -> str:
+        nonlocal offset
+        (length,) = struct.unpack_from('<H', view, offset)
+        offset += 2 + length
+        return bytes(view[offset - length:offset]).decode('utf-8')
+
+    model_version = read_str() or None
+    (num_labels,) = struct.unpack_from('<H', view, offset)
+    offset += 2
+    labels = [read_str() for _ in range(num_labels)]
+
+    (count,) = struct.unpack_from('<H', view, offset)
+    offset += 2
+    results = []
+    for _ in range(count):
+        flags, k = struct.unpack_from('<BB', view, offset)
+        offset += 2
+        predictions = []
+        for rank in range(1, k + 1):
+            ref, confidence = struct.unpack_from('<Hf', view, offset)
+            offset += 6
+            predictions.append({'label': labels[ref], 'confidence': round(confidence, 4), 'rank': rank})
+        result = {
+            'success': bool(flags & 1),
+            'predictions': predictions,
+            'model_version': model_version,
+            'tta': bool(flags & 4) if flags & 2 else None,
+            'stage': ('full' if flags & 16 else 'fast') if flags & 8 else None
+        }
+        if not result['success']:
+            result['error'] = read_str()
+        results.append(result)
+    return {'model_version': model_version, 'results': results}
+
+
+def image_to_tensor(image_bytes: bytes, size: int) -> np.ndarray:
+    """
+    Decode + resize ảnh về tensor uint8 (size, size, 3) để gửi kèm frame
+
+    Cùng đường decode + resize với AI Server (model.decode_image với FAST_DECODE
+    mặc định và Preprocessor.pixels): draft chỉ với JPEG, convert RGB, resize
+    BICUBIC, nên model nhận đúng pixel như khi gửi ảnh đã encode
+    """
+    image = Image.open(io.BytesIO(image_bytes))
+    if image.format == 'JPEG':
+        # Decode thẳng ở độ phân giải nhỏ hơn (DCT scaling)
+        image.draft('RGB', (size, size))
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    if image.size != (size, size):
+        image = image.resize((size, size), Image.BICUBIC)
+    return np.asarray(image)
+
+
+class AIClient:
+    """Client AI Server với transport cấu hình được"""
+
+    def __init__(self, base_url: str, transport: str = 'http', uds_path: str = '',
+                 timeout: float = 30.0, shm_prefix: str = 'food_ai_', wire: str = 'json',
+                 tensor_size: int = 0, admin_token: str = '', deadline_ms: float = 0):
+        if transport not in TRANSPORTS:
+            raise ValueError(f"AI_SERVER_TRANSPORT không hợp lệ: {transport} (chọn một trong {', '.join(TRANSPORTS)})")
+        if wire not in WIRE_FORMATS:
+            raise ValueError(f"AI_SERVER_WIRE không hợp lệ: {wire} (chọn một trong {', '.join(WIRE_FORMATS)})")
+        self.transport = transport
+        self.wire = wire
+        # > 0: resize ảnh ở backend, gửi tensor uint8 (chỉ với wire binary)
+        self.tensor_size = tensor_size
+        self.admin_token = admin_token
+        # Gửi trong X-Deadline-Ms: AI Server bỏ request chưa tới model sau khoảng này (0 = không gửi)
+        self.deadline_ms = deadline_ms
+        self.uds_path = uds_path
+        self.shm_prefix = shm_prefix
+        # Qua Unix socket thì host trong URL chỉ để tạo request, không dùng để kết nối
+        self.base_url = 'http://ai-server' if uds_path and transport != 'http' else base_url
+        self.timeout = timeout
+        self._client: Optional[httpx.AsyncClient] = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            if self.uds_path and self.transport != 'http':
+                transport = httpx.AsyncHTTPTransport(uds=self.uds_path)
+            else:
+                # Tắt Nagle: header và body multipart được gửi bằng nhiều lần write,
+                # tránh request keep-alive phải chờ delayed ACK
+                transport = httpx.AsyncHTTPTransport(
+                    socket_options=[(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)]
+                )
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url, timeout=self.timeout, transport=transport
+            )
+        return self._client
+
+    async def predict(self, image_bytes: bytes, filename: str = 'image.jpg',
+                      content_type: str = 'image/jpeg', model: Optional[str] = None,
+                      priority: str = 'standard') -> Optional[dict]:
+        """
+        Gửi ảnh tới AI Server
+
+        Args:
+            model: Tên / version model trong registry của AI Server, None = model chính
+            priority: Lane trên AI Server (interactive / standard / batch)
+
+        Returns:
+            JSON PredictionResponse, None nếu AI Server trả lỗi (kể cả 504 quá deadline)
+        """
+        params = {'model': model} if model else None
+        headers = self._scheduling_headers(priority)
+        if self.transport == 'shm':
+            response = await self._predict_shm(image_bytes, model, headers)
+        elif self.wire == 'binary':
+            response = await self._post_frame('/predict', [image_bytes], params, headers)
+        else:
+            files = {'file': (filename, image_bytes, content_type)}
+            response = await self.client.post('/predict', files=files, params=params, headers=headers)
+
+        if response.status_code != 200:
+            return None
+        if self._is_frame(response):
+            result = decode_frame(response.content)['results'][0]
+            result['message'] = f"Đã nhận diện {len(result['predictions'])} món ăn"
+            return result
+        return response.json()
+
+    async def predict_batch(self, images: List[bytes], model: Optional[str] = None,
+                            priority: str = 'batch') -> Optional[Dict]:
+        """
+        Gửi nhiều ảnh trong một request /predict/batch (mặc định lane batch,
+        không làm chậm request nhận diện của người dùng)
+
+        Returns:
+            {"model_version", "results": [...]} theo thứ tự input, None nếu AI Server trả lỗi
+        """
+        params = {'model': model} if model else None
+        # Job offline không đặt deadline
+        headers = self._scheduling_headers(priority, deadline=False)
+        if self.wire == 'binary':
+            response = await self._post_frame('/predict/batch', images, params, headers)
+        else:
+            files = [('files', (f'image_{idx}.jpg', image, 'image/jpeg')) for idx, image in enumerate(images)]
+            response = await self.client.post('/predict/batch', files=files, params=params, headers=headers)
+
+        if response.status_code != 200:
+            return None
+        if self._is_frame(response):
+            return decode_frame(response.content)
+        return response.json()
+
+    async def predict_video(self, video: BinaryIO, filename: str = 'clip.mp4',
+                            content_type: str = 'video/mp4', model: Optional[str] = None) -> Optional[Dict]:
+        """
+        Gửi video clip tới /predict/video, file được stream theo chunk (không đọc hết vào RAM)
+
+        Returns:
+            {"predictions": [...], "frames": [...], "stats", ...}, None nếu AI Server trả lỗi
+        """
+        response = await self.client.post(
+            '/predict/video', files={'file': (filename, video, content_type)},
+            params={'model': model} if model else None,
+            headers=self._scheduling_headers('standard', deadline=False)
+        )
+        if response.status_code == 200:
+            return response.json()
+        return None
+
+    async def similar(self, image_bytes: bytes, k: int = 5, filename: str = 'image.jpg',
+                      content_type: str = 'image/jpeg') -> Optional[Dict]:
+        """
+        Tìm món ăn có ảnh tương tự trong ANN index của AI Server
+
+        Returns:
+            {"results": [{"food_id", "image_id", "score"}], ...}, None nếu lỗi / chưa có index
+        """
+        files = {'file': (filename, image_bytes, content_type)}
+        response = await self.client.post('/similar', params={'k': k}, files=files)
+        if response.status_code == 200:
+            return response.json()
+        return None
+
+    async def index_add(self, image_bytes: bytes, food_id: int, image_id: int = 0,
+                        filename: str = 'image.jpg', content_type: str = 'image/jpeg') -> bool:
+        """Thêm ảnh của món ăn vào ANN index (image_id = 0: ảnh chính Food.image_url)"""
+        response = await self.client.post(
+            '/index/items',
+            files={'file': (filename, image_bytes, content_type)},
+            data={'food_id': food_id, 'image_id': image_id},
+            headers={'X-Admin-Token': self.admin_token} if self.admin_token else None
+        )
+        return response.status_code == 200
+
+    def _scheduling_headers(self, priority: str, deadline: bool = True) -> Dict[str, str]:
+        """Header X-Priority / X-Deadline-Ms cho hàng đợi inference của AI Server"""
+        headers = {'X-Priority': priority}
+        if deadline and self.deadline_ms > 0:
+            headers['X-Deadline-Ms'] = f"{self.deadline_ms:g}"
+        return headers
+
+    async def _post_frame(self, path: str, images: List[bytes], params: Optional[Dict] = None,
+                          headers: Optional[Dict[str, str]] = None) -> httpx.Response:
+        """POST frame nhị phân, nhận response dạng frame"""
+        if self.tensor_size > 0:
+            images = [image_to_tensor(image, self.tensor_size) for image in images]
+        return await self.client.post(
+            path, content=encode_frame(images), params=params,
+            headers={**(headers or {}), 'Content-Type': FRAME_CONTENT_TYPE, 'Accept': FRAME_CONTENT_TYPE}
+        )
+
+    @staticmethod
+    def _is_frame(response: httpx.Response) -> bool:
+        return response.headers.get('content-type', '').startswith(FRAME_CONTENT_TYPE)
+
+    async def _predict_shm(self, image_bytes: bytes, model: Optional[str] = None,
+                           headers: Optional[Dict[str, str]] = None) -> httpx.Response:
+        """Ghi ảnh vào shared memory, gửi tên segment và giải phóng khi có kết quả"""
+        segment = shared_memory.SharedMemory(
+            name=f"{self.shm_prefix}{uuid.uuid4().hex}", create=True, size=len(image_bytes)
+        )
+        try:
+            segment.buf[:len(image_bytes)] = image_bytes
+            headers = dict(headers or {})
+            if self.wire == 'binary':
+                headers['Accept'] = FRAME_CONTENT_TYPE
+            return await self.client.post(
+                '/predict/shm', json={'name': segment.name, 'size': len(image_bytes), 'model': model},
+                headers=headers
+            )
+        finally:
+            segment.close()
+            segment.unlink()
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+# Singleton instance
+_client: Optional[AIClient] = None
+
+
+def get_ai_client() -> AIClient:
+    """Get or create AI client instance"""
+    global _client
+    if _client is None:
+        _client = AIClient(
+            base_url=settings.AI_SERVER_URL,
+            transport=settings.AI_SERVER_TRANSPORT,
+            uds_path=settings.AI_SERVER_UDS,
+            timeout=settings.AI_SERVER_TIMEOUT,
+            wire=settings.AI_SERVER_WIRE,
+            tensor_size=settings.AI_SERVER_TENSOR_SIZE,
+            admin_token=settings.AI_SERVER_ADMIN_TOKEN,
+            deadline_ms=settings.AI_SERVER_DEADLINE_MS
+        )
+    return _client
@@ -17,6 +17,18 @@ class Settings(BaseSettings):
     
     # AI Server
     AI_SERVER_URL: str = "http://localhost:8001"
+    # http: multipart qua TCP; uds: qua Unix socket; shm: shared memory + Unix socket
+    # (uds / shm chỉ dùng khi AI Server chạy cùng host)
+    AI_SERVER_TRANSPORT: str = "http"
+    AI_SERVER_UDS: str = ""  # vd /tmp/food_ai.sock, trùng với UDS_PATH của AI Server
+    AI_SERVER_TIMEOUT: float = 30.0
+    # Gửi X-Deadline-Ms: AI Server trả 504 thay vì xử lý ảnh đã chờ quá lâu, 0 = không gửi
+    AI_SERVER_DEADLINE_MS: float = 0
+    # json: multipart + JSON; binary: frame nhị phân (ít CPU parse / serialize hơn)
+    AI_SERVER_WIRE: str = "json"
+    # > 0 (vd 224, bằng IMAGE_SIZE của AI Server): resize ở backend, gửi tensor uint8
+    AI_SERVER_TENSOR_SIZE: int = 0
+    AI_SERVER_ADMIN_TOKEN: str = ""  # ADMIN_TOKEN của AI Server (thêm ảnh vào index tìm món tương tự)
     
     # AI Model settings
     MODEL_PATH: str = "../ai_models/trained_weights"
@@ -48,6 +48,16 @@ def get_current_user(
     db: Session = Depends(get_db)
 ):
     """Get current user from JWT token"""
+    return get_user_from_token(token, db)
+
+
+def get_user_from_token(token: Optional[str], db: Session):
+    """
+    User của JWT token (dùng cả cho WebSocket, nơi token nằm trong query string)
+
+    Raises:
+        HTTPException: 401 token không hợp lệ, 403 tài khoản bị vô hiệu hóa
+    """
     from app.models.user import User  # Import here to avoid circular import
     
     credentials_exception = HTTPException(
@@ -56,6 +66,9 @@ def get_current_user(
         headers={"WWW-Authenticate": "Bearer"},
     )
     
+    if not token:
+        raise credentials_exception
+    
     try:
         payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
         user_id: str = payload.get("sub")
@@ -9,6 +9,7 @@ import os
 
 from app.api.v1.router import api_router
 from app.core.config import settings
+from app.core.ai_client import get_ai_client
 from app.core.database import Base, engine
 
 # Tạo tất cả tables trong database
@@ -47,6 +48,12 @@ app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
 app.include_router(api_router, prefix="/api/v1")
 
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Đóng kết nối keep-alive tới AI Server"""
+    await get_ai_client().close()
+
+
 @app.get("/")
 async def root():
     """Root endpoint"""
@@ -187,6 +187,23 @@ class RecognitionResponse(BaseModel):
     message: Optional[str] = None
 
 
+class SimilarFoodResult(BaseModel):
+    """Schema món ăn có ảnh tương tự"""
+    food_id: int
+    food_name: str
+    food_name_en: Optional[str] = None
+    region: Optional[str] = None
+    image_url: Optional[str] = None  # Ảnh giống nhất của món
+    similarity: float  # cosine similarity giữa embedding 2 ảnh
+
+
+class SimilarFoodsResponse(BaseModel):
+    """Schema response tìm món ăn tương tự"""
+    success: bool
+    results: List[SimilarFoodResult]
+    message: Optional[str] = None
+
+
 class RecognitionHistoryResponse(BaseModel):
     """Schema response lịch sử nhận diện"""
     id: int
@@ -1,29 +1,64 @@
-import { useState, useRef, useCallback } from 'react';
+import { useState, useRef, useCallback, useEffect } from 'react';
 import Webcam from 'react-webcam';
-import { Camera, Upload, X, Loader, CheckCircle, AlertCircle, RefreshCw, Image as ImageIcon } from 'lucide-react';
+import { Camera, Upload, Video, X, Loader, CheckCircle, AlertCircle, RefreshCw, Image as ImageIcon } from 'lucide-react';
 import { recognitionAPI } from '../services/api';
 import { useAuth } from '../context/AuthContext';
 import FoodCard from '../components/FoodCard';
 import { Link } from 'react-router-dom';
 
 const RecognitionPage = () => {
-  const [mode, setMode] = useState('upload'); // 'upload' | 'camera'
+  const [mode, setMode] = useState('upload'); // 'upload' | 'camera' | 'video'
   const [image, setImage] = useState(null);
   const [preview, setPreview] = useState(null);
   const [loading, setLoading] = useState(false);
   const [result, setResult] = useState(null);
   const [error, setError] = useState(null);
   const [cameraReady, setCameraReady] = useState(false);
+  const [liveResult, setLiveResult] = useState(null);
+  const [similar, setSimilar] = useState([]);
   
   const webcamRef = useRef(null);
   const fileInputRef = useRef(null);
   const { isAuthenticated } = useAuth();
 
+  // Live camera: gửi frame qua WebSocket, bỏ frame khi frame trước chưa gửi xong
+  useEffect(() => {
+    if (mode !== 'camera' || !cameraReady || preview) return undefined;
+
+    const socket = recognitionAPI.openCameraStream();
+    socket.onmessage = (event) => {
+      const data = JSON.parse(event.data);
+      if (data.type === 'prediction') {
+        setLiveResult(data.top_prediction);
+      }
+    };
+
+    const timer = setInterval(() => {
+      if (socket.readyState !== WebSocket.OPEN || socket.bufferedAmount > 0) return;
+      const imageSrc = webcamRef.current?.getScreenshot();
+      if (imageSrc) {
+        fetch(imageSrc)
+          .then(res => res.blob())
+          .then(blob => socket.readyState === WebSocket.OPEN && socket.send(blob));
+      }
+    }, 250);
+
+    return () => {
+      clearInterval(timer);
+      socket.close();
+      setLiveResult(null);
+    };
+  }, [mode, cameraReady, preview]);
+
   // Handle file upload
   const handleFileSelect = (e) => {
     const file = e.target.files[0];
     if (file) {
-      if (file.size > 10 * 1024 * 1024) { // 10MB limit
+      if (mode === 'video' && file.size > 50 * 1024 * 1024) { // 50MB limit
+        setError('Video quá lớn. Vui lòng chọn video nhỏ hơn 50MB.');
+        return;
+      }
+      if (mode !== 'video' && file.size > 10 * 1024 * 1024) { // 10MB limit
         setError('File quá lớn. Vui lòng chọn file nhỏ hơn 10MB.');
         return;
       }
@@ -63,11 +98,23 @@ const RecognitionPage = () => {
     setError(null);
 
     try {
-      const response = mode === 'camera'
-        ? await recognitionAPI.cameraCapture(image)
-        : await recognitionAPI.uploadImage(image);
+      let response;
+      if (mode === 'video') {
+        response = await recognitionAPI.recognizeVideo(image);
+      } else if (mode === 'camera') {
+        response = await recognitionAPI.cameraCapture(image);
+      } else {
+        response = await recognitionAPI.uploadImage(image);
+      }
       
       setResult(response.data);
+
+      // Món có hình ảnh tương tự (không bắt buộc, index có thể chưa được build)
+      if (mode !== 'video') {
+        recognitionAPI.findSimilar(image)
+          .then(res => setSimilar(res.data.results || []))
+          .catch(() => setSimilar([]));
+      }
     } catch (err) {
       setError(err.response?.data?.detail || 'Có lỗi xảy ra. Vui lòng thử lại.');
     } finally {
@@ -80,6 +127,7 @@ const RecognitionPage = () => {
     setImage(null);
     setPreview(null);
     setResult(null);
+    setSimilar([]);
     setError(null);
     if (fileInputRef.current) {
       fileInputRef.current.value = '';
@@ -120,25 +168,41 @@ const RecognitionPage = () => {
               <Camera size={18} />
               Chụp ảnh
             </button>
+            <button
+              onClick={() => { setMode('video'); handleReset(); }}
+              className={`flex-1 flex items-center justify-center gap-2 py-3 rounded-lg font-medium transition-all
+                ${mode === 'video' ? 'bg-white shadow text-primary-600' : 'text-gray-600'}`}
+            >
+              <Video size={18} />
+              Video
+            </button>
           </div>
 
           {/* Upload Mode */}
-          {mode === 'upload' && !preview && (
+          {(mode === 'upload' || mode === 'video') && !preview && (
             <div 
               onClick={() => fileInputRef.current?.click()}
               className="border-2 border-dashed border-gray-300 rounded-2xl p-12 text-center cursor-pointer hover:border-primary-500 hover:bg-primary-50 transition-all"
             >
-              <ImageIcon className="w-16 h-16 text-gray-400 mx-auto mb-4" />
+              {mode === 'video' ? (
+                <Video className="w-16 h-16 text-gray-400 mx-auto mb-4" />
+              ) : (
+                <ImageIcon className="w-16 h-16 text-gray-400 mx-auto mb-4" />
+              )}
               <p className="text-gray-600 mb-2">
-                Kéo thả ảnh vào đây hoặc click để chọn
+                {mode === 'video'
+                  ? 'Chọn video ngắn quay lướt qua bàn ăn'
+                  : 'Kéo thả ảnh vào đây hoặc click để chọn'}
               </p>
               <p className="text-sm text-gray-400">
-                Hỗ trợ: JPG, PNG, WEBP (tối đa 10MB)
+                {mode === 'video'
+                  ? 'Hỗ trợ: MP4, MOV, WEBM (tối đa 50MB)'
+                  : 'Hỗ trợ: JPG, PNG, WEBP (tối đa 10MB)'}
               </p>
               <input
                 ref={fileInputRef}
                 type="file"
-                accept="image/*"
+                accept={mode === 'video' ? 'video/*' : 'image/*'}
                 onChange={handleFileSelect}
                 className="hidden"
               />
@@ -161,6 +225,11 @@ const RecognitionPage = () => {
                 onUserMediaError={() => setError('Không thể truy cập camera. Vui lòng cấp quyền.')}
                 className="w-full rounded-2xl"
               />
+              {liveResult && (
+                <div className="absolute top-3 left-3 px-3 py-1.5 bg-black/60 text-white rounded-full text-sm">
+                  {liveResult.food_name} · {(liveResult.confidence * 100).toFixed(0)}%
+                </div>
+              )}
               {cameraReady && (
                 <button
                   onClick={capture}
@@ -175,11 +244,15 @@ const RecognitionPage = () => {
           {/* Preview */}
           {preview && (
             <div className="relative">
-              <img 
-                src={preview} 
-                alt="Preview" 
-                className="w-full rounded-2xl"
-              />
+              {mode === 'video' ? (
+                <video src={preview} controls className="w-full rounded-2xl" />
+              ) : (
+                <img 
+                  src={preview} 
+                  alt="Preview" 
+                  className="w-full rounded-2xl"
+                />
+              )}
               <button
                 onClick={handleReset}
                 className="absolute top-3 right-3 w-10 h-10 bg-white rounded-full shadow-lg flex items-center justify-center hover:bg-gray-100 transition-all"
@@ -299,6 +372,30 @@ const RecognitionPage = () => {
                 </div>
               )}
 
+              {/* Similar foods */}
+              {similar.length > 0 && (
+                <div>
+                  <h3 className="font-medium text-gray-700 mb-3">Món có hình ảnh tương tự:</h3>
+                  <div className="grid grid-cols-2 gap-3">
+                    {similar.map((item) => (
+                      <Link
+                        key={item.food_id}
+                        to={`/food/${item.food_id}`}
+                        className="flex items-center gap-3 p-2 bg-gray-50 rounded-xl hover:bg-gray-100 transition-all"
+                      >
+                        {item.image_url && (
+                          <img src={item.image_url} alt={item.food_name} className="w-12 h-12 rounded-lg object-cover" />
+                        )}
+                        <div className="min-w-0">
+                          <p className="text-gray-700 truncate">{item.food_name}</p>
+                          <p className="text-xs text-gray-500">{(item.similarity * 100).toFixed(0)}% giống</p>
+                        </div>
+                      </Link>
+                    ))}
+                  </div>
+                </div>
+              )}
+
               {/* Actions */}
               <div className="flex gap-4">
                 <button
@@ -78,6 +78,28 @@ export const recognitionAPI = {
       headers: { 'Content-Type': 'multipart/form-data' },
     });
   },
+  // Live camera: gửi frame JPEG qua WebSocket, nhận kết quả nhận diện liên tục
+  // (WebSocket không gửi được header Authorization nên token đi qua query string)
+  openCameraStream: () => {
+    const token = encodeURIComponent(localStorage.getItem('token') || '');
+    return new WebSocket(`${API_BASE_URL.replace(/^http/, 'ws')}/recognition/camera/ws?token=${token}`);
+  },
+  // Món ăn có hình ảnh tương tự ảnh upload
+  findSimilar: (file, limit = 5) => {
+    const formData = new FormData();
+    formData.append('file', file);
+    return api.post('/recognition/similar', formData, {
+      params: { limit },
+      headers: { 'Content-Type': 'multipart/form-data' },
+    });
+  },
+  recognizeVideo: (file) => {
+    const formData = new FormData();
+    formData.append('file', file);
+    return api.post('/recognition/video', formData, {
+      headers: { 'Content-Type': 'multipart/form-data' },
+    });
+  },
   getHistory: (limit = 20) => api.get('/recognition/history', { params: { limit } }),
   getStats: () => api.get('/recognition/admin/stats'),
 };